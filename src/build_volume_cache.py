@@ -0,0 +1,25 @@
+import sys
+from tqdm import tqdm
+
+from src.config import BratsConfiguration
+from src.dataset.utils import dataset, volume_cache
+from src.logging_conf import logger
+
+
+if __name__ == "__main__":
+
+    config = BratsConfiguration(sys.argv[1])
+    dataset_config = config.get_dataset_config()
+
+    cache_dir = dataset_config.get("volume_cache_path")
+    compact = dataset_config.getboolean("volume_cache_compact", fallback=False)
+    chunked = dataset_config.getboolean("volume_cache_chunked", fallback=False)
+    data, _ = dataset.read_brats(dataset_config.get("train_csv"))
+    logger.info(f"Building volume cache for {len(data)} patients in {cache_dir}")
+
+    for patient in tqdm(data, desc="Caching volumes"):
+        if volume_cache.is_cached(patient, cache_dir, compact=compact, chunked=chunked):
+            continue
+        volume_cache.save_patient(patient, cache_dir, compact=compact, chunked=chunked)
+
+    print("Volume cache built!")
@@ -0,0 +1,52 @@
+import csv
+import os
+import sys
+from tqdm import tqdm
+
+from src.config import BratsConfiguration
+from src.dataset.utils import dataset
+from src.dataset.utils.bounding_box import compute_bounding_box, bounding_box_to_str
+from src.logging_conf import logger
+
+
+BBOX_COLUMN = 7
+
+
+def add_bounding_boxes(csv_path: str):
+    """Compute the brain bounding box of every patient from its FLAIR and store it in the BBox column of the csv"""
+    data, data_test = dataset.read_brats(csv_path)
+    bounding_boxes = {patient.patch_name: bounding_box_to_str(compute_bounding_box(patient.get_brain_mask()))
+                      for patient in tqdm(data + data_test, desc="Computing bounding boxes")}
+
+    with open(csv_path, 'r') as csvfile:
+        rows = list(csv.reader(csvfile, skipinitialspace=True))
+
+    header, rows = rows[0], rows[1:]
+    header = header[:BBOX_COLUMN] + ["BBox"]
+    for row in rows:
+        row.extend([""] * (BBOX_COLUMN - len(row)))
+        row[BBOX_COLUMN:] = [bounding_boxes.get(row[4], "")]
+
+    tmp_path = f"{csv_path}.tmp"
+    with open(tmp_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(tmp_path, csv_path)
+
+
+if __name__ == "__main__":
+
+    config = BratsConfiguration(sys.argv[1])
+    dataset_config = config.get_dataset_config()
+
+    # the inference csvs too: crop_to_brain also crops the volumes at inference
+    csv_paths = {dataset_config.get(key) for key in ("train_csv", "test_csv", "val_csv") if dataset_config.get(key)}
+    for csv_path in sorted(csv_paths):
+        if not os.path.exists(csv_path):
+            logger.warning(f"{csv_path} not found, no bounding boxes added")
+            continue
+        logger.info(f"Adding brain bounding boxes to {csv_path}")
+        add_bounding_boxes(csv_path)
+
+    print("Bounding boxes computed!")
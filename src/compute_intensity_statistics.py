@@ -0,0 +1,30 @@
+import sys
+from tqdm import tqdm
+
+from src.config import BratsConfiguration
+from src.dataset.utils import dataset
+from src.dataset.utils.intensity_statistics import compute_statistics, save_statistics, statistics_path
+from src.logging_conf import logger
+
+
+def add_intensity_statistics(csv_path: str):
+    """Compute the brain statistics of the raw modalities of every patient and store them next to the csv"""
+    data, _ = dataset.read_brats(csv_path)
+    stats = {}
+    for patient in tqdm(data, desc="Computing intensity statistics"):
+        modalities, _, _ = patient.load_all(normalize=False, with_segmentation=False)
+        stats[patient.patch_name] = compute_statistics(modalities)
+
+    save_statistics(statistics_path(csv_path), stats)
+
+
+if __name__ == "__main__":
+
+    config = BratsConfiguration(sys.argv[1])
+    dataset_config = config.get_dataset_config()
+
+    csv_path = dataset_config.get("train_csv")
+    logger.info(f"Adding intensity statistics to {statistics_path(csv_path)}")
+    add_intensity_statistics(csv_path)
+
+    print("Intensity statistics computed!")
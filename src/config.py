@@ -90,6 +90,10 @@ class BratsConfiguration:
         self.config["dataset"]["test_csv"] = os.path.join(self.config["dataset"]["path_test"],
                                                           self.config.get("dataset", "test_csv"))
 
+        self.config["dataset"]["volume_cache_path"] = os.path.join(self.config["dataset"]["path_train"],
+                                                                   self.config.get("dataset", "volume_cache_folder",
+                                                                                   fallback="volume_cache"))
+
         if "batch_size" not in self.config["dataset"]:
             self.config["dataset"]["batch_size"] = str(
                 self.config.getint("dataset", "n_patients_per_batch") * self.config.getint("dataset", "n_patches"))
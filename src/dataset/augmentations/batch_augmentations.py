@@ -0,0 +1,127 @@
+"""
+Augmentations of a whole collated batch, on the device where the batch is. Each sample gets its own random
+parameters, but all of them are applied with a few vectorized torch operations instead of one numpy call per sample
+in the loader workers.
+
+Every transform takes and returns (inputs [N, C, W, H, D], targets [N, W, H, D]). Brain voxels are the non-zero
+voxels of the normalized inputs. The intensity shift (added to every voxel) and gamma correction change the background,
+so the transforms that look for the brain (gaussian noise) must run before them.
+"""
+from typing import Tuple
+
+import torch
+
+
+def _uniform(low: float, high: float, shape: tuple, reference: torch.Tensor) -> torch.Tensor:
+    return torch.rand(shape, device=reference.device, dtype=reference.dtype) * (high - low) + low
+
+
+def _apply_with_probability(p: float, batch_size: int, reference: torch.Tensor) -> torch.Tensor:
+    """[N, 1, 1, 1, 1] boolean tensor, True for the samples that are augmented"""
+    return (torch.rand(batch_size, device=reference.device) < p).view(-1, 1, 1, 1, 1)
+
+
+def brain_std(inputs: torch.Tensor) -> torch.Tensor:
+    """Standard deviation of the brain voxels of each sample and channel [N, C, 1, 1, 1]"""
+    brain = (inputs != 0).to(inputs.dtype)
+    count = brain.sum(dim=(2, 3, 4), keepdim=True).clamp(min=1)
+    mean = (inputs * brain).sum(dim=(2, 3, 4), keepdim=True) / count
+    variance = (((inputs - mean) * brain) ** 2).sum(dim=(2, 3, 4), keepdim=True) / count
+    return variance.sqrt()
+
+
+class BatchIntensityScale(object):
+
+    def __init__(self, min: float = 0.9, max: float = 1.1):
+        super().__init__()
+        self.min = min
+        self.max = max
+
+    def __call__(self, batch: Tuple[torch.Tensor, torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        inputs, targets = batch
+        scale = _uniform(self.min, self.max, (inputs.shape[0], 1, 1, 1, 1), inputs)
+        return inputs * scale, targets
+
+
+class BatchIntensityShift(object):
+
+    def __init__(self, min: float = -0.1, max: float = 0.1):
+        super().__init__()
+        self.min = min
+        self.max = max
+
+    def __call__(self, batch: Tuple[torch.Tensor, torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Shift each channel by a random fraction of the std of its brain voxels. Unlike RandomIntensityShift with the
+        whole volume statistics, the std is the one of the sample itself: for patches it is the std of the patch
+        brain voxels, so the shifts follow the local contrast of the patch instead of the one of the volume
+        """
+        inputs, targets = batch
+        shift = _uniform(self.min, self.max, (inputs.shape[0], inputs.shape[1], 1, 1, 1), inputs)
+        return inputs + brain_std(inputs) * shift, targets
+
+
+class BatchGaussianNoise(object):
+
+    def __init__(self, p=0.5, noise_variance=(0, 0.5)):
+        super().__init__()
+        self.p = p
+        self.noise_variance = noise_variance
+
+    def __call__(self, batch: Tuple[torch.Tensor, torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Add gaussian noise to the brain voxels of a random subset of the samples
+        """
+        inputs, targets = batch
+        variance = _uniform(self.noise_variance[0], self.noise_variance[1], (inputs.shape[0], 1, 1, 1, 1), inputs)
+        augment = _apply_with_probability(self.p, inputs.shape[0], inputs) & (inputs != 0)
+        noise = torch.randn_like(inputs) * variance
+        return torch.where(augment, inputs + noise, inputs), targets
+
+
+class BatchGammaCorrection(object):
+
+    def __init__(self, p=0.5, gamma_range=(0.5, 2), epsilon=1e-7):
+        super().__init__()
+        self.p = p
+        self.gamma_range = gamma_range
+        self.epsilon = epsilon
+
+    def __call__(self, batch: Tuple[torch.Tensor, torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Gamma correction of the intensity range of each augmented sample. As in GammaCorrection, half of the gammas
+        are below 1 and half above it
+        """
+        inputs, targets = batch
+        batch_size = inputs.shape[0]
+        shape = (batch_size, 1, 1, 1, 1)
+
+        low_gamma = _uniform(self.gamma_range[0], min(1, self.gamma_range[1]), shape, inputs)
+        high_gamma = _uniform(max(self.gamma_range[0], 1), self.gamma_range[1], shape, inputs)
+        use_low = (torch.rand(shape, device=inputs.device) < 0.5) & (self.gamma_range[0] < 1)
+        gamma = torch.where(use_low, low_gamma, high_gamma)
+
+        flat_inputs = inputs.reshape(batch_size, -1)
+        minimum = flat_inputs.min(dim=1).values.view(shape)
+        intensity_range = flat_inputs.max(dim=1).values.view(shape) - minimum
+        corrected = ((inputs - minimum) / (intensity_range + self.epsilon)) ** gamma * intensity_range + minimum
+
+        augment = _apply_with_probability(self.p, batch_size, inputs)
+        return torch.where(augment, corrected, inputs), targets
+
+
+class BatchMirrorFlip(object):
+
+    def __init__(self, p=0.5):
+        super().__init__()
+        self.p = p
+
+    def __call__(self, batch: Tuple[torch.Tensor, torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Flip all the spatial axes of a random subset of the samples, and their targets
+        """
+        inputs, targets = batch
+        augment = _apply_with_probability(self.p, inputs.shape[0], inputs)
+        inputs = torch.where(augment, inputs.flip(dims=(2, 3, 4)), inputs)
+        targets = torch.where(augment.view(-1, 1, 1, 1), targets.flip(dims=(1, 2, 3)), targets)
+        return inputs, targets
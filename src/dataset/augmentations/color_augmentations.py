@@ -1,3 +1,4 @@
+import os
 from typing import Tuple
 import numpy as np
 import random
@@ -21,11 +22,11 @@ class RandomIntensityScale(object):
             Tuple with modalities mask and binary mask
 
         """
-        modalities, _,  mask = img_and_mask
+        modalities = img_and_mask[0]
         scale = random.uniform(self.min, self.max)
         modalities = modalities * scale
 
-        return modalities, img_and_mask[1], img_and_mask[2]
+        return (modalities,) + tuple(img_and_mask[1:])
 
 
 class RandomIntensityShift(object):
@@ -41,35 +42,58 @@ class RandomIntensityShift(object):
             img_and_mask[0]: data with  all channels [C, W, H, D]
             img_and_mask[1]: segmentation mask [ W, H, D]
             img_and_mask[2]:binary mas [ W, H, D]
+            img_and_mask[3]: optional dict with the "std" [C] of each channel in the brain of the whole volume. Needed
+                             when the input is a patch, so the shift is the same as if the whole volume was augmented
         Returns:
         """
-        modalities, _, mask = img_and_mask
+        modalities, _, mask = img_and_mask[:3]
         assert len(modalities.shape) == 4
+        stats = img_and_mask[3] if len(img_and_mask) > 3 else None
 
+        # write to a new array: the input may be a read-only memory map
+        shifted_modalities = np.empty(modalities.shape, modalities.dtype)
         for i, modality in enumerate(modalities):
 
             shift = random.uniform(self.min, self.max)
-            std = np.std(modality[mask == 1])
-            modalities[i, ...] = modality + std * shift
+            std = stats["std"][i] if stats is not None else np.std(modality[mask == 1])
+            shifted_modalities[i, ...] = modality + std * shift
 
-        return modalities, img_and_mask[1], mask
+        return (shifted_modalities,) + tuple(img_and_mask[1:])
 
 
 class RandomGaussianNoise(object):
 
-    def __init__(self, p=0.5, noise_variance=(0, 0.5)):
+    def __init__(self, p=0.5, noise_variance=(0, 0.5), seed=None):
+        """
+        :param seed: seed of the noise generator. If None, each process (DataLoader worker) seeds its own generator
+                     from the torch seed, so workers do not draw the same noise
+        """
         super().__init__()
         self.p = p
         self.noise_variance = noise_variance
+        self.seed = seed
+        self._rng = None
+        self._rng_pid = None
+
+    def _generator(self) -> np.random.Generator:
+        if self._rng is None or self._rng_pid != os.getpid():
+            seed = self.seed if self.seed is not None else torch.initial_seed() % 2 ** 32
+            self._rng = np.random.default_rng(seed)
+            self._rng_pid = os.getpid()
+        return self._rng
 
     def __call__(self, img_and_mask: Tuple[np.ndarray, np.ndarray,  np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
+        Add float32 gaussian noise to the brain voxels of all the channels
         Args:
+            img_and_mask[0]: data with  all channels [C, W, H, D]
+            img_and_mask[1]: segmentation mask [ W, H, D]
+            img_and_mask[2]:binary mas [ W, H, D]
         Returns:
+            Tuple with noised modalities, segmentation mask and binary mask
         """
-        img, _, mask = img_and_mask
+        img, _, mask = img_and_mask[:3]
         noised_image = img
-        mask = np.stack([mask]*4)
 
         if torch.rand(1) < self.p:
             if self.noise_variance[0] == self.noise_variance[1]:
@@ -77,7 +101,9 @@ class RandomGaussianNoise(object):
             else:
                 variance = random.uniform(self.noise_variance[0], self.noise_variance[1])
 
-            noised_image = img + np.random.normal(0.0, variance, size=img.shape)
-            noised_image[mask == 0] = img[mask == 0]
+            noise = self._generator().standard_normal(img.shape, dtype=np.float32)
+            # the [W, H, D] mask is broadcast over the channels
+            noise *= np.float32(variance) * (mask > 0)
+            noised_image = img + noise
 
-        return noised_image, img_and_mask[1], mask
+        return (noised_image,) + tuple(img_and_mask[1:])
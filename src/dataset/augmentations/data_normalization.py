@@ -16,6 +16,43 @@ def zero_mean_unit_variance_normalization(data: np.ndarray, epsilon: float = 1e-
     return out
 
 
+def brain_statistics(modalities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mean and standard deviation of the brain (non-zero) voxels of each channel, as used by
+    zero_mean_unit_variance_normalization
+    :param modalities: [C, W, H, D]
+    """
+    means, stds = [], []
+    for modality in modalities:
+        non_zero = modality[modality > 0.0]
+        means.append(non_zero.mean())
+        stds.append(non_zero.std())
+    return np.array(means), np.array(stds)
+
+
+def normalization_coefficients(mean: np.ndarray, std: np.ndarray, epsilon: float = 1e-8,
+                               dtype=np.float32) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Scale and offset [C, 1, 1, 1] of each channel so that modalities * scale + offset is normalized
+    """
+    scale = 1. / (np.asarray(std, np.float64).reshape(-1, 1, 1, 1) + epsilon)
+    offset = (-np.asarray(mean, np.float64).reshape(-1, 1, 1, 1) * scale).astype(dtype)
+    return scale.astype(dtype), offset
+
+
+def normalize_with_statistics(modalities: np.ndarray, mean: np.ndarray, std: np.ndarray, epsilon: float = 1e-8,
+                              dtype=np.float32) -> np.ndarray:
+    """
+    Same result as zero_mean_unit_variance_normalization on each channel, but with precomputed statistics:
+    a single multiply-add pass instead of the two masked passes to compute them.
+    :param modalities: [C, W, H, D] raw volumes
+    :param mean: [C] brain mean of each channel
+    :param std: [C] brain standard deviation of each channel
+    """
+    scale, offset = normalization_coefficients(mean, std, epsilon, dtype)
+    return np.where(modalities != 0, modalities * scale + offset, 0).astype(dtype, copy=False)
+
+
 
 
 class GammaCorrection(object):
@@ -31,11 +68,28 @@ class GammaCorrection(object):
 
 
     def __call__(self, img_and_mask: Tuple[np.ndarray, np.ndarray,  np.ndarray])  -> Tuple[np.ndarray, np.ndarray,  np.ndarray]:
-        data_sample, seg_mask, mask = img_and_mask
-
+        """
+        img_and_mask[3] is an optional dict with the "min" and "max" [C] of the brain of each channel of the whole
+        volume (see intensity_statistics.normalized_statistics). If given, the intensity range is taken from it instead
+        of the sample, which also keeps the correction of a patch the same as for the whole volume. The range is still
+        widened to the sample if an earlier transform moved it outside
+        """
+        data_sample, seg_mask, mask = img_and_mask[:3]
+        stats = img_and_mask[3] if len(img_and_mask) > 3 else None
+        if stats is not None and "min" in stats:
+            # the background (0) is part of the range
+            channel_min, channel_max = np.minimum(stats["min"], 0), np.maximum(stats["max"], 0)
+        else:
+            channel_min = channel_max = None
 
         if self.invert_image:
+            channel_min, channel_max = (None, None) if channel_min is None else (-channel_max, -channel_min)
             data_sample = - data_sample
+        if channel_min is not None:
+            # earlier transforms (scale, shift, noise) may have moved the sample out of the range of the statistics
+            flat_sample = data_sample.reshape(data_sample.shape[0], -1)
+            channel_min = np.minimum(channel_min, flat_sample.min(axis=1))
+            channel_max = np.maximum(channel_max, flat_sample.max(axis=1))
         if not self.per_channel:
             if self.retain_stats:
                 mn = data_sample.mean()
@@ -44,8 +98,8 @@ class GammaCorrection(object):
                 gamma = np.random.uniform(self.gamma_range[0], 1)
             else:
                 gamma = np.random.uniform(max(self.gamma_range[0], 1), self.gamma_range[1])
-            minm = data_sample.min()
-            rnge = data_sample.max() - minm
+            minm = data_sample.min() if channel_min is None else np.min(channel_min)
+            rnge = (data_sample.max() if channel_max is None else np.max(channel_max)) - minm
             data_sample = np.power(((data_sample - minm) / float(rnge + self.epsilon)), gamma) * rnge + minm
             if self.retain_stats:
                 data_sample = data_sample - data_sample.mean() + mn
@@ -59,8 +113,8 @@ class GammaCorrection(object):
                     gamma = np.random.uniform(self.gamma_range[0], 1)
                 else:
                     gamma = np.random.uniform(max(self.gamma_range[0], 1), self.gamma_range[1])
-                minm = data_sample[c].min()
-                rnge = data_sample[c].max() - minm
+                minm = data_sample[c].min() if channel_min is None else channel_min[c]
+                rnge = (data_sample[c].max() if channel_max is None else channel_max[c]) - minm
                 data_sample[c] = np.power(((data_sample[c] - minm) / float(rnge + self.epsilon)), gamma) * float(
                     rnge + self.epsilon) + minm
                 if self.retain_stats:
@@ -70,7 +124,7 @@ class GammaCorrection(object):
         if self.invert_image:
             data_sample = - data_sample
 
-        return data_sample, seg_mask, mask
+        return (data_sample, seg_mask, mask) + tuple(img_and_mask[3:])
 
 
 
@@ -89,61 +143,40 @@ class ChannelTranslation():
 
 
     def augment_channel_translation(self, data, const_channel=0, max_shifts=None):
+        """
+        Shift every channel but const_channel of each sample by the same random offset, filling with zeros
+        :param data: batch [N, C, z, y, x] or [N, C, y, x]
+        :return: new array with the channels in their original positions
+        """
         if max_shifts is None:
             max_shifts = {'z': 2, 'y': 2, 'x': 2}
 
         shape = data.shape
+        dims = ['z', 'y', 'x'] if len(shape) == 5 else ['y', 'x']
+        trans_channels = [i for i in range(shape[1]) if i != const_channel]
 
-        const_data = data[:, [const_channel]]
-        trans_data = data[:, [i for i in range(shape[1]) if i != const_channel]]
+        out = np.zeros_like(data)
+        out[:, const_channel] = data[:, const_channel]
 
-        # iterate the batch dimension
+        # iterate the batch dimension, randomly draw shifts/translations for each image dimension
         for j in range(shape[0]):
-
-            slice = trans_data[j]
-
-            ixs = {}
-            pad = {}
-
-            if len(shape) == 5:
-                dims = ['z', 'y', 'x']
-            else:
-                dims = ['y', 'x']
-
-            # iterate the image dimensions, randomly draw shifts/translations
+            source, target = [j, trans_channels], [j, trans_channels]
             for i, v in enumerate(dims):
-                rand_shift = np.random.choice(list(range(-max_shifts[v], max_shifts[v], 1)))
+                shift = np.random.randint(-max_shifts[v], max_shifts[v]) if max_shifts[v] > 0 else 0
+                size = shape[2 + i]
+                target.append(slice(max(shift, 0), size + min(shift, 0)))
+                source.append(slice(max(-shift, 0), size - max(shift, 0)))
 
-                if rand_shift > 0:
-                    ixs[v] = {'lo': 0, 'hi': -rand_shift}
-                    pad[v] = {'lo': rand_shift, 'hi': 0}
-                else:
-                    ixs[v] = {'lo': abs(rand_shift), 'hi': shape[2 + i]}
-                    pad[v] = {'lo': 0, 'hi': abs(rand_shift)}
-
-            # shift and pad so as to retain the original image shape
-            if len(shape) == 5:
-                slice = slice[:, ixs['z']['lo']:ixs['z']['hi'], ixs['y']['lo']:ixs['y']['hi'],
-                        ixs['x']['lo']:ixs['x']['hi']]
-                slice = np.pad(slice, ((0, 0), (pad['z']['lo'], pad['z']['hi']), (pad['y']['lo'], pad['y']['hi']),
-                                       (pad['x']['lo'], pad['x']['hi'])),
-                               mode='constant', constant_values=(0, 0))
-            if len(shape) == 4:
-                slice = slice[:, ixs['y']['lo']:ixs['y']['hi'], ixs['x']['lo']:ixs['x']['hi']]
-                slice = np.pad(slice, ((0, 0), (pad['y']['lo'], pad['y']['hi']), (pad['x']['lo'], pad['x']['hi'])),
-                               mode='constant', constant_values=(0, 0))
-
-            trans_data[j] = slice
-
-        data_return = np.concatenate([const_data, trans_data], axis=1)
-        return data_return
+            # a single copy of the overlapping region keeps the original image shape
+            out[tuple(target)] = data[tuple(source)]
 
-    def __call__(self, img_and_mask: Tuple[np.ndarray, np.ndarray,  np.ndarray])  -> Tuple[np.ndarray, np.ndarray,  np.ndarray]:
-        data_sample, seg_mask, mask = img_and_mask
+        return out
 
+    def __call__(self, img_and_mask: Tuple[np.ndarray, np.ndarray,  np.ndarray])  -> Tuple[np.ndarray, np.ndarray,  np.ndarray]:
+        data_sample, seg_mask, mask = img_and_mask[:3]
 
-        ret_val = self.augment_channel_translation(data=data_sample, const_channel=self.const_channel, max_shifts=self.max_shift)
-
-        data = ret_val[0]
+        # the sample [C, W, H, D] is a batch of one
+        data = self.augment_channel_translation(data=data_sample[None], const_channel=self.const_channel,
+                                                max_shifts=self.max_shift)[0]
 
-        return data, seg_mask, mask
\ No newline at end of file
+        return (data, seg_mask, mask) + tuple(img_and_mask[3:])
@@ -1,6 +1,7 @@
 from typing import Tuple
 import numpy as np
 import torch
+from scipy.ndimage import gaussian_filter, map_coordinates
 
 
 
@@ -19,7 +20,7 @@ class RandomMirrorFlip(object):
         Returns:
             numpy array or Tensor: Randomly flipped image.
         """
-        modalities, seg_mask, mask = img_and_mask
+        modalities, seg_mask, mask = img_and_mask[:3]
 
         if torch.rand(1) < self.p:
             modalities = np.flip(modalities, axis=[1, 2, 3])
@@ -28,7 +29,8 @@ class RandomMirrorFlip(object):
             if mask is not None:
                 mask = np.flip(mask, axis=[0, 1, 2])
 
-        return modalities, seg_mask, mask
+        # optional intensity statistics of the whole volume are passed through
+        return (modalities, seg_mask, mask) + tuple(img_and_mask[3:])
 
 
 
@@ -72,6 +74,79 @@ class RandomRotation90(object):
         Returns:
             numpy array or Tensor: Randomly flipped image.
         """
-        modalities, seg_mask, mask = img_and_mask
+        modalities, seg_mask, mask = img_and_mask[:3]
         modalities, seg_mask, mask = self._augment_rot90(modalities, seg_mask, mask)
-        return modalities, seg_mask, mask
+        return (modalities, seg_mask, mask) + tuple(img_and_mask[3:])
+
+
+
+class RandomAffine(object):
+
+    def __init__(self, p=0.5, rotation_range=(-15, 15), scale_range=(0.9, 1.1), flip_p=0.5, elastic_alpha=0.,
+                 elastic_sigma=8.):
+        """
+        Random rotation, scaling, flips and (optional) elastic deformation, composed in a single sampling grid so
+        each volume is interpolated once whatever the number of transforms
+        :param rotation_range: degrees of the rotation around each axis
+        :param scale_range: zoom factor, the same for all axes
+        :param flip_p: probability to flip each axis
+        :param elastic_alpha: magnitude in voxels of the elastic displacement (0 disables it)
+        :param elastic_sigma: smoothness in voxels of the elastic displacement
+        """
+        super().__init__()
+        self.p = p
+        self.rotation_range = rotation_range
+        self.scale_range = scale_range
+        self.flip_p = flip_p
+        self.elastic_alpha = elastic_alpha
+        self.elastic_sigma = elastic_sigma
+
+    def _random_matrix(self) -> np.ndarray:
+        """Matrix from output to input coordinates: inverse scale and flips, then rotations around x, y and z"""
+        matrix = np.diag([(-1. if np.random.random() < self.flip_p else 1.) / np.random.uniform(*self.scale_range)
+                          for _ in range(3)])
+        for axes in [(1, 2), (0, 2), (0, 1)]:
+            angle = np.deg2rad(np.random.uniform(*self.rotation_range))
+            rotation = np.eye(3)
+            rotation[axes[0], axes[0]] = rotation[axes[1], axes[1]] = np.cos(angle)
+            rotation[axes[0], axes[1]] = -np.sin(angle)
+            rotation[axes[1], axes[0]] = np.sin(angle)
+            matrix = rotation @ matrix
+        return matrix
+
+    def sampling_grid(self, shape: tuple, matrix: np.ndarray) -> np.ndarray:
+        """
+        Input coordinates [3, W, H, D] sampled by each output voxel, rotating and scaling around the volume center
+        """
+        center = (np.array(shape, dtype=np.float32) - 1) / 2
+        grid = np.indices(shape, dtype=np.float32).reshape(3, -1) - center[:, None]
+        coordinates = (matrix.astype(np.float32) @ grid + center[:, None]).reshape((3,) + tuple(shape))
+
+        if self.elastic_alpha > 0:
+            for axis in range(3):
+                displacement = gaussian_filter(np.random.uniform(-1, 1, shape).astype(np.float32), self.elastic_sigma)
+                coordinates[axis] += displacement * (self.elastic_alpha / (np.abs(displacement).max() + 1e-8))
+        return coordinates
+
+    def __call__(self, img_and_mask: Tuple[np.ndarray, np.ndarray,  np.ndarray])  -> Tuple[np.ndarray, np.ndarray,  np.ndarray]:
+        """
+        Args:
+            img_and_mask[0]: data with  all channels [C, W, H, D]
+            img_and_mask[1]: segmentation mask [ W, H, D]
+            img_and_mask[2]:binary mas [ W, H, D]
+        Returns:
+            Modalities resampled with linear interpolation, segmentation and brain mask with nearest neighbour.
+            Voxels sampled from outside of the volume are 0
+        """
+        modalities, seg_mask, mask = img_and_mask[:3]
+
+        if np.random.random() < self.p:
+            coordinates = self.sampling_grid(modalities.shape[1:], self._random_matrix())
+            modalities = np.stack([map_coordinates(modality, coordinates, output=np.float32, order=1, cval=0)
+                                   for modality in modalities])
+            if seg_mask is not None:
+                seg_mask = map_coordinates(seg_mask, coordinates, output=seg_mask.dtype, order=0, cval=0)
+            if mask is not None:
+                mask = map_coordinates(mask, coordinates, output=mask.dtype, order=0, cval=0)
+
+        return (modalities, seg_mask, mask) + tuple(img_and_mask[3:])
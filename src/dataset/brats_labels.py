@@ -67,6 +67,24 @@ def convert_to_brats_labels(segmentation_map: np.ndarray) -> np.ndarray:
     return segmentation_map
 
 
+def label_lookup_table(function, max_label: int) -> np.ndarray:
+    """Table with function(label) at position label, for labels from 0 to max_label"""
+    return np.array([function(label) for label in range(max_label + 1)])
+
+
+def map_labels(segmentation_map: np.ndarray, function) -> np.ndarray:
+    """
+    Apply function to each voxel label of a segmentation. The function is only called once per possible label to
+    build a lookup table that is then indexed with the whole volume, instead of once per voxel as np.vectorize
+    :param function: label (int) -> new value
+    """
+    labels = segmentation_map if np.issubdtype(segmentation_map.dtype, np.integer) else segmentation_map.astype(np.int64)
+    if labels.size and labels.min() < 0:
+        raise ValueError("Labels must be non negative to be mapped with a lookup table")
+    max_label = int(labels.max()) if labels.size else 0
+    return label_lookup_table(function, max_label)[labels]
+
+
 def _copy_input(input):
     if torch.is_tensor(input):
         return input.detach().clone()
@@ -1,6 +1,9 @@
 import random
+from collections import deque
+from typing import Dict, List
+
 from torch.utils.data import Sampler, DataLoader
-from src.dataset.loaders.brats_dataset_whole_volume import BratsDataset
+from src.dataset.loaders.brats_dataset import BratsDataset
 
 
 
@@ -30,75 +33,160 @@ class BratsSampler(Sampler):
             yield batch_indices
 
     def __len__(self):
-        return (len(self.dataset_indices) + self.batch_size - 1) // self.batch_size
+        return (len(self.dataset_indices) + self.n_patients - 1) // self.n_patients
 
 
 
 
 class BratsPatchSampler(Sampler):
 
-    def __init__(self, dataset, n_patients, n_samples):
-
+    def __init__(self, dataset, n_patients, n_samples, num_workers=0):
+        """
+        Batches with n_samples patches of n_patients patients each. Every index of the dataset is used once per epoch
+        and the batches are shuffled again on each epoch.
+        :param dataset: BratsDataset whose data has several entries (patches) per patient
+        :param num_workers: if bigger than 1, the patients are split between the DataLoader workers and every batch
+                            only has patients of one worker. Batches are yielded in the round-robin order in which the
+                            DataLoader sends them to its workers, so all the patches of a patient are loaded by the
+                            same worker (and its volume cache). It must match the num_workers of the DataLoader
+        """
         self.batch_size = n_patients*n_samples
         self.n_samples = n_samples
         self.n_patients = n_patients
+        self.num_workers = num_workers
         self.dataset_indices = list(range(0, len(dataset)))
         self.dataset = dataset.data
         self.patches_by_patient = self._generate_structure()
+        self._batches = self._epoch_batches()
 
-    def _generate_structure(self):
+    def _generate_structure(self) -> Dict[str, List[int]]:
         patches_by_patient = {}
         for index, patient_patch in enumerate(self.dataset):
-            patient = patient_patch.patient
-
-            if patient not in patches_by_patient.keys():
-                patches_by_patient[patient] = []
-            patches_by_patient[patient].append(index)
+            patches_by_patient.setdefault(patient_patch.patient, []).append(index)
 
         return patches_by_patient
 
-
-    def __iter__(self):
-
-        while len(self.patches_by_patient) > 0:
+    def _epoch_batches(self) -> List[List[int]]:
+        patients = list(self.patches_by_patient.keys())
+        random.shuffle(patients)
+
+        if self.num_workers <= 1:
+            return self._group_batches(patients)
+
+        # balance the number of patches of each worker so their batch streams have similar lengths
+        worker_patients = [[] for _ in range(self.num_workers)]
+        worker_patches = [0] * self.num_workers
+        for patient in patients:
+            worker = worker_patches.index(min(worker_patches))
+            worker_patients[worker].append(patient)
+            worker_patches[worker] += len(self.patches_by_patient[patient])
+
+        # batch i goes to worker i % num_workers. Once the shortest stream ends the remaining batches are still used,
+        # but they are no longer routed to a fixed worker
+        streams = [self._group_batches(patients) for patients in worker_patients]
+        batches = []
+        for position in range(max(len(stream) for stream in streams)):
+            batches.extend(stream[position] for stream in streams if position < len(stream))
+        return batches
+
+    def _group_batches(self, patients: list) -> List[List[int]]:
+        """
+        Patients are taken in turns from a queue: each batch takes up to n_samples shuffled patches from the next
+        n_patients patients, and patients with patches left go back to the end of the queue. O(number of patches)
+        """
+        queue = deque()
+        for patient in patients:
+            patches = list(self.patches_by_patient[patient])
+            random.shuffle(patches)
+            queue.append(patches)
+
+        batches = []
+        while queue:
             batch_indices = []
-            patients_for_batch = random.sample(self.patches_by_patient.items(), min(self.n_patients, len(self.patches_by_patient)))
+            for _ in range(min(self.n_patients, len(queue))):
+                patches = queue.popleft()
+                batch_indices.extend(patches[-self.n_samples:])
+                del patches[-self.n_samples:]
+                if patches:
+                    queue.append(patches)
+            batches.append(batch_indices)
 
-            for patient, patches in patients_for_batch:
-                selected_patches = random.sample(patches, min(self.n_samples, len(patches)))
-                batch_indices.extend(selected_patches)
+        return batches
 
-                for patch_id in selected_patches:
-                    self.patches_by_patient[patient].remove(patch_id)
+    def __iter__(self):
+        batches = self._batches
+        # next epoch gets a new permutation
+        self._batches = self._epoch_batches()
+        return iter(batches)
 
-                if not self.patches_by_patient[patient]:
-                    del self.patches_by_patient[patient]
+    def __len__(self):
+        return len(self._batches)
+
+class PatientDistributedSampler(Sampler):
+
+    def __init__(self, dataset, num_replicas: int = 1, rank: int = 0, shuffle: bool = True, seed: int = 0):
+        """
+        Distributed sampler that splits the patients, instead of the indices, between the ranks: every rank only
+        loads the volumes of its own patients. All ranks draw the same permutation (seed + epoch) and patients are
+        assigned so that ranks get a similar number of entries. Every rank yields the same number of indices (the
+        shortest ones repeat some of their own entries), as DistributedDataParallel needs.
+        :param dataset: BratsDataset, its data may have several entries (patches) per patient
+        """
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.patches_by_patient = {}
+        for index, patient_patch in enumerate(dataset.data):
+            self.patches_by_patient.setdefault(patient_patch.patient, []).append(index)
+        if len(self.patches_by_patient) < num_replicas:
+            raise ValueError(f"{len(self.patches_by_patient)} patients can not be split between {num_replicas} ranks")
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _rank_indices(self) -> List[List[int]]:
+        patients = list(self.patches_by_patient.keys())
+        rng = random.Random(self.seed + self.epoch)
+        if self.shuffle:
+            rng.shuffle(patients)
+
+        rank_indices = [[] for _ in range(self.num_replicas)]
+        for patient in patients:
+            rank = min(range(self.num_replicas), key=lambda r: len(rank_indices[r]))
+            rank_indices[rank].extend(self.patches_by_patient[patient])
+        return rank_indices
 
-            yield batch_indices
+    def __iter__(self):
+        rank_indices = self._rank_indices()
+        num_samples = max(len(indices) for indices in rank_indices)
+
+        indices = rank_indices[self.rank]
+        if self.shuffle:
+            random.Random(self.seed + self.epoch + self.rank).shuffle(indices)
+        # pad with its own entries, so no patient is loaded by two ranks
+        indices = (indices * (num_samples // max(1, len(indices)) + 1))[:num_samples]
+        return iter(indices)
 
     def __len__(self):
-        return (len(self.dataset_indices) + self.batch_size - 1) // self.batch_size
+        return max(len(indices) for indices in self._rank_indices())
 
 
 
 
 if __name__ == "__main__":
     from src.dataset.utils import dataset
-    from torchvision import transforms as T
     import importlib
 
     data, _ = dataset.read_brats("/Users/lauramora/Documents/MASTER/TFM/Data/2020/train/random_tumor_distribution/brats20_data.csv")
-    data_train = data[:40]
-    data_val = data[:40]
-    modalities_to_use = {BratsDataset.flair_idx: True, BratsDataset.t1_idx: True, BratsDataset.t2_idx: True,
-                         BratsDataset.t1ce_idx: True}
+    data_train = data[:40] * 3
     sampling_method = importlib.import_module("src.dataset.patching.random_tumor_distribution")
 
-    dataset = BratsDataset(data_train, modalities_to_use, sampling_method, (64,64,64), T.Compose([T.ToTensor()]))
-    sampler = BratsPatchSampler(dataset, n_patients=2, n_samples=3)
-    train_loader = DataLoader(dataset=dataset, batch_sampler=sampler, num_workers=1)
-
+    dataset = BratsDataset(data_train, sampling_method, (64, 64, 64), compute_patch=True)
+    sampler = BratsPatchSampler(dataset, n_patients=2, n_samples=3, num_workers=2)
+    train_loader = DataLoader(dataset=dataset, batch_sampler=sampler, num_workers=2)
 
-    for i, (patient, volumes, segmentations) in enumerate(train_loader):
+    for i, (volumes, segmentations) in enumerate(train_loader):
         print(f"item {i} --> {volumes.shape}")
         print(f"item {i} --> {segmentations.shape}")
@@ -3,25 +3,81 @@ import torch
 from torch.utils.data import Dataset
 
 from src.dataset import brats_labels
+from src.dataset.augmentations import spatial_augmentations
+from src.dataset.utils import bounding_box as bbox_utils
 from src.dataset.utils import nifi_volume as nifi_utils
+from src.dataset.utils import volume_cache
+from src.dataset.utils.intensity_statistics import normalized_statistics
+from src.dataset.loaders.patient_cache import PatientLRUCache
+from src.dataset.patching import center_index as center_index_utils
+from src.dataset.patching.commons import array4d_center_crop, array3d_center_crop
 
 
 
 class BratsDataset(Dataset):
 
-    def __init__(self, data: list, sampling_method, patch_size: tuple, compute_patch: bool=False, transform=None):
+    def __init__(self, data: list, sampling_method, patch_size: tuple, compute_patch: bool=False, transform=None,
+                 cache_dir: str=None, cache_max_bytes: int=0, shared_store=None, crop_to_brain: bool=False,
+                 use_center_index: bool=False, patches_per_volume: int=1, region_reads: bool=False,
+                 augment_patches: bool=False, patch_margin: int=0, dtype=np.float32, center_index_dir: str=None):
         """
         :param data:
         :param ground_truth:
         :param modalities_to_use:
         :param sampling_method: patching method
         :param patch_size:
+        :param cache_dir: directory built with build_volume_cache.py. If set, volumes are memory mapped from there
+                          instead of decoding the NIfTI files
+        :param cache_max_bytes: memory budget of the in-process LRU cache of decoded patients (0 disables it).
+                                Patching and augmentations still run on every access
+        :param shared_store: SharedVolumeStore with the volumes of the patients, shared by all loader workers
+        :param crop_to_brain: crop the decoded (or memory mapped) volumes to the precomputed brain bounding box of
+                              each patient (grown to the patch size). Volumes of different patients then have
+                              different sizes, so without compute_patch they can only be loaded with batch size 1.
+                              Region reads only read the patch region, they are not cropped
+        :param use_center_index: sample patches from a CenterIndex of each patient, built once and saved in
+                                 center_index_dir. Spatial augmentations move the voxels of the indexed volume, so
+                                 with them it needs augment_patches (the patch is chosen before augmenting it)
+        :param patches_per_volume: number of patches drawn from each loaded (and augmented) volume. If bigger than 1,
+                                   items are stacked patches [K, C, W, H, D] and [K, W, H, D], to be batched with
+                                   collate_patches
+        :param region_reads: read only the patch region from the volume cache. The patch start is chosen from the
+                             CenterIndex (sampling_method.select_start) before reading, and the transform is applied
+                             to the patch region (as with augment_patches). Needs cache_dir and compute_patch
+        :param augment_patches: crop the patch region first and apply the transform only to it, instead of augmenting
+                                the whole volume. The region is a cube of max(patch_size) + 2 * patch_margin voxels
+                                around the patch (so rot90 keeps its shape), cropped back to patch_size after the
+                                transform. Intensity statistics of the whole volume are passed to the transform
+        :param patch_margin: extra voxels around the patch for spatial transforms that bring in voxels from outside
+                             of it (not needed for flips and rot90)
+        :param dtype: type of the returned modalities, float32 or float16 (half the transfer from the loader workers).
+                      Augmentations always run in float32 and segmentations are returned as uint8
+        :param center_index_dir: directory where the CenterIndex of each patient is saved. If None, cache_dir is used
+                                 and without volume cache the indices are only kept in memory
         """
         self.data = data
         self.sampling_method = sampling_method
         self.patch_size = patch_size
         self.compute_patch = compute_patch
         self.transform = transform
+        self.cache_dir = cache_dir
+        self.patient_cache = PatientLRUCache(cache_max_bytes) if cache_max_bytes > 0 else None
+        self.shared_store = shared_store
+        self.crop_to_brain = crop_to_brain
+        self.use_center_index = use_center_index
+        self._center_indices = {}
+        self.patches_per_volume = patches_per_volume
+        self.region_reads = region_reads
+        if region_reads and not (cache_dir and compute_patch):
+            raise ValueError("Region reads need a volume cache and compute_patch")
+        self.augment_patches = (augment_patches or region_reads) and compute_patch
+        if use_center_index and compute_patch and not self.augment_patches and _moves_voxels(transform):
+            raise ValueError("The center index can not be used with spatial augmentations of the whole volume, "
+                             "use augment_patches to choose the patch before augmenting it")
+        self.center_index_dir = center_index_dir or cache_dir
+        self.region_size = patch_region_size(patch_size, self.augment_patches, patch_margin)
+        self._intensity_stats = {}
+        self.dtype = dtype
 
     def __len__(self):
         return len(self.data)
@@ -31,25 +87,163 @@ class BratsDataset(Dataset):
         if torch.is_tensor(idx):
             idx = idx.tolist()
 
-        modalities = self.data[idx].load_mri_volumes(normalize=True)
-        brain_mask = self.data[idx].get_brain_mask()
+        if self.region_reads:
+            patches = [self._read_patch(self.data[idx]) for _ in range(self.patches_per_volume)]
+        elif self.augment_patches:
+            volumes = self._load_volumes(self.data[idx])
+            patches = [self._read_patch(self.data[idx], volumes) for _ in range(self.patches_per_volume)]
+        else:
+            modalities, segmentation_mask, brain_mask = self._load_volumes(self.data[idx])
+            if self.transform or not self.compute_patch:
+                # the whole volume is used: normalize all of a compact cache volume
+                modalities = np.asarray(modalities)
+
+            if self.transform:
+                # precomputed statistics save the intensity augmentations a reduction over the whole volume
+                stats = (self._get_intensity_stats(self.data[idx]),) if self.data[idx].intensity_stats else ()
+                modalities, segmentation_mask, brain_mask = self.transform((modalities, segmentation_mask,
+                                                                            brain_mask) + stats)[:3]
+
+            if self.compute_patch:
+                patching_kwargs = {}
+                if self.use_center_index:
+                    patching_kwargs["center_index"] = self._get_center_index(self.data[idx], segmentation_mask,
+                                                                             brain_mask)
+                patches = [self.sampling_method.patching(modalities, segmentation_mask, self.patch_size,
+                                                         brain_mask, **patching_kwargs)
+                           for _ in range(self.patches_per_volume)]
+            else:
+                patches = [(modalities, segmentation_mask)]
+
+        if len(patches) == 1:
+            modalities, segmentation_mask = patches[0]
+        else:
+            modalities = np.stack([volume_patch for volume_patch, _ in patches])
+            segmentation_mask = np.stack([seg_patch for _, seg_patch in patches])
+
+        # compact types to send the batches from the workers, the trainer converts them on the device
+        modalities = torch.from_numpy(modalities.astype(self.dtype))
+        segmentation_mask = torch.from_numpy(segmentation_mask.astype(np.uint8))
 
-        segmentation_mask = self.data[idx].load_gt_mask()
+        return modalities, segmentation_mask
+
+    def _load_volumes(self, patient):
+        if self.shared_store is not None:
+            return self.shared_store.load(patient)
+
+        bounding_box = None
+        if self.crop_to_brain:
+            bounding_box = patient.get_bounding_box(min_size=self.region_size if self.compute_patch else None)
+
+        if self.cache_dir:
+            volumes = volume_cache.load_patient(patient, self.cache_dir)
+            if bounding_box is None:
+                return volumes
+            return tuple(bbox_utils.crop(volume, bounding_box) for volume in volumes)
+
+        if self.patient_cache is not None:
+            volumes = self.patient_cache.get(patient.patch_name)
+            if volumes is not None:
+                return volumes
 
+        modalities, segmentation_mask, brain_mask = patient.load_all(normalize=True, bounding_box=bounding_box)
         segmentation_mask = brats_labels.convert_from_brats_labels(segmentation_mask)
 
-        if self.transform:
-            modalities, segmentation_mask, brain_mask = self.transform((modalities, segmentation_mask, brain_mask))
+        # augmentations work in float32, labels and masks in uint8
+        modalities = modalities.astype(np.float32)
+        segmentation_mask = segmentation_mask.astype(np.uint8)
+        brain_mask = brain_mask.astype(np.uint8)
 
-        if self.compute_patch:
-            modalities, segmentation_mask = self.sampling_method.patching(modalities, segmentation_mask,
-                                                                          self.patch_size, brain_mask)
+        if self.patient_cache is not None:
+            self.patient_cache.put(patient.patch_name, (modalities, segmentation_mask, brain_mask))
 
-        modalities = torch.from_numpy(modalities.astype(float))
-        segmentation_mask = torch.from_numpy(segmentation_mask.astype(int))
+        return modalities, segmentation_mask, brain_mask
 
-        return modalities, segmentation_mask
+    def _get_center_index(self, patient, segmentation_mask=None, brain_mask=None):
+        center_index = self._center_indices.get(patient.patch_name)
+        if center_index is None:
+            if segmentation_mask is None:
+                # the cached masks are only read if the index was not built yet
+                _, segmentation_mask, brain_mask = volume_cache.load_patient(patient, self.cache_dir)
+            center_index = center_index_utils.load_or_build(patient, self.center_index_dir, segmentation_mask,
+                                                            brain_mask, self.region_size)
+            self._center_indices[patient.patch_name] = center_index
+        return center_index
 
+    def _get_intensity_stats(self, patient, modalities=None, brain_mask=None) -> dict:
+        """
+        Brain statistics of each channel of the normalized whole volume, so intensity augmentations of a patch are the
+        same as if the whole volume had been augmented. They come from the precomputed patient intensity_stats or the
+        brain std stored in the volume cache. Otherwise the brain std is computed once per patient from the loaded
+        volumes; region reads never load them, so they need one of the other two
+        """
+        stats = self._intensity_stats.get(patient.patch_name)
+        if stats is None:
+            if patient.intensity_stats:
+                stats = normalized_statistics(patient.intensity_stats)
+            else:
+                brain_std = volume_cache.load_brain_std(patient, self.cache_dir) if self.cache_dir else None
+                if brain_std is not None:
+                    stats = {"std": brain_std}
+                elif modalities is not None:
+                    stats = {"std": np.array([np.std(modality[brain_mask == 1]) for modality in modalities])}
+                else:
+                    raise ValueError(f"No intensity statistics for {patient.patch_name}: region reads need a volume "
+                                     f"cache built with them or compute_intensity_statistics.py")
+            self._intensity_stats[patient.patch_name] = stats
+        return stats
+
+    def _read_patch(self, patient, volumes=None):
+        """
+        Choose the patch region from the CenterIndex, read or crop it, augment it and crop the patch from its center
+        :param volumes: loaded modalities, segmentation and brain mask. If None, the region is read from the cache
+        """
+        if volumes is None:
+            center_index = self._get_center_index(patient)
+            start = self.sampling_method.select_start(center_index)
+            modalities, segmentation_mask, brain_mask = volume_cache.load_region(patient, self.cache_dir, start,
+                                                                                 self.region_size)
+            stats = self._get_intensity_stats(patient)
+        else:
+            center_index = self._get_center_index(patient, volumes[1], volumes[2])
+            start = self.sampling_method.select_start(center_index)
+            region = tuple(slice(begin, begin + size) for begin, size in zip(start, self.region_size))
+            modalities, segmentation_mask, brain_mask = volumes[0][(slice(None),) + region], volumes[1][region], \
+                volumes[2][region]
+            stats = self._get_intensity_stats(patient, volumes[0], volumes[2])
+
+        if self.transform:
+            modalities, segmentation_mask, brain_mask = self.transform((modalities, segmentation_mask, brain_mask,
+                                                                        stats))[:3]
+        return array4d_center_crop(modalities, self.patch_size), array3d_center_crop(segmentation_mask,
+                                                                                     self.patch_size)
 
     def get_patient_info(self, idx):
         return {attr[0]: attr[1] for attr in vars(self.data[idx]).items()}
+
+
+def patch_region_size(patch_size: tuple, augment_patches: bool, patch_margin: int = 0) -> tuple:
+    """
+    Size of the region cropped around each patch: with augment_patches a cube of max(patch_size) + 2 * patch_margin
+    voxels (so rot90 keeps its shape), otherwise the patch itself. Volumes must be at least this big
+    """
+    return tuple([max(patch_size) + 2 * patch_margin] * 3) if augment_patches else patch_size
+
+
+def _moves_voxels(transform) -> bool:
+    """Whether the transform (or one of the transforms of a Compose) is a spatial augmentation"""
+    if transform is None:
+        return False
+    if hasattr(transform, "transforms"):
+        return any(_moves_voxels(child) for child in transform.transforms)
+    return type(transform).__module__ == spatial_augmentations.__name__
+
+
+def collate_patches(batch):
+    """
+    Collate function for a BratsDataset with patches_per_volume > 1: the K patches of each volume are flattened
+    in the batch dimension, so a batch of B volumes gives [B * K, C, W, H, D] and [B * K, W, H, D]
+    """
+    modalities = torch.cat([volume_patches for volume_patches, _ in batch])
+    segmentation_masks = torch.cat([seg_patches for _, seg_patches in batch])
+    return modalities, segmentation_masks
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class PatientLRUCache(object):
+    """
+    Least recently used cache of decoded patient volumes bounded by a memory budget in bytes.
+    Cached arrays are made read-only, so transforms must not modify their input in place.
+
+    Each DataLoader worker process holds its own copy of the cache, so the budget applies per worker.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._volumes = OrderedDict()
+
+    def __len__(self):
+        return len(self._volumes)
+
+    def get(self, key: Hashable) -> Optional[Tuple[np.ndarray, ...]]:
+        if key not in self._volumes:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._volumes.move_to_end(key)
+        return self._volumes[key][0]
+
+    def put(self, key: Hashable, volumes: Tuple[np.ndarray, ...]):
+        n_bytes = sum(volume.nbytes for volume in volumes if volume is not None)
+        if n_bytes > self.max_bytes or key in self._volumes:
+            return
+
+        while self.current_bytes + n_bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self._volumes.popitem(last=False)
+            self.current_bytes -= evicted_bytes
+
+        for volume in volumes:
+            if volume is not None:
+                volume.flags.writeable = False
+
+        self._volumes[key] = (volumes, n_bytes)
+        self.current_bytes += n_bytes
+
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
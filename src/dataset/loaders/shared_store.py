@@ -0,0 +1,101 @@
+import os
+import shutil
+from typing import Tuple
+
+import numpy as np
+import torch
+
+from src.dataset import brats_labels
+from src.logging_conf import logger
+
+SHARED_MEMORY_PATH = "/dev/shm"
+
+
+class SharedVolumeStore(object):
+    """
+    Normalized volumes of a set of patients kept in shared memory.
+
+    The buffers are allocated once, before the DataLoader workers are created, and every patient is decoded by
+    the first worker that needs it. After that all workers read the same memory without copies, so the memory
+    stays flat as num_workers grows and only the first epoch pays for the decompression.
+    """
+
+    def __init__(self, patients: list, n_modalities: int = 4, crop_to_brain: bool = False, min_size: tuple = None,
+                 max_bytes: int = 0):
+        """
+        :param patients: patients to store, repeated patients are stored once
+        :param crop_to_brain: store the volumes cropped to the brain bounding box of each patient (grown to min_size)
+        :param max_bytes: memory budget of the store (0 for no budget). The store is not allocated if it needs more
+                          than the budget or than the free shared memory
+        """
+        self.n_modalities = n_modalities
+        self._offsets = {}
+        self._shapes = {}
+        self._bounding_boxes = {}
+
+        n_voxels = 0
+        for patient in patients:
+            if patient.patch_name in self._offsets:
+                continue
+            bounding_box = patient.get_bounding_box(min_size=min_size) if crop_to_brain else None
+            if bounding_box is not None:
+                shape = tuple(bounding_box[2 * axis + 1] - bounding_box[2 * axis] for axis in range(3))
+            else:
+                shape = tuple(patient.size)
+            self._bounding_boxes[patient.patch_name] = bounding_box
+            self._offsets[patient.patch_name] = (len(self._offsets), n_voxels)
+            self._shapes[patient.patch_name] = shape
+            n_voxels += int(np.prod(shape))
+
+        n_bytes = n_voxels * (n_modalities * 4 + 2)
+        logger.info(f"Shared volume store of {len(self._offsets)} patients: {n_bytes / 1024 ** 3:.2f} GB")
+        if max_bytes and n_bytes > max_bytes:
+            raise MemoryError(f"The shared volume store needs {n_bytes / 1024 ** 3:.2f} GB, more than its budget of "
+                              f"{max_bytes / 1024 ** 3:.2f} GB")
+        if os.path.isdir(SHARED_MEMORY_PATH):
+            free_bytes = shutil.disk_usage(SHARED_MEMORY_PATH).free
+            if n_bytes > free_bytes:
+                raise MemoryError(f"The shared volume store needs {n_bytes / 1024 ** 3:.2f} GB, but only "
+                                  f"{free_bytes / 1024 ** 3:.2f} GB of {SHARED_MEMORY_PATH} are free")
+
+        # one buffer per volume type: a segment per patient would exhaust the shared memory file descriptors
+        self._modalities = torch.zeros(n_voxels * n_modalities, dtype=torch.float32).share_memory_()
+        self._segmentations = torch.zeros(n_voxels, dtype=torch.uint8).share_memory_()
+        self._brain_masks = torch.zeros(n_voxels, dtype=torch.uint8).share_memory_()
+        self._loaded = torch.zeros(len(self._offsets), dtype=torch.uint8).share_memory_()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def n_loaded(self) -> int:
+        return int(self._loaded.sum())
+
+    def load(self, patient) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: read-only views of the normalized modalities [C, W, H, D], segmentation and brain mask [W, H, D]
+        """
+        position, offset = self._offsets[patient.patch_name]
+        shape = self._shapes[patient.patch_name]
+        n_voxels = int(np.prod(shape))
+
+        modalities = self._modalities[offset * self.n_modalities:(offset + n_voxels) * self.n_modalities].numpy()
+        modalities = modalities.reshape((self.n_modalities,) + shape)
+        segmentation_mask = self._segmentations[offset:offset + n_voxels].numpy().reshape(shape)
+        brain_mask = self._brain_masks[offset:offset + n_voxels].numpy().reshape(shape)
+
+        if not self._loaded[position]:
+            volumes, segmentation, mask = patient.load_all(normalize=True,
+                                                           bounding_box=self._bounding_boxes[patient.patch_name])
+            if volumes.shape[1:] != shape:
+                raise ValueError(f"Patient {patient.patch_name} has size {volumes.shape[1:]}, expected {shape}")
+
+            modalities[...] = volumes
+            segmentation_mask[...] = brats_labels.convert_from_brats_labels(segmentation)
+            brain_mask[...] = mask
+            # flag it once the data is written: concurrent loads of the same patient write the same values
+            self._loaded[position] = 1
+
+        for volume in (modalities, segmentation_mask, brain_mask):
+            volume.flags.writeable = False
+
+        return modalities, segmentation_mask, brain_mask
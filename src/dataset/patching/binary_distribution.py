@@ -1,21 +1,32 @@
 import numpy as np
 import random
 
-from src.dataset.patching.commons import select_patch_by_label_distribution
+from src.dataset.patching.commons import select_patch_by_label_distribution, select_start_by_label_distribution
 
 
 def select_label_with_equal_prop(labels):
     return random.choice(labels)
 
 
-def patching(volume: np.ndarray, labels: np.ndarray, patch_size: tuple, mask: np.ndarray):
+def _binary_function(label):
+    return 0 if label == 0 else 1
+
+
+def select_start(center_index) -> tuple:
+    """
+    Patch start chosen from the CenterIndex only, so just the patch region has to be read
+    """
+    return select_start_by_label_distribution(center_index, _binary_function)
+
+
+def patching(volume: np.ndarray, labels: np.ndarray, patch_size: tuple, mask: np.ndarray, center_index=None):
     """
 
     50% probability of center being  healthy tissue - 50% to be centered in tumor regions
     Sampling technique from:
     'Efficient multi-scale 3D CNN with fully connected CRF for accurate brain lesion segmentation'
+    :param center_index: precomputed CenterIndex of the volume, to avoid scanning the segmentation
     """
-    binary_function = lambda label: 0 if label == 0 else 1
-
-    volume_patch, seg_patch = select_patch_by_label_distribution(volume, labels, patch_size, binary_function, mask)
+    volume_patch, seg_patch = select_patch_by_label_distribution(volume, labels, patch_size, _binary_function, mask,
+                                                                 center_index)
     return volume_patch, seg_patch
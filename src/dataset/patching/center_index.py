@@ -0,0 +1,107 @@
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.dataset.patient import Patient
+
+
+class CenterIndex(object):
+    """
+    Valid patch start coordinates of each label of a volume, so patching does not need to scan the whole
+    segmentation on every draw.
+
+    Every voxel of a label is a candidate patch center. Its patch start (center - patch_size // 2) is clipped
+    to the volume margins, so any stored start gives a full patch. Label 0 only contains healthy brain voxels.
+    Labels with more than `max_candidates` voxels keep a random subset of them, but the real voxel count is
+    kept to weight the labels when several of them are sampled together.
+    """
+
+    def __init__(self, starts: Dict[int, np.ndarray], counts: Dict[int, int], patch_size: tuple, shape: tuple):
+        self.starts = starts
+        self.counts = counts
+        self.patch_size = tuple(patch_size)
+        self.shape = tuple(shape)
+
+    @classmethod
+    def build(cls, segmentation: np.ndarray, brain_mask: np.ndarray, patch_size: tuple,
+              max_candidates: int = 4096) -> "CenterIndex":
+        assert all(size <= dim for size, dim in zip(patch_size, segmentation.shape)), "Patch bigger than volume"
+        half = np.array(patch_size) // 2
+        max_start = np.array(segmentation.shape) - np.array(patch_size)
+
+        starts, counts = {}, {}
+        for label in np.unique(segmentation):
+            label_mask = segmentation == label
+            if label == 0:
+                label_mask &= brain_mask > 0
+            centers = np.argwhere(label_mask)
+            if len(centers) == 0:
+                continue
+            counts[int(label)] = len(centers)
+            if len(centers) > max_candidates:
+                centers = centers[np.random.choice(len(centers), max_candidates, replace=False)]
+            starts[int(label)] = np.clip(centers - half, 0, max_start).astype(np.int16)
+
+        return cls(starts, counts, patch_size, segmentation.shape)
+
+    def labels(self) -> List[int]:
+        return sorted(self.starts.keys())
+
+    def random_start(self, labels: List[int] = None) -> Tuple[int, int, int]:
+        """
+        Start of a patch centered in a random voxel of the given labels (all of them if None). Labels are picked
+        proportionally to their number of voxels.
+        """
+        labels = [label for label in (labels if labels is not None else self.labels()) if label in self.starts]
+        if not labels:
+            raise ValueError("None of the requested labels is in the volume")
+
+        weights = np.array([self.counts[label] for label in labels], dtype=np.float64)
+        label = labels[np.random.choice(len(labels), p=weights / weights.sum())]
+        start = self.starts[label][np.random.randint(0, len(self.starts[label]))]
+        return tuple(int(coord) for coord in start)
+
+    def save(self, path: str):
+        """
+        Written to a temporary file and renamed, so loader workers never read a half written index
+        """
+        arrays = {f"label_{label}": starts for label, starts in self.starts.items()}
+        arrays.update({f"count_{label}": np.array(count) for label, count in self.counts.items()})
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, patch_size=np.array(self.patch_size), shape=np.array(self.shape), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CenterIndex":
+        with np.load(path) as index:
+            starts = {int(key.split("_")[1]): index[key] for key in index.files if key.startswith("label_")}
+            counts = {int(key.split("_")[1]): int(index[key]) for key in index.files if key.startswith("count_")}
+            return cls(starts, counts, tuple(index["patch_size"]), tuple(index["shape"]))
+
+
+def index_path(patient: Patient, index_dir: str, patch_size: tuple, shape: tuple) -> str:
+    """
+    The index depends on the patch size and on the volume size (cropped or not), so both are part of the name
+    """
+    size = "x".join(map(str, patch_size))
+    volume_size = "x".join(map(str, shape))
+    return os.path.join(index_dir, patient.patch_name, f"{patient.patch_name}_centers_{size}_{volume_size}.npz")
+
+
+def load_or_build(patient: Patient, index_dir: str, segmentation: np.ndarray, brain_mask: np.ndarray,
+                  patch_size: tuple) -> CenterIndex:
+    """
+    :param index_dir: directory of the saved indices. If None, the index is built and not saved
+    """
+    if index_dir is None:
+        return CenterIndex.build(segmentation, brain_mask, patch_size)
+
+    path = index_path(patient, index_dir, patch_size, segmentation.shape)
+    if os.path.exists(path):
+        return CenterIndex.load(path)
+
+    center_index = CenterIndex.build(segmentation, brain_mask, patch_size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    center_index.save(path)
+    return center_index
@@ -4,9 +4,18 @@ import numpy as np
 from src.dataset.patching.commons import array4d_center_crop, array3d_center_crop
 
 
-def patching(volume: np.ndarray, labels: np.ndarray, patch_size: tuple, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+def select_start(center_index) -> tuple:
+    """
+    Start of the centered patch, from the volume and patch sizes of the CenterIndex
+    """
+    return tuple(dim // 2 - (size // 2) for dim, size in zip(center_index.shape, center_index.patch_size))
+
+
+def patching(volume: np.ndarray, labels: np.ndarray, patch_size: tuple, mask: np.ndarray,
+             center_index=None) -> Tuple[np.ndarray, np.ndarray]:
     """
     Centered crop patch. Just one patch per patient
+    :param center_index: not used, the patch is always the center of the volume
     """
     volume_patch = array4d_center_crop(volume, patch_size)
     seg_patch =  array3d_center_crop(labels, patch_size)
@@ -1,6 +1,8 @@
 import random
 import numpy as np
 
+from src.dataset.brats_labels import map_labels
+
 
 def array4d_center_crop(data: np.ndarray, new_shape: tuple):
     assert len(data.shape) == 4
@@ -48,13 +50,35 @@ def crop_volume_margin(volume, patch_size):
     return array3d_center_crop(volume, crop_shape)
 
 
-def select_patch_by_label_distribution(volume, segmentation_mask, patch_size, function, brain_mask=None):
+def crop_patch(volume: np.ndarray, segmentation_mask: np.ndarray, patch_size: tuple, start: tuple):
+    start_x, start_y, start_z = start
+    seg_patch = segmentation_mask[start_x:start_x + patch_size[0], start_y:start_y + patch_size[1],
+                                  start_z:start_z + patch_size[2]]
+    volume_patch = volume[:, start_x:start_x + patch_size[0], start_y:start_y + patch_size[1],
+                          start_z:start_z + patch_size[2]]
+    return volume_patch, seg_patch
+
+
+def select_start_by_label_distribution(center_index, function) -> tuple:
+    # group the labels of the index as the function does and pick one of the groups with equal probability
+    groups = {}
+    for label in center_index.labels():
+        groups.setdefault(function(label), []).append(label)
+    selected_group = groups[random.choice(list(groups.keys()))]
+    return center_index.random_start(selected_group)
+
+
+def select_patch_by_label_distribution(volume, segmentation_mask, patch_size, function, brain_mask=None,
+                                       center_index=None):
+    if center_index is not None:
+        start = select_start_by_label_distribution(center_index, function)
+        return crop_patch(volume, segmentation_mask, patch_size, start)
+
     labels = list(np.unique(segmentation_mask))
     labels = list(set(map(function, labels)))
     selected_label = random.choice(labels)
 
-    vf = np.vectorize(function)
-    segmentation_mask_new = vf(segmentation_mask)
+    segmentation_mask_new = map_labels(segmentation_mask, function)
 
     segmentation_mask_new = crop_volume_margin(segmentation_mask_new, patch_size)
 
@@ -68,11 +92,4 @@ def select_patch_by_label_distribution(volume, segmentation_mask, patch_size, fu
         positions = np.argwhere(segmentation_mask_new == selected_label)
 
     axis_center = np.random.randint(0, len(positions))
-    start_x, start_y, start_z = positions[axis_center]
-
-    seg_patch = segmentation_mask[start_x:start_x + patch_size[0], start_y:start_y + patch_size[1],
-                                  start_z:start_z + patch_size[2]]
-    volume_patch = volume[:, start_x:start_x + patch_size[0], start_y:start_y + patch_size[1],
-                          start_z:start_z + patch_size[2]]
-
-    return volume_patch, seg_patch
+    return crop_patch(volume, segmentation_mask, patch_size, positions[axis_center])
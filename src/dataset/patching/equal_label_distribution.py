@@ -1,12 +1,25 @@
 import numpy as np
 from typing import Tuple
-from src.dataset.patching.commons import select_patch_by_label_distribution
+from src.dataset.patching.commons import select_patch_by_label_distribution, select_start_by_label_distribution
 
 
-def patching(volume: np.ndarray, labels: np.ndarray, patch_size: tuple,  mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+def _identity_function(label):
+    return label
+
+
+def select_start(center_index) -> tuple:
+    """
+    Patch start chosen from the CenterIndex only, so just the patch region has to be read
+    """
+    return select_start_by_label_distribution(center_index, _identity_function)
+
+
+def patching(volume: np.ndarray, labels: np.ndarray, patch_size: tuple,  mask: np.ndarray,
+             center_index=None) -> Tuple[np.ndarray, np.ndarray]:
     """
     Patches with equal probability from each label
+    :param center_index: precomputed CenterIndex of the volume, to avoid scanning the segmentation
     """
-    identity_function = lambda label: label
-    volume_patch, seg_patch = select_patch_by_label_distribution(volume, labels, patch_size, identity_function)
+    volume_patch, seg_patch = select_patch_by_label_distribution(volume, labels, patch_size, _identity_function,
+                                                                 center_index=center_index)
     return volume_patch, seg_patch
\ No newline at end of file
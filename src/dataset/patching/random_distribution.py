@@ -1,5 +1,5 @@
 import numpy as np
-from src.dataset.patching.commons import array4d_crop, fix_crop_center_3d
+from src.dataset.patching.commons import array4d_crop, fix_crop_center_3d, crop_patch
 
 
 def _select_random_start_in_tumor(brain_mask, patch_size):
@@ -13,10 +13,21 @@ def _select_random_start_in_tumor(brain_mask, patch_size):
     return fix_crop_center_3d(brain_mask, patch_size, center_coord)
 
 
-def patching(volume: np.ndarray, labels: np.ndarray, patch_size: tuple, mask: np.ndarray):
+def select_start(center_index) -> tuple:
+    """
+    Patch start chosen from the CenterIndex only, so just the patch region has to be read
+    """
+    return center_index.random_start()
+
+
+def patching(volume: np.ndarray, labels: np.ndarray, patch_size: tuple, mask: np.ndarray, center_index=None):
     """
     Randomly chosen inside the tumor region
+    :param center_index: precomputed CenterIndex of the volume: the center is any brain voxel
     """
+    if center_index is not None:
+        return crop_patch(volume, labels, patch_size, select_start(center_index))
+
     center = _select_random_start_in_tumor(mask, patch_size)
     volume_patch = array4d_crop(volume, patch_size, center)
     seg_patch = array4d_crop(labels[None], patch_size, center)[0, :, :, :]
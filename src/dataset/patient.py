@@ -1,12 +1,17 @@
 import os
+from typing import Tuple
+
 import numpy as np
 import nibabel as nib
-from src.dataset.utils.nifi_volume import load_nifi_volume
+from src.dataset.augmentations.data_normalization import zero_mean_unit_variance_normalization, \
+    normalize_with_statistics
+from src.dataset.utils import bounding_box as bbox_utils
+from src.dataset.utils.nifi_volume import load_nifi_volume, load_nifi_volumes
 
 
 class Patient:
     def __init__(self, idx: str, center: str, grade: str, patient: str, patch_name: str,
-                 size: list, data_path: str, train: bool):
+                 size: list, data_path: str, train: bool, bounding_box: tuple = None, intensity_stats: dict = None):
 
         self.grade = grade
         self.center = center
@@ -16,6 +21,11 @@ class Patient:
         self.size = size
         self.patch_name = patch_name
         self.train = train
+        # brain bounding box (x_1, x_2, y_1, y_2, z_1, z_2), precomputed with compute_brain_bounding_boxes.py
+        self.bounding_box = bounding_box
+        # brain statistics of the raw modalities (see intensity_statistics), precomputed with
+        # compute_intensity_statistics.py
+        self.intensity_stats = intensity_stats
 
         extension = "nii.gz"
         self.t1ce = f"{self.patch_name}_t1ce.{extension}"
@@ -24,23 +34,83 @@ class Patient:
         self.flair = f"{self.patch_name}_flair.{extension}"
         self.seg = f"{self.patch_name}_seg.{extension}"
 
-    def load_mri_volumes(self, normalize) -> np.ndarray:
+    def load_mri_volumes(self, normalize, num_threads: int = 1) -> np.ndarray:
+        """
+        :param num_threads: if bigger than 1, the modalities are decoded concurrently in a thread pool
+        """
         patient_path = os.path.join(self.data_path, self.patch_name)
+        paths = [os.path.join(patient_path, modality) for modality in (self.flair, self.t1, self.t2, self.t1ce)]
 
-        flair = load_nifi_volume(os.path.join(patient_path, self.flair), normalize)
-        t1 = load_nifi_volume(os.path.join(patient_path, self.t1), normalize)
-        t2 = load_nifi_volume(os.path.join(patient_path, self.t2), normalize)
-        t1_ce = load_nifi_volume(os.path.join(patient_path, self.t1ce), normalize)
+        flair, t1, t2, t1_ce = load_nifi_volumes(paths, normalize, num_threads)
         modalities = np.stack((flair, t1, t2, t1_ce))
 
         return modalities
 
+    def load_all(self, normalize: bool = True, with_segmentation: bool = True, num_threads: int = 1,
+                 bounding_box: tuple = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Decode each file of the patient exactly once. The brain mask is built from the raw FLAIR volume
+        before normalizing it, instead of decoding the FLAIR file a second time.
+        :param num_threads: if bigger than 1, the files are decoded concurrently in a thread pool
+        :param bounding_box: if set, volumes are cropped to it (see get_bounding_box). The brain is inside the box,
+                             so the normalization is the same as in the full volume
+        With precomputed intensity_stats the normalization is a single pass over the stacked modalities with their
+        mean and std, instead of computing them from the volumes.
+        :return: modalities [C, W, H, D], segmentation [W, H, D] (None if not requested or not available) and
+                 brain mask [W, H, D]
+        """
+        patient_path = os.path.join(self.data_path, self.patch_name)
+        paths = [os.path.join(patient_path, modality) for modality in (self.flair, self.t1, self.t2, self.t1ce)]
+        # flair is normalized once the brain mask is computed from the raw values
+        use_stats = normalize and self.intensity_stats is not None
+        normalize_flags = [False] + [normalize and not use_stats] * 3
+
+        seg_path = os.path.join(patient_path, self.seg)
+        load_segmentation = with_segmentation and os.path.exists(seg_path)
+        if load_segmentation:
+            paths.append(seg_path)
+            normalize_flags.append(False)
+
+        volumes = load_nifi_volumes(paths, normalize_flags, num_threads)
+        flair, t1, t2, t1_ce = volumes[:4]
+        segmentation = volumes[4] if load_segmentation else None
+
+        if bounding_box is not None:
+            flair, t1, t2, t1_ce = [bbox_utils.crop(volume, bounding_box) for volume in (flair, t1, t2, t1_ce)]
+            if segmentation is not None:
+                segmentation = bbox_utils.crop(segmentation, bounding_box)
+
+        brain_mask = self._create_brain_mask(flair)
+        if use_stats:
+            modalities = normalize_with_statistics(np.stack((flair, t1, t2, t1_ce)), self.intensity_stats["mean"],
+                                                   self.intensity_stats["std"])
+            return modalities, segmentation, brain_mask
+
+        if normalize:
+            flair = zero_mean_unit_variance_normalization(flair)
+        modalities = np.stack((flair, t1, t2, t1_ce))
+
+        return modalities, segmentation, brain_mask
+
+    def get_bounding_box(self, min_size: tuple = None, multiple: int = 1) -> tuple:
+        """
+        Brain bounding box grown to at least min_size and to a multiple of `multiple` on every side.
+        It is also the offset needed to paste predictions back with bounding_box.paste.
+        :return: x_1, x_2, y_1, y_2, z_1, z_2 or None if it was not precomputed
+        """
+        if self.bounding_box is None:
+            return None
+        return bbox_utils.expand_bounding_box(self.bounding_box, self.size, min_size, multiple)
+
     def get_brain_mask(self):
         patient_path = os.path.join(self.data_path, self.patch_name)
         data = load_nifi_volume(os.path.join(patient_path, self.flair), False)
+        return self._create_brain_mask(data)
 
-        brain_mask = np.zeros(data.shape, np.float)
-        brain_mask[data > 0] = 1
+    @staticmethod
+    def _create_brain_mask(flair: np.ndarray) -> np.ndarray:
+        brain_mask = np.zeros(flair.shape, np.uint8)
+        brain_mask[flair > 0] = 1
         return brain_mask
 
     def load_gt_mask(self) -> np.ndarray:
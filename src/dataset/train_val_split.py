@@ -11,11 +11,12 @@ def add_patch(patches_by_patient: dict, index: int, patient: str):
     patches_by_patient[patient].append(index)
 
 
-def get_split_random(data: np.array, patches_by_patient: dict, val_size: float) -> Tuple[List, List]:
+def get_split_random(data: np.array, patches_by_patient: dict, val_size: float,
+                     rng: random.Random = random) -> Tuple[List, List]:
     patches_by_patient = list(patches_by_patient.values())
     val_n_elements = int(len(patches_by_patient) * val_size)
 
-    validation_patient_indices = random.sample(range(0, len(patches_by_patient)), val_n_elements)
+    validation_patient_indices = rng.sample(range(0, len(patches_by_patient)), val_n_elements)
 
     train_patients, val_patients  = [], []
     for patient_index, sublist in enumerate(patches_by_patient):
@@ -29,7 +30,11 @@ def get_split_random(data: np.array, patches_by_patient: dict, val_size: float)
 
 
 
-def train_val_split(data: list, val_size: float=0.25) -> Tuple[List, List]:
+def train_val_split(data: list, val_size: float=0.25, seed: int=None) -> Tuple[List, List]:
+    """
+    :param seed: seed of the split. Processes that train together (e.g. the ranks of a distributed training) must use
+                 the same one so all of them get the same split. If None, the global random state is used
+    """
     patches_by_patient_lgg = {}
     patches_by_patient_hgg = {}
 
@@ -48,8 +53,9 @@ def train_val_split(data: list, val_size: float=0.25) -> Tuple[List, List]:
         else:
             print("Unknown grade")
 
-    train_patients_lgg, val_patients_lgg = get_split_random(data, patches_by_patient_lgg, val_size)
-    train, val = get_split_random(data, patches_by_patient_hgg, val_size)
+    rng = random.Random(seed) if seed is not None else random
+    train_patients_lgg, val_patients_lgg = get_split_random(data, patches_by_patient_lgg, val_size, rng)
+    train, val = get_split_random(data, patches_by_patient_hgg, val_size, rng)
 
     train.extend(train_patients_lgg)
     val.extend(val_patients_lgg)
@@ -0,0 +1,80 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def compute_bounding_box(brain_mask: np.ndarray) -> Tuple[int, int, int, int, int, int]:
+    """
+    Smallest box containing the brain
+    :return: x_1, x_2, y_1, y_2, z_1, z_2 with the end coordinates excluded
+    """
+    bounding_box = []
+    for axis in range(3):
+        other_axes = tuple(i for i in range(3) if i != axis)
+        indices = np.nonzero(np.any(brain_mask, axis=other_axes))[0]
+        bounding_box.extend([int(indices[0]), int(indices[-1]) + 1])
+    return tuple(bounding_box)
+
+
+def bounding_box_to_str(bounding_box: tuple) -> str:
+    """Same format as the Size column of the dataset csv: x_1:x_2xy_1:y_2xz_1:z_2"""
+    return "x".join(f"{bounding_box[2 * axis]}:{bounding_box[2 * axis + 1]}" for axis in range(3))
+
+
+def bounding_box_from_str(bounding_box: str) -> Tuple[int, int, int, int, int, int]:
+    return tuple(int(coordinate) for axis in bounding_box.split("x") for coordinate in axis.split(":"))
+
+
+def expand_bounding_box(bounding_box: tuple, volume_size: tuple, min_size: tuple = None,
+                        multiple: int = 1) -> Tuple[int, int, int, int, int, int]:
+    """
+    Grow the box around its center until every side is at least min_size and a multiple of `multiple`
+    (e.g. the total down sampling factor of the network), shifting it to keep it inside the volume.
+    A side bigger than the volume is centered on it and goes past its borders: crop pads it with zeros.
+    """
+    expanded = []
+    for axis in range(3):
+        start, end = bounding_box[2 * axis], bounding_box[2 * axis + 1]
+        size = max(end - start, min_size[axis] if min_size else 0)
+        size = int(np.ceil(size / multiple)) * multiple
+
+        if size > volume_size[axis]:
+            start = (volume_size[axis] - size) // 2
+        else:
+            start = max(0, start - (size - (end - start)) // 2)
+            start = min(start, volume_size[axis] - size)
+        expanded.extend([start, start + size])
+    return tuple(expanded)
+
+
+def _inside(bounding_box: tuple, volume_size: tuple) -> Tuple[tuple, tuple]:
+    """Slices of the part of the box inside the volume, in volume and in box coordinates"""
+    volume_region, box_region = [], []
+    for axis in range(3):
+        start, end = bounding_box[2 * axis], bounding_box[2 * axis + 1]
+        begin, stop = max(start, 0), min(end, volume_size[axis])
+        volume_region.append(slice(begin, stop))
+        box_region.append(slice(begin - start, stop - start))
+    return (Ellipsis,) + tuple(volume_region), (Ellipsis,) + tuple(box_region)
+
+
+def crop(volume: np.ndarray, bounding_box: tuple) -> np.ndarray:
+    """
+    Crop the last three axes, so it works for [W, H, D] and [C, W, H, D] volumes. The parts of the box outside of
+    the volume are zero padded
+    """
+    volume_region, box_region = _inside(bounding_box, volume.shape[-3:])
+    size = tuple(bounding_box[2 * axis + 1] - bounding_box[2 * axis] for axis in range(3))
+    if size == tuple(region.stop - region.start for region in volume_region[1:]):
+        return volume[volume_region]
+    output = np.zeros(volume.shape[:-3] + size, volume.dtype)
+    output[box_region] = volume[volume_region]
+    return output
+
+
+def paste(volume: np.ndarray, bounding_box: tuple, volume_size: tuple) -> np.ndarray:
+    """Inverse of crop: put the cropped volume (e.g. a prediction) back in a zero volume of the original size"""
+    output = np.zeros(volume.shape[:-3] + tuple(volume_size), volume.dtype)
+    volume_region, box_region = _inside(bounding_box, volume_size)
+    output[volume_region] = volume[box_region]
+    return output
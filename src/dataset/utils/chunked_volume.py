@@ -0,0 +1,99 @@
+import json
+import struct
+import zlib
+from itertools import product
+from typing import Tuple
+
+import numpy as np
+
+MAGIC = b"BRCHUNK1"
+
+
+def save_chunked(path: str, volume: np.ndarray, chunk_size: int = 32, level: int = 1):
+    """
+    Store a volume as independently compressed blocks of chunk_size^3 voxels, so a region can be read by
+    decompressing only the blocks it touches (a .nii.gz is a single gzip stream that has to be inflated from the
+    beginning). Leading axes (e.g. the modalities) are kept inside every block, chunking is done over the last three.
+
+    File layout: magic, header length (uint32), json header with dtype, shape, chunk size and the offset of each
+    block, followed by the zlib compressed blocks in C order of the block grid.
+    :param level: zlib compression level, the lowest ones are the fastest to decompress
+    """
+    volume = np.ascontiguousarray(volume)
+    spatial_shape = volume.shape[-3:]
+    grid = [int(np.ceil(dim / chunk_size)) for dim in spatial_shape]
+
+    blocks, offsets = [], [0]
+    for block in product(*[range(n) for n in grid]):
+        region = tuple(slice(index * chunk_size, (index + 1) * chunk_size) for index in block)
+        data = zlib.compress(np.ascontiguousarray(volume[(Ellipsis,) + region]).tobytes(), level)
+        blocks.append(data)
+        offsets.append(offsets[-1] + len(data))
+
+    header = json.dumps({"dtype": volume.dtype.str, "shape": list(volume.shape), "chunk_size": chunk_size,
+                         "grid": grid, "offsets": offsets}).encode()
+    with open(path, "wb") as chunked_file:
+        chunked_file.write(MAGIC)
+        chunked_file.write(struct.pack("<I", len(header)))
+        chunked_file.write(header)
+        for data in blocks:
+            chunked_file.write(data)
+
+
+class ChunkedVolume(object):
+    """
+    Read access to a volume written with save_chunked. Only the header is read when opening it
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as chunked_file:
+            if chunked_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a chunked volume")
+            header_length, = struct.unpack("<I", chunked_file.read(4))
+            header = json.loads(chunked_file.read(header_length))
+
+        self.dtype = np.dtype(header["dtype"])
+        self.shape = tuple(header["shape"])
+        self.chunk_size = header["chunk_size"]
+        self.grid = tuple(header["grid"])
+        self.offsets = header["offsets"]
+        self._data_start = len(MAGIC) + 4 + header_length
+
+    def read(self) -> np.ndarray:
+        return self.read_region((0, 0, 0), self.shape[-3:])
+
+    def read_region(self, start: tuple, size: tuple) -> np.ndarray:
+        """
+        :param start: first voxel of the region in the last three axes
+        :param size: size of the region in the last three axes
+        :return: region [..., *size], leading axes are read whole
+        """
+        start = [max(0, int(begin)) for begin in start]
+        end = [min(dim, begin + int(length)) for begin, length, dim in zip(start, size, self.shape[-3:])]
+        leading_shape = self.shape[:-3]
+        region = np.empty(leading_shape + tuple(e - b for b, e in zip(start, end)), dtype=self.dtype)
+
+        block_ranges = [range(b // self.chunk_size, (e - 1) // self.chunk_size + 1) for b, e in zip(start, end)]
+        with open(self.path, "rb") as chunked_file:
+            for block in product(*block_ranges):
+                block_data = self._read_block(chunked_file, block)
+                block_start = [index * self.chunk_size for index in block]
+
+                # intersection of the block and the region, in volume coordinates
+                low = [max(b, bs) for b, bs in zip(start, block_start)]
+                high = [min(e, bs + n) for e, bs, n in zip(end, block_start, block_data.shape[-3:])]
+                source = tuple(slice(lo - bs, hi - bs) for lo, hi, bs in zip(low, high, block_start))
+                target = tuple(slice(lo - b, hi - b) for lo, hi, b in zip(low, high, start))
+                region[(Ellipsis,) + target] = block_data[(Ellipsis,) + source]
+
+        return region
+
+    def _read_block(self, chunked_file, block: Tuple[int, int, int]) -> np.ndarray:
+        index = np.ravel_multi_index(block, self.grid)
+        chunked_file.seek(self._data_start + self.offsets[index])
+        data = zlib.decompress(chunked_file.read(self.offsets[index + 1] - self.offsets[index]))
+
+        block_shape = tuple(min(self.chunk_size, dim - position * self.chunk_size)
+                            for position, dim in zip(block, self.shape[-3:]))
+        return np.frombuffer(data, dtype=self.dtype).reshape(self.shape[:-3] + block_shape)
@@ -3,24 +3,31 @@ from typing import List, Tuple
 import numpy as np
 import csv
 from src.dataset.patient import Patient
+from src.dataset.utils.bounding_box import bounding_box_from_str
+from src.dataset.utils.intensity_statistics import load_statistics, statistics_path
 
 def read_brats(csv_path: str, lgg_only: bool=False) -> Tuple[List, List]:
     patients_test = []
     patients_train = []
+    # optional statistics, added by compute_intensity_statistics.py
+    intensity_stats = load_statistics(statistics_path(csv_path))
     with open(csv_path, 'r') as csvfile:
         reader = csv.reader(csvfile, skipinitialspace=True)
         next(reader, None)
         for row in reader:
             if lgg_only and row[1] == "HGG":
                 continue
+            # optional BBox column, added by compute_brain_bounding_boxes.py
+            bounding_box = bounding_box_from_str(row[7]) if len(row) > 7 and row[7] else None
             patients_train.append(Patient(idx=row[0], center=row[3], grade=row[1], patient=row[2], patch_name=row[4],
                                           size=list(map(int, row[5].split("x"))), data_path=os.path.dirname(csv_path),
-                                          train=True))
+                                          train=True, bounding_box=bounding_box,
+                                          intensity_stats=intensity_stats.get(row[4])))
     return patients_train, patients_test
 
 
 def create_roi_mask(data: np.ndarray) -> np.ndarray:
     # filter values bigger than 0
-    brain_mask = np.zeros(data.shape, np.float)
+    brain_mask = np.zeros(data.shape, np.uint8)
     brain_mask[data > 0] = 1
     return brain_mask
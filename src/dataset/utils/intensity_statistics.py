@@ -0,0 +1,65 @@
+import json
+import os
+from typing import Dict
+
+import numpy as np
+
+PERCENTILES = (1, 99)
+
+
+def statistics_path(csv_path: str) -> str:
+    """Statistics of the patients of a dataset csv are stored next to it"""
+    return f"{os.path.splitext(csv_path)[0]}_intensity_stats.json"
+
+
+def compute_statistics(modalities: np.ndarray, percentiles: tuple = PERCENTILES) -> Dict[str, list]:
+    """
+    Statistics of the brain (non-zero) voxels of each raw channel, the voxels used by
+    zero_mean_unit_variance_normalization
+    :param modalities: [C, W, H, D] raw volumes
+    :return: dict with the "mean", "std", "min", "max" and "p<q>" percentiles of each channel
+    """
+    stats = {"mean": [], "std": [], "min": [], "max": []}
+    stats.update({f"p{q}": [] for q in percentiles})
+
+    for modality in modalities:
+        non_zero = modality[modality > 0.0]
+        stats["mean"].append(float(non_zero.mean()))
+        stats["std"].append(float(non_zero.std()))
+        stats["min"].append(float(non_zero.min()))
+        stats["max"].append(float(non_zero.max()))
+        for q, value in zip(percentiles, np.percentile(non_zero, percentiles)):
+            stats[f"p{q}"].append(float(value))
+
+    return stats
+
+
+def normalized_statistics(stats: Dict[str, list], epsilon: float = 1e-8) -> Dict[str, np.ndarray]:
+    """
+    Statistics of the brain voxels of the normalized volumes, derived from the raw ones without reading the volumes.
+    The mean is 0 and the std 1 (up to epsilon), the rest are shifted and scaled like the voxels
+    """
+    mean = np.asarray(stats["mean"], np.float64)
+    std = np.asarray(stats["std"], np.float64) + epsilon
+    return {key: (np.asarray(values, np.float64) - mean) / std if key != "std" else (std - epsilon) / std
+            for key, values in stats.items()}
+
+
+def save_statistics(path: str, stats: Dict[str, dict]):
+    """
+    :param stats: statistics of each patient, by patch name
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as stats_file:
+        json.dump(stats, stats_file)
+    os.replace(tmp_path, path)
+
+
+def load_statistics(path: str) -> Dict[str, dict]:
+    """
+    :return: statistics of each patient by patch name, empty if they were not computed
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as stats_file:
+        return json.load(stats_file)
@@ -1,14 +1,15 @@
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence, Union
 
 import numpy as np
 import nibabel as nib
 from src.dataset.augmentations.data_normalization import zero_mean_unit_variance_normalization
+from src.dataset.brats_labels import map_labels
 
 
 def get_one_label_volume(mask: np.ndarray, label: int) -> np.ndarray:
     selector = lambda x: x if x == label else 0
-    vfunc = np.vectorize(selector)
-    return vfunc(mask)
+    return map_labels(mask, selector)
 
 
 def save_nifi_volume(volume:np.ndarray, path:str):
@@ -31,6 +32,23 @@ def load_nifi_volume(filepath: str, normalize: bool=False) -> np.ndarray:
     return img
 
 
+def load_nifi_volumes(filepaths: Sequence[str], normalize: Union[bool, Sequence[bool]] = False,
+                      num_threads: int = 1) -> List[np.ndarray]:
+    """
+    Load several volumes. With num_threads > 1 they are decoded concurrently in a thread pool: gzip inflation and
+    the nibabel scaling release the GIL, so the files of one patient decode in parallel.
+    :param normalize: one flag for all files or one flag per file
+    """
+    if isinstance(normalize, bool):
+        normalize = [normalize] * len(filepaths)
+
+    if num_threads <= 1:
+        return [load_nifi_volume(path, norm) for path, norm in zip(filepaths, normalize)]
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return list(executor.map(load_nifi_volume, filepaths, normalize))
+
+
 def load_nifi_volume_return_nib(filepath: str, normalize: bool=False):
     proxy_img = nib.load(filepath)
     proxy_img.uncache()
@@ -4,42 +4,57 @@ import matplotlib
 import time
 import numpy as np
 from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from nilearn.plotting import plot_anat
 from matplotlib import cm
 from skimage.transform import resize
 import io
 
 
-def plot_batch(batch, seg: bool = False, slice: int = 32, batch_size: int=4):
+def batch_slices(batch, seg: bool = False, slice: int = 32):
+    """
+    Copy of the slices plotted by plot_batch: [N, W, D] from the first channel of the modalities [N, C, W, H, D]
+    or from the segmentations [N, W, H, D]. Only these voxels are copied to the cpu
+    """
+    slices = batch[:, :, slice, :] if seg else batch[:, 0, :, slice, :]
+    return slices.detach().float().cpu().clone()
+
+
+def plot_slices(slices, seg: bool = False, batch_size: int = 4):
+    """
+    Plot the slices of batch_slices side by side as a png. The figure is rendered without pyplot, so it can be
+    called from a background thread
+    """
 
     def unnorm(data, epsilon=1e-8):
         non_zero = data[data > 0.0]
+        if non_zero.size == 0:
+            return data
         mean = non_zero.mean()
         std = non_zero.std() + epsilon
         out = data * std + mean
         out[data == 0] = 0
         return out
 
-    plt.figure(figsize=(10, 3.5))
-
-    for i, volume in enumerate(batch):
-        plt.subplot(1, batch_size + 1, i + 1)
-
-        img = volume[:, slice, :].T if seg else volume[0, :, slice, :].T
-
-        npimg = img.cpu().detach().numpy()
-        img = npimg if seg else unnorm(npimg)
-        plt.imshow(img, cmap="gray")
-        plt.axis("off")
+    fig = Figure(figsize=(10, 3.5))
+    FigureCanvasAgg(fig)
 
+    for i, img in enumerate(slices):
+        ax = fig.add_subplot(1, batch_size + 1, i + 1)
+        npimg = img.T.numpy()
+        ax.imshow(npimg if seg else unnorm(npimg), cmap="gray")
+        ax.axis("off")
 
     buf = io.BytesIO()
-    plt.savefig(buf, format='png')
+    fig.savefig(buf, format='png')
     buf.seek(0)
-    plt.close()
     return buf
 
 
+def plot_batch(batch, seg: bool = False, slice: int = 32, batch_size: int=4):
+    return plot_slices(batch_slices(batch, seg, slice), seg=seg, batch_size=batch_size)
+
 
 def plot_3_view(modal: str, vol: np.ndarray, s: int=100, discrete: bool=False,
                 color_map: str="gray", save: bool=True):
@@ -0,0 +1,204 @@
+import json
+import os
+from typing import Tuple
+
+import numpy as np
+
+from src.dataset import brats_labels
+from src.dataset.augmentations.data_normalization import brain_statistics, normalization_coefficients, \
+    normalize_with_statistics
+from src.dataset.patient import Patient
+from src.dataset.utils.chunked_volume import ChunkedVolume, save_chunked
+
+MODALITIES = "modalities"
+COMPACT_MODALITIES = "modalities_int16"
+SEGMENTATION = "seg"
+BRAIN_MASK = "brain_mask"
+
+
+class NormalizedVolume(object):
+    """
+    Raw int16 modalities [C, W, H, D] of a compact cache, normalized only when they are indexed: slicing a patch
+    or a bounding box normalizes just that region, and the memory map is never converted to float32 whole.
+    np.asarray normalizes the whole volume.
+    """
+
+    def __init__(self, raw: np.ndarray, mean: list, std: list):
+        self.raw = raw
+        self._scale, self._offset = normalization_coefficients(mean, std)
+        self.shape = raw.shape
+        self.ndim = raw.ndim
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, key) -> np.ndarray:
+        raw = self.raw[key]
+        # the coefficients are broadcast views, indexed like the volume so they match any region
+        scale = np.broadcast_to(self._scale, self.shape)[key]
+        offset = np.broadcast_to(self._offset, self.shape)[key]
+        return np.where(raw != 0, raw * scale + offset, 0).astype(np.float32, copy=False)
+
+    def __array__(self, dtype=None):
+        volume = self[...]
+        return volume if dtype is None else volume.astype(dtype, copy=False)
+
+
+def _cache_path(patient: Patient, cache_dir: str, name: str, extension: str = ".npy") -> str:
+    return os.path.join(cache_dir, patient.patch_name, f"{patient.patch_name}_{name}{extension}")
+
+
+def _stored_path(patient: Patient, cache_dir: str, name: str) -> str:
+    """
+    Path of a cached array, either a .npy file or a chunked volume. None if it is not cached
+    """
+    for extension in (".npy", ".chunks"):
+        path = _cache_path(patient, cache_dir, name, extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _format_paths(patient: Patient, cache_dir: str, compact: bool, chunked: bool) -> list:
+    """Paths of the arrays of a patient stored in the given format (the segmentation is optional and not included)"""
+    extension = ".chunks" if chunked else ".npy"
+    modalities = COMPACT_MODALITIES if compact else MODALITIES
+    return [_cache_path(patient, cache_dir, modalities, extension),
+            _cache_path(patient, cache_dir, BRAIN_MASK, extension),
+            _cache_path(patient, cache_dir, "stats", ".json")]
+
+
+def is_cached(patient: Patient, cache_dir: str, compact: bool = False, chunked: bool = False) -> bool:
+    """
+    Whether the patient is cached in the requested format. A cache built with other options is not valid
+    """
+    return all(os.path.exists(path) for path in _format_paths(patient, cache_dir, compact, chunked))
+
+
+def save_patient(patient: Patient, cache_dir: str, compact: bool = False, chunked: bool = False):
+    """
+    Decode the patient NIfTI volumes once and store them uncompressed so they can be memory mapped.
+    Modalities are stored stacked and normalized as float32, the brain mask as uint8 and the segmentation
+    (if available) as uint8 already converted to the consecutive labels used by the models.
+
+    With compact=True the modalities keep their raw intensities as int16 (half of float32) and the brain mean
+    and std of each channel are stored in a json sidecar, so the normalization is applied when they are read.
+    The sidecar also keeps the brain std of each normalized channel (for the intensity augmentations of patches),
+    so it is written for both formats.
+
+    With chunked=True every array is stored as compressed 32^3 blocks (see chunked_volume) instead of .npy files,
+    so region reads only decompress the blocks they touch.
+    """
+    os.makedirs(os.path.join(cache_dir, patient.patch_name), exist_ok=True)
+
+    def save(name, array):
+        if chunked:
+            save_chunked(_cache_path(patient, cache_dir, name, ".chunks"), array)
+        else:
+            np.save(_cache_path(patient, cache_dir, name), array)
+
+    # arrays of a previous format would be read instead of (or mixed with) the new ones
+    for name in (MODALITIES, COMPACT_MODALITIES, SEGMENTATION, BRAIN_MASK):
+        for extension in (".npy", ".chunks"):
+            path = _cache_path(patient, cache_dir, name, extension)
+            if os.path.exists(path):
+                os.remove(path)
+
+    modalities, segmentation, brain_mask = patient.load_all(normalize=not compact)
+
+    if compact:
+        compact_modalities = modalities.astype(np.int16)
+        if not np.array_equal(compact_modalities, modalities):
+            raise ValueError(f"Intensities of {patient.patch_name} can not be stored as int16")
+
+        if patient.intensity_stats:
+            mean, std = np.array(patient.intensity_stats["mean"]), np.array(patient.intensity_stats["std"])
+        else:
+            mean, std = brain_statistics(modalities)
+        save(COMPACT_MODALITIES, compact_modalities)
+        stats = {"mean": mean.tolist(), "std": std.tolist()}
+        modalities = normalize_with_statistics(modalities, mean, std)
+    else:
+        save(MODALITIES, modalities.astype(np.float32))
+        stats = {}
+
+    stats["brain_std"] = [float(np.std(modality[brain_mask == 1])) for modality in modalities]
+    with open(_cache_path(patient, cache_dir, "stats", ".json"), 'w') as stats_file:
+        json.dump(stats, stats_file)
+
+    save(BRAIN_MASK, brain_mask.astype(np.uint8))
+
+    if segmentation is not None:
+        segmentation = brats_labels.convert_from_brats_labels(segmentation)
+        save(SEGMENTATION, segmentation.astype(np.uint8))
+
+
+def load_patient(patient: Patient, cache_dir: str, mmap_mode: str = "r") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Open the cached volumes of a patient as memory maps: only the pages that are accessed are read from disk.
+    Compact modalities are a NormalizedVolume, normalized to float32 when a region of them is read. Chunked
+    volumes are decompressed whole.
+    :return: normalized modalities [C, W, H, D], segmentation [W, H, D] (None if not cached), brain mask [W, H, D]
+    """
+    return _read(patient, cache_dir, lambda path: _open(path, mmap_mode), lazy=True)
+
+
+def load_region(patient: Patient, cache_dir: str, start: tuple, size: tuple) -> Tuple[np.ndarray, np.ndarray,
+                                                                                      np.ndarray]:
+    """
+    Read only the region [start, start + size) of the cached volumes: memory maps are sliced before being copied
+    and chunked volumes only decompress the blocks of the region, so just that slab is read from disk (~1MB for a
+    64^3 patch instead of the whole patient).
+    :return: normalized modalities [C, *size], segmentation [*size] (None if not cached), brain mask [*size]
+    """
+    return _read(patient, cache_dir, lambda path: _open_region(path, start, size))
+
+
+def _read(patient: Patient, cache_dir: str, reader, lazy: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :param lazy: return compact modalities as a NormalizedVolume instead of normalizing all of them
+    """
+    compact_modalities_path = _stored_path(patient, cache_dir, COMPACT_MODALITIES)
+    if compact_modalities_path:
+        mean, std = _load_statistics(_cache_path(patient, cache_dir, "stats", ".json"))
+        raw = reader(compact_modalities_path)
+        modalities = NormalizedVolume(raw, mean, std) if lazy else normalize_with_statistics(raw, mean, std)
+    else:
+        modalities = reader(_stored_path(patient, cache_dir, MODALITIES))
+
+    brain_mask = reader(_stored_path(patient, cache_dir, BRAIN_MASK))
+    seg_path = _stored_path(patient, cache_dir, SEGMENTATION)
+    segmentation = reader(seg_path) if seg_path else None
+    return modalities, segmentation, brain_mask
+
+
+def _open(path: str, mmap_mode: str) -> np.ndarray:
+    if path.endswith(".chunks"):
+        return ChunkedVolume(path).read()
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def _open_region(path: str, start: tuple, size: tuple) -> np.ndarray:
+    if path.endswith(".chunks"):
+        return ChunkedVolume(path).read_region(start, size)
+    region = tuple(slice(begin, begin + length) for begin, length in zip(start, size))
+    return np.array(np.load(path, mmap_mode="r")[(Ellipsis,) + region])
+
+
+def load_brain_std(patient: Patient, cache_dir: str) -> np.ndarray:
+    """
+    Brain std [C] of each normalized channel, stored when the cache was built. None for caches built without it
+    """
+    stats_path = _cache_path(patient, cache_dir, "stats", ".json")
+    if not os.path.exists(stats_path):
+        return None
+    with open(stats_path, 'r') as stats_file:
+        stats = json.load(stats_file)
+    return np.array(stats["brain_std"]) if "brain_std" in stats else None
+
+
+def _load_statistics(stats_path: str) -> Tuple[list, list]:
+    with open(stats_path, 'r') as stats_file:
+        stats = json.load(stats_file)
+    return stats["mean"], stats["std"]
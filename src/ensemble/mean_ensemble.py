@@ -62,6 +62,7 @@ if __name__ == "__main__":
     models_gen_path = model_config.get("model_path")
     task = "ensemble_segmentation"
     compute_metrics = False
+    decoding_threads = dataset_config.getint("decoding_threads", fallback=1)
 
     model_vnet = load_model_1598550861(models_gen_path)
     model_2 = load_model_1598639885(models_gen_path)
@@ -73,11 +74,11 @@ if __name__ == "__main__":
     for idx in range(0, len(data)):
         results = {}
 
-        images = data[idx].load_mri_volumes(normalize=True)
+        images, _, brain_mask = data[idx].load_all(normalize=True, with_segmentation=False,
+                                                   num_threads=decoding_threads)
 
         x_1, x_2, y_1, y_2, z_1, z_2, images, brain_mask, patch_size = crop_no_patch(data[idx].size, images,
-                                                                                     data[idx].get_brain_mask(),
-                                                                                     sampling)
+                                                                                     brain_mask, sampling)
 
         _, prediction_four_channels_1 = predict.predict(model_vnet, images, device, False)
         _, prediction_four_channels_2 = predict.predict(model_2, images, device, False)
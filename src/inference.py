@@ -1,13 +1,13 @@
 import os
 import sys
 import torch
-from src.dataset.utils import nifi_volume
 import numpy as np
 
 from src.dataset import brats_labels
 from src.compute_metric_results import compute_wt_tc_et
 from src.config import BratsConfiguration
 from src.dataset.utils import dataset
+from src.dataset.utils import bounding_box as bbox_utils
 from src.models.io_model import load_model
 from src.models.unet3d import unet3d
 from src.models.vnet import vnet, asymm_vnet
@@ -75,11 +75,27 @@ def crop_no_patch(patch_size, images, brain_mask, sampling):
         return x_1, x_2, y_1, y_2, z_1, z_2, images, brain_mask, patch_size
 
 
+def crop_to_brain(patient, images, brain_mask, multiple=16):
+    """
+    Crop to the precomputed brain bounding box, grown to a size that the networks can down sample. Patients without
+    a precomputed box (e.g. a csv not processed by compute_brain_bounding_boxes.py) use the box of their brain mask
+    """
+    bounding_box = patient.get_bounding_box(multiple=multiple)
+    if bounding_box is None:
+        bounding_box = bbox_utils.expand_bounding_box(bbox_utils.compute_bounding_box(brain_mask), brain_mask.shape,
+                                                      multiple=multiple)
+    x_1, x_2, y_1, y_2, z_1, z_2 = bounding_box
+    new_size = (x_2 - x_1, y_2 - y_1, z_2 - z_1)
+    new_images = bbox_utils.crop(images, bounding_box)
+    new_brain_mask = bbox_utils.crop(brain_mask, bounding_box)
+
+    return x_1, x_2, y_1, y_2, z_1, z_2, new_images, new_brain_mask, new_size
+
+
 def return_to_size(volume, sampling, x_1, x_2, y_1, y_2, z_1, z_2, final_size=(240, 240, 155)):
     if sampling == "no_patch":
-        output = np.zeros(final_size)
-        output[x_1:x_2, y_1:y_2, z_1:z_2] = volume
-        return output
+        # the brain box may go past the volume borders (zero padded), paste drops that part
+        return bbox_utils.paste(np.asarray(volume, np.float64), (x_1, x_2, y_1, y_2, z_1, z_2), final_size)
     else:
         return volume
 
@@ -109,16 +125,25 @@ if __name__ == "__main__":
     uncertainty_type = unc_config.get("uncertainty_type")
     n_iterations = unc_config.getint("n_iterations")
     use_dropout = unc_config.getboolean("use_dropout")
+    decoding_threads = dataset_config.getint("decoding_threads", fallback=1)
+    crop_brain = dataset_config.getboolean("crop_to_brain", fallback=False)
 
     for idx in range(0, len(data)):
 
         patch_size = data[idx].size
 
-        images = data[idx].load_mri_volumes(normalize=True)
-        brain_mask = data[idx].get_brain_mask()
+        images, volume_gt, full_brain_mask = data[idx].load_all(normalize=True, with_segmentation=compute_metrics,
+                                                                num_threads=decoding_threads)
 
-        x_1, x_2, y_1, y_2, z_1, z_2, images, brain_mask, patch_size = crop_no_patch(patch_size, images, brain_mask,
-                                                                                     sampling)
+        if crop_brain:
+            x_1, x_2, y_1, y_2, z_1, z_2, images, brain_mask, patch_size = crop_to_brain(data[idx], images,
+                                                                                         full_brain_mask)
+            # predictions are pasted back into the full volume as with the no_patch crop
+            paste_sampling = "no_patch"
+        else:
+            x_1, x_2, y_1, y_2, z_1, z_2, images, brain_mask, patch_size = crop_no_patch(patch_size, images,
+                                                                                         full_brain_mask, sampling)
+            paste_sampling = sampling
 
         results = {}
 
@@ -143,10 +168,10 @@ if __name__ == "__main__":
             wt_var, tc_var, et_var = uncertainty.get_variation_uncertainty(prediction_score_vectors, patch_size)
             global_unc = uncertainty.get_entropy_uncertainty(prediction_score_vectors, patch_size)
 
-            wt_var = return_to_size(wt_var, sampling, x_1, x_2, y_1, y_2, z_1, z_2)
-            tc_var = return_to_size(tc_var, sampling, x_1, x_2, y_1, y_2, z_1, z_2)
-            et_var = return_to_size(et_var, sampling, x_1, x_2, y_1, y_2, z_1, z_2)
-            global_unc = return_to_size(global_unc, sampling, x_1, x_2, y_1, y_2, z_1, z_2)
+            wt_var = return_to_size(wt_var, paste_sampling, x_1, x_2, y_1, y_2, z_1, z_2)
+            tc_var = return_to_size(tc_var, paste_sampling, x_1, x_2, y_1, y_2, z_1, z_2)
+            et_var = return_to_size(et_var, paste_sampling, x_1, x_2, y_1, y_2, z_1, z_2)
+            global_unc = return_to_size(global_unc, paste_sampling, x_1, x_2, y_1, y_2, z_1, z_2)
 
             task = f"uncertainty_task_{uncertainty_type}"
             results = {"whole": wt_var, "core": tc_var, "enhance": et_var, "entropy": global_unc}
@@ -163,7 +188,7 @@ if __name__ == "__main__":
             prediction_map = predict.get_prediction_map(prediction_four_channels)
 
         prediction_map = brats_labels.convert_to_brats_labels(prediction_map)
-        prediction_map = return_to_size(prediction_map, sampling, x_1, x_2, y_1, y_2, z_1, z_2)
+        prediction_map = return_to_size(prediction_map, paste_sampling, x_1, x_2, y_1, y_2, z_1, z_2)
 
         if flag_post_process:
             threshold = 1
@@ -179,15 +204,10 @@ if __name__ == "__main__":
         results["prediction"] = prediction_map
         predict.save_predictions(data[idx], results, model_path, task)
 
-        if compute_metrics:
-            patient_path = os.path.join(data[idx].data_path, data[idx].patch_name, data[idx].seg)
-            data_path = os.path.join(data[idx].data_path, data[idx].patch_name, data[idx].flair)
-
-            if os.path.exists(patient_path):
-                volume_gt = data[idx].load_gt_mask()
-                volume = nifi_volume.load_nifi_volume(data_path)
-                metrics = compute_wt_tc_et(prediction_map, volume_gt, volume)
-                logger.info(f"{data[idx].patient} | {metrics}")
+        if compute_metrics and volume_gt is not None:
+            # the brain mask is the flair roi, no need to decode the flair again
+            metrics = compute_wt_tc_et(prediction_map, volume_gt, full_brain_mask)
+            logger.info(f"{data[idx].patient} | {metrics}")
 
     print("Normalize uncertainty for brats!")
     if uncertainty_flag:
@@ -1,21 +1,58 @@
-
-
-
-class AverageMeter(object):
-    """Computes and stores the average and current value"""
-    def __init__(self):
-        self.reset()
-
-    def reset(self):
-        self.sum = 0
-        self.count = 0
-
-    def update(self, val, n=1):
-        self.sum += val * n
-        self.count += n
-
-    def avg(self):
-        return self.sum / self.count
-
-
-
+from typing import Dict
+
+import torch
+
+
+class MetricsAccumulator(object):
+    """
+    Weighted averages of the metrics of an epoch and their TensorBoard scalars of each step. Values are kept as
+    tensors on their device and copied to the host in one transfer every flush_steps steps (and at the end of the
+    epoch), instead of a .item() sync and an event write per metric and step.
+    """
+
+    def __init__(self, writer=None, flush_steps: int = 50):
+        """
+        :param writer: SummaryWriter for the per step scalars. If None only the averages are computed
+        :param flush_steps: steps between transfers to the host
+        """
+        self.writer = writer
+        self.flush_steps = flush_steps
+        self._sums = {}
+        self._counts = {}
+        self._pending = []
+        self._pending_steps = 0
+
+    def update(self, metrics: Dict[str, torch.Tensor], n: int = 1, step: int = None):
+        """
+        :param metrics: scalar tensor of each tag
+        :param n: number of samples of the batch, weight of the values in the averages
+        :param step: global step of the scalars, not written to TensorBoard if None
+        """
+        for tag, value in metrics.items():
+            value = torch.as_tensor(value).detach().float()
+            self._sums[tag] = self._sums[tag] + value * n if tag in self._sums else value * n
+            self._counts[tag] = self._counts.get(tag, 0) + n
+            if step is not None and self.writer is not None:
+                self._pending.append((tag, step, value))
+
+        self._pending_steps += 1
+        if self._pending_steps >= self.flush_steps:
+            self.flush()
+
+    def flush(self):
+        """Write the pending scalars to TensorBoard"""
+        if self._pending:
+            values = torch.stack([value for _, _, value in self._pending]).tolist()
+            for (tag, step, _), value in zip(self._pending, values):
+                self.writer.add_scalar(tag, value, step)
+        self._pending = []
+        self._pending_steps = 0
+
+    def averages(self) -> Dict[str, float]:
+        """Weighted average of each tag since the accumulator was created. Pending scalars are written first"""
+        self.flush()
+        if not self._sums:
+            return {}
+        tags = list(self._sums.keys())
+        sums = torch.stack([self._sums[tag] for tag in tags]).tolist()
+        return {tag: total / self._counts[tag] for tag, total in zip(tags, sums)}
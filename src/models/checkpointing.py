@@ -0,0 +1,26 @@
+import inspect
+
+from torch.utils.checkpoint import checkpoint as torch_checkpoint
+
+# the non reentrant implementation also computes the gradients of the parameters when no input requires grad
+_NON_REENTRANT = "use_reentrant" in inspect.signature(torch_checkpoint).parameters
+
+
+def checkpoint(module, *inputs):
+    """
+    Run the module without storing its intermediate activations: only its inputs are kept and its forward pass is
+    recomputed during the backward pass. Dropout masks are the same in both passes (the RNG state is restored).
+    With older torch versions at least one input must require grad, so the first level of a network (whose input is
+    the image) is only checkpointed when checkpoints_input_level() is True.
+    """
+    if _NON_REENTRANT:
+        return torch_checkpoint(module, *inputs, use_reentrant=False)
+    return torch_checkpoint(module, *inputs)
+
+
+def checkpoints_input_level() -> bool:
+    """
+    Whether the first level of a network can be checkpointed. It holds the largest activations, but its input (the
+    image) does not require grad, which only the non reentrant implementation supports
+    """
+    return _NON_REENTRANT
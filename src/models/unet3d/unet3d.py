@@ -1,6 +1,7 @@
 import torch
 import torch.nn as nn
 
+from src.models.checkpointing import checkpoint, checkpoints_input_level
 from src.models.unet3d.building_blocks import Encoder, Decoder, DoubleConv, ExtResNetBlock
 from torchsummary import summary
 
@@ -40,13 +41,18 @@ class Abstract3DUNet(nn.Module):
         conv_kernel_size (int or tuple): size of the convolving kernel in the basic_module
         pool_kernel_size (int or tuple): the size of the window
         conv_padding (int or tuple): add zero-padding added to all three sides of the input
+        gradient_checkpointing (bool): if True, the activations inside each encoder and decoder are not stored during
+            training and are recomputed in the backward pass. Only the outputs of the levels are kept, which trades
+            an extra forward pass for much less activation memory. The first encoder is skipped on torch versions
+            without non reentrant checkpoints
     """
 
     def __init__(self, in_channels, out_channels, final_sigmoid, basic_module, f_maps=64, layer_order='gcr',
                  num_groups=8, num_levels=4,
-                 conv_kernel_size=3, pool_kernel_size=2, conv_padding=1, **kwargs):
+                 conv_kernel_size=3, pool_kernel_size=2, conv_padding=1, gradient_checkpointing=False, **kwargs):
 
         super(Abstract3DUNet, self).__init__()
+        self.gradient_checkpointing = gradient_checkpointing
 
         if isinstance(f_maps, int):
             f_maps = number_of_features_per_level(f_maps, num_levels=num_levels)
@@ -108,10 +114,13 @@ class Abstract3DUNet(nn.Module):
             self.final_activation = nn.Softmax(dim=1)
 
     def forward(self, x):
+        use_checkpoints = self.gradient_checkpointing and self.training and torch.is_grad_enabled()
+        first_level = checkpoints_input_level()
+
         # encoder part
         encoders_features = []
-        for encoder in self.encoders:
-            x = encoder(x)
+        for i, encoder in enumerate(self.encoders):
+            x = checkpoint(encoder, x) if use_checkpoints and (i > 0 or first_level) else encoder(x)
             # reverse the encoder outputs to be aligned with the decoder
             encoders_features.insert(0, x)
 
@@ -123,7 +132,7 @@ class Abstract3DUNet(nn.Module):
         for decoder, encoder_features in zip(self.decoders, encoders_features):
             # pass the output from the corresponding encoder and the output
             # of the previous decoder
-            x = decoder(encoder_features, x)
+            x = checkpoint(decoder, encoder_features, x) if use_checkpoints else decoder(encoder_features, x)
 
         x = self.final_conv(x)
 
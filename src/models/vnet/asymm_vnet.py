@@ -1,6 +1,8 @@
 import torch.nn as nn
 import torch
 from torchsummary import summary
+
+from src.models.checkpointing import checkpoint, checkpoints_input_level
 import torch.nn.functional as F
 
 
@@ -167,12 +169,16 @@ class OutputTransition(nn.Module):
 class VNet(nn.Module):
     """
     Implementations based on the Vnet paper: https://arxiv.org/abs/1606.04797
+    gradient_checkpointing: if True, the activations inside each down and up transition are recomputed in the backward
+    pass instead of being stored during training. The input transition too, unless checkpoints_input_level() is False
     """
-    def __init__(self, non_linearity="elu", in_channels=1, classes=4, init_features_maps=16, kernel_size=5, padding=2):
+    def __init__(self, non_linearity="elu", in_channels=1, classes=4, init_features_maps=16, kernel_size=5, padding=2,
+                 gradient_checkpointing=False):
         # input channels: the four modalities
         super(VNet, self).__init__()
         self.classes = classes
         self.in_channels = in_channels
+        self.gradient_checkpointing = gradient_checkpointing
 
         self.in_tr      = InputTransition(in_channels, init_features_maps, non_linearity=non_linearity, kernel_size=kernel_size, padding=padding)
         self.down_tr32  = DownTransition(init_features_maps, nConvs=1, non_linearity=non_linearity, kernel_size=kernel_size, padding=padding, dropout=True)
@@ -185,16 +191,21 @@ class VNet(nn.Module):
         self.up_tr32    = UpTransition(init_features_maps*4, init_features_maps*2, nConvs=1, non_linearity=non_linearity, kernel_size=kernel_size, padding=padding, dropout=True)
         self.out_tr     = OutputTransition(init_features_maps*2, classes, non_linearity, kernel_size, padding=padding)
 
+    def _level(self, transition, *inputs):
+        if self.gradient_checkpointing and self.training and torch.is_grad_enabled():
+            return checkpoint(transition, *inputs)
+        return transition(*inputs)
+
     def forward(self, x):
-        out16 = self.in_tr(x)
-        out32 = self.down_tr32(out16)
-        out64 = self.down_tr64(out32)
-        out128 = self.down_tr128(out64)
-        out256 = self.down_tr256(out128)
-        out = self.up_tr256(out256, out128)
-        out = self.up_tr128(out, out64)
-        out = self.up_tr64(out, out32)
-        out = self.up_tr32(out, out16)  # x) # add modalities at the last step, concatenated
+        out16 = self._level(self.in_tr, x) if checkpoints_input_level() else self.in_tr(x)
+        out32 = self._level(self.down_tr32, out16)
+        out64 = self._level(self.down_tr64, out32)
+        out128 = self._level(self.down_tr128, out64)
+        out256 = self._level(self.down_tr256, out128)
+        out = self._level(self.up_tr256, out256, out128)
+        out = self._level(self.up_tr128, out, out64)
+        out = self._level(self.up_tr64, out, out32)
+        out = self._level(self.up_tr32, out, out16)  # x) # add modalities at the last step, concatenated
         out = self.out_tr(out)
         return out
 
@@ -1,6 +1,8 @@
 import torch.nn as nn
 import torch
 from torchsummary import summary
+
+from src.models.checkpointing import checkpoint, checkpoints_input_level
 import torch.nn.functional as F
 
 
@@ -144,13 +146,16 @@ class OutputTransition(nn.Module):
 class VNet(nn.Module):
     """
     Implementations based on the Vnet paper: https://arxiv.org/abs/1606.04797
+    gradient_checkpointing: if True, the activations inside each down and up transition are recomputed in the backward
+    pass instead of being stored during training. The input transition too, unless checkpoints_input_level() is False
     """
 
     def __init__(self, elu=True, in_channels=1, classes=4,
-                 init_features_maps=16):  # input channels: the four modalities
+                 init_features_maps=16, gradient_checkpointing=False):  # input channels: the four modalities
         super(VNet, self).__init__()
         self.classes = classes
         self.in_channels = in_channels
+        self.gradient_checkpointing = gradient_checkpointing
 
         self.in_tr = InputTransition(in_channels, init_features_maps, elu=elu)
         self.down_tr32 = DownTransition(init_features_maps, 1, elu)
@@ -165,17 +170,22 @@ class VNet(nn.Module):
         self.up_tr32 = UpTransition(init_features_maps * 4, init_features_maps * 2, 1, elu)
         self.out_tr = OutputTransition(init_features_maps * 2, classes, elu)
 
+    def _level(self, transition, *inputs):
+        if self.gradient_checkpointing and self.training and torch.is_grad_enabled():
+            return checkpoint(transition, *inputs)
+        return transition(*inputs)
+
     def forward(self, x):
-        out16 = self.in_tr(x)
-        out32 = self.down_tr32(out16)
-        out64 = self.down_tr64(out32)
-        out128 = self.down_tr128(out64)
-        out256 = self.down_tr256(out128)
-        out = self.up_tr256(out256, out128)
-        out = self.up_tr128(out, out64)
+        out16 = self._level(self.in_tr, x) if checkpoints_input_level() else self.in_tr(x)
+        out32 = self._level(self.down_tr32, out16)
+        out64 = self._level(self.down_tr64, out32)
+        out128 = self._level(self.down_tr128, out64)
+        out256 = self._level(self.down_tr256, out128)
+        out = self._level(self.up_tr256, out256, out128)
+        out = self._level(self.up_tr128, out, out64)
         # out = self.up_tr128(out128, out64)
-        out = self.up_tr64(out, out32)
-        out = self.up_tr32(out, out16)
+        out = self._level(self.up_tr64, out, out32)
+        out = self._level(self.up_tr32, out, out16)
         out = self.out_tr(out)
         return out
 
@@ -32,7 +32,7 @@ if __name__ == "__main__":
         patient_name = uncertainty_map.split(".")[0].split("_unc")[0]
         path_gt = os.path.join(ground_truth_path, patient_name, f"{patient_name}_flair.nii.gz")
         flair = load_nifi_volume(path_gt, normalize=False)
-        brain_mask = np.zeros(flair.shape, np.float)
+        brain_mask = np.zeros(flair.shape, np.uint8)
         brain_mask[flair > 0] = 1
 
         path = os.path.join(input_dir, uncertainty_map)
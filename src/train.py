@@ -1,5 +1,6 @@
 import importlib
 import sys
+import numpy as np
 import torch
 from src.models.unet3d import unet3d
 from torchvision import transforms
@@ -16,12 +17,17 @@ from torch.optim import lr_scheduler
 from torch.utils.data import DataLoader
 from torch.utils.tensorboard import SummaryWriter
 from src.config import BratsConfiguration
-from src.dataset.augmentations import color_augmentations, spatial_augmentations
+from src.dataset.augmentations import color_augmentations, spatial_augmentations, batch_augmentations, \
+    data_normalization
 
 from src.dataset.utils import dataset, visualization as visualization
 from src.models.vnet import vnet, asymm_vnet
 from src.logging_conf import logger
-from src.dataset.loaders.brats_dataset import BratsDataset
+from src.dataset.loaders.brats_dataset import BratsDataset, collate_patches, patch_region_size
+from src.dataset.loaders.shared_store import SharedVolumeStore
+from src.dataset.loaders.batch_sampler import BratsPatchSampler, PatientDistributedSampler
+from src.train import distributed
+from torch.nn.parallel import DistributedDataParallel
 
 
 def num_params(net_params):
@@ -45,17 +51,26 @@ n_patches = dataset_config.getint("n_patches")
 n_classes = dataset_config.getint("classes")
 loss = model_config.get("loss")
 
-device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-logger.info(f"Device: {device}")
+# several processes when launched with torchrun, e.g. torchrun --nproc_per_node=8 src/train.py resources/config.ini
+rank, world_size, local_rank = distributed.init_distributed()
+device = torch.device("cuda", local_rank) if torch.cuda.is_available() else torch.device("cpu")
+logger.info(f"Device: {device}, rank {rank} of {world_size}")
 
 
 ######## DATASET
 logger.info("Creating Dataset...")
 
 data, _ = dataset.read_brats(dataset_config.get("train_csv"), lgg_only=dataset_config.getboolean("lgg_only"))
-data_train, data_val = train_val_split(data, val_size=0.2)
-data_train = data_train * n_patches
-data_val = data_val * n_patches
+# the same seed on every rank, so all of them train and validate on the same patients
+data_train, data_val = train_val_split(data, val_size=0.2, seed=dataset_config.getint("split_seed", fallback=0))
+
+# several patches of each loaded volume instead of repeating the patients
+patches_per_volume = dataset_config.getint("patches_per_volume", fallback=1) if basic_config.getboolean("compute_patches") else 1
+if n_patches % patches_per_volume or batch_size % patches_per_volume:
+    raise ValueError(f"n_patches ({n_patches}) and batch_size ({batch_size}) must be multiples of patches_per_volume "
+                     f"({patches_per_volume})")
+data_train = data_train * max(1, n_patches // patches_per_volume)
+data_val = data_val * max(1, n_patches // patches_per_volume)
 
 n_modalities = dataset_config.getint("n_modalities")  # like color channels
 sampling_method = importlib.import_module(dataset_config.get("sampling_method"))
@@ -66,15 +81,99 @@ transform = transforms.Compose([color_augmentations.RandomIntensityShift(),
                                 spatial_augmentations.RandomMirrorFlip(p=0.5),
                                 spatial_augmentations.RandomRotation90(p=0.5)])
 
+if dataset_config.getboolean("affine_augmentation", fallback=False):
+    # rotation, scaling, flips and elastic deformation resampled once (use patch_margin with augment_patches)
+    transform = transforms.Compose([color_augmentations.RandomIntensityShift(),
+                                    color_augmentations.RandomIntensityScale(),
+                                    spatial_augmentations.RandomAffine(p=0.5, elastic_alpha=dataset_config.getfloat(
+                                        "elastic_alpha", fallback=0.))])
+
+if dataset_config.getboolean("noise_augmentations", fallback=False):
+    # gaussian noise in the brain and misaligned modalities
+    transform = transforms.Compose(transform.transforms + [color_augmentations.RandomGaussianNoise(p=0.5),
+                                                           data_normalization.ChannelTranslation(
+                                                               max_shifts={'z': 2, 'y': 2, 'x': 2})])
+
+# intensity augmentations and flips applied to the whole batch on the device by the trainer
+batch_transform = None
+train_transform = transform
+if dataset_config.getboolean("batch_augmentations", fallback=False):
+    batch_transforms = []
+    if dataset_config.getboolean("noise_augmentations", fallback=False):
+        # first, while the background is still zero: the shift moves every voxel
+        batch_transforms.append(batch_augmentations.BatchGaussianNoise(p=0.5))
+    batch_transforms += [batch_augmentations.BatchIntensityShift(), batch_augmentations.BatchIntensityScale(),
+                         batch_augmentations.BatchMirrorFlip(p=0.5)]
+    if dataset_config.getboolean("batch_gamma_correction", fallback=False):
+        # it also changes the background, so it goes after the transforms that find the brain voxels
+        batch_transforms.append(batch_augmentations.BatchGammaCorrection(p=0.5))
+    batch_transform = transforms.Compose(batch_transforms)
+    # the workers keep the transforms that have no batch version (rot90, affine, channel translation)
+    batch_replaced = (color_augmentations.RandomIntensityShift, color_augmentations.RandomIntensityScale,
+                      color_augmentations.RandomGaussianNoise, spatial_augmentations.RandomMirrorFlip)
+    train_transform = transforms.Compose([worker_transform for worker_transform in transform.transforms
+                                          if not isinstance(worker_transform, batch_replaced)])
 
-compute_patch = basic_config.getboolean("compute_patches")
-train_dataset = BratsDataset(data_train, sampling_method, patch_size, compute_patch=compute_patch, transform=transform)
-train_loader = DataLoader(dataset=train_dataset, batch_size=batch_size, shuffle=True, num_workers=4)
 
-val_dataset = BratsDataset(data_val, sampling_method, patch_size, compute_patch=compute_patch, transform=transform)
-val_loader = DataLoader(dataset=val_dataset, batch_size=batch_size, shuffle=True, num_workers=4)
+compute_patch = basic_config.getboolean("compute_patches")
+cache_dir = dataset_config.get("volume_cache_path") if dataset_config.getboolean("use_volume_cache", fallback=False) else None
+cache_max_bytes = dataset_config.getint("patient_cache_mb", fallback=0) * 1024 ** 2
+crop_to_brain = dataset_config.getboolean("crop_to_brain", fallback=False)
+use_center_index = dataset_config.getboolean("use_center_index", fallback=False)
+center_index_dir = dataset_config.get("center_index_path", fallback=None) or None
+region_reads = dataset_config.getboolean("region_reads", fallback=False)
+augment_patches = dataset_config.getboolean("augment_patches", fallback=False)
+data_dtype = np.dtype(dataset_config.get("data_dtype", fallback="float32"))
+patch_margin = dataset_config.getint("patch_margin", fallback=0)
+shared_store = None
+if dataset_config.getboolean("shared_memory_store", fallback=False):
+    # only the patients used for training and validation, each of them once. Cropped volumes keep at least the region
+    # that the dataset crops around each patch
+    region_size = patch_region_size(patch_size, (augment_patches or region_reads) and compute_patch, patch_margin)
+    shared_store = SharedVolumeStore(data_train + data_val, n_modalities, crop_to_brain=crop_to_brain,
+                                     max_bytes=dataset_config.getint("shared_memory_store_mb", fallback=0) * 1024 ** 2,
+                                     min_size=region_size if compute_patch else None)
+
+# batch_size counts patches: each loaded volume gives patches_per_volume of them
+collate_fn = collate_patches if patches_per_volume > 1 else None
+loader_batch_size = max(1, batch_size // patches_per_volume) if collate_fn else batch_size
+if crop_to_brain and not compute_patch and loader_batch_size > 1:
+    raise ValueError("Volumes cropped to the brain have different sizes, use batch_size 1 or compute_patches")
+
+train_dataset = BratsDataset(data_train, sampling_method, patch_size, compute_patch=compute_patch,
+                             transform=train_transform,
+                             cache_dir=cache_dir, cache_max_bytes=cache_max_bytes, shared_store=shared_store,
+                             crop_to_brain=crop_to_brain, use_center_index=use_center_index,
+                             patches_per_volume=patches_per_volume, region_reads=region_reads,
+                             augment_patches=augment_patches, patch_margin=patch_margin,
+                             dtype=data_dtype, center_index_dir=center_index_dir)
+if world_size > 1:
+    # each rank loads the volumes of a different set of patients, batch_size is the batch of each rank
+    train_loader = DataLoader(dataset=train_dataset, batch_size=loader_batch_size, num_workers=4,
+                              sampler=PatientDistributedSampler(train_dataset, world_size, rank), collate_fn=collate_fn)
+elif dataset_config.getboolean("use_patient_sampler", fallback=False):
+    # n_patches entries of each patient in a batch, all of them loaded by the same worker
+    sampler = BratsPatchSampler(train_dataset, n_patients=dataset_config.getint("n_patients_per_batch"),
+                                n_samples=n_patches, num_workers=4)
+    train_loader = DataLoader(dataset=train_dataset, batch_sampler=sampler, num_workers=4, collate_fn=collate_fn)
+else:
+    train_loader = DataLoader(dataset=train_dataset, batch_size=loader_batch_size, shuffle=True, num_workers=4,
+                              collate_fn=collate_fn)
+
+val_dataset = BratsDataset(data_val, sampling_method, patch_size, compute_patch=compute_patch, transform=transform,
+                           cache_dir=cache_dir, cache_max_bytes=cache_max_bytes, shared_store=shared_store,
+                           crop_to_brain=crop_to_brain, use_center_index=use_center_index,
+                           patches_per_volume=patches_per_volume, region_reads=region_reads,
+                           augment_patches=augment_patches, patch_margin=patch_margin,
+                           dtype=data_dtype, center_index_dir=center_index_dir)
+if world_size > 1:
+    val_loader = DataLoader(dataset=val_dataset, batch_size=loader_batch_size, num_workers=4, collate_fn=collate_fn,
+                            sampler=PatientDistributedSampler(val_dataset, world_size, rank, shuffle=False))
+else:
+    val_loader = DataLoader(dataset=val_dataset, batch_size=loader_batch_size, shuffle=True, num_workers=4,
+                            collate_fn=collate_fn)
 
-if basic_config.getboolean("plot"):
+if basic_config.getboolean("plot") and distributed.is_main_process():
     data_batch, labels_batch = next(iter(train_loader))
     data_batch.reshape(data_batch.shape[0] * data_batch.shape[1], data_batch.shape[2], data_batch.shape[3],
                        data_batch.shape[4], data_batch.shape[5])
@@ -90,29 +189,34 @@ if basic_config.getboolean("plot"):
 logger.info("Initiating Model...")
 
 config_network = model_config["network"]
+# recompute the activations of each level in the backward pass instead of storing them
+gradient_checkpointing = model_config.getboolean("gradient_checkpointing", fallback=False)
 if config_network== "vnet":
 
     network = vnet.VNet(elu=model_config.getboolean("use_elu"),
                         in_channels=n_modalities,
                         classes=n_classes,
-                        init_features_maps=model_config.getint("init_features_maps"))
+                        init_features_maps=model_config.getint("init_features_maps"),
+                        gradient_checkpointing=gradient_checkpointing)
 
 elif config_network == "vnet_asymm":
     network = asymm_vnet.VNet(non_linearity=model_config.get("non_linearity"), in_channels=n_modalities, classes=n_classes,
                               init_features_maps=model_config.getint("init_features_maps"), kernel_size=model_config.getint("kernel_size"),
-                              padding=model_config.getint("padding"))
+                              padding=model_config.getint("padding"), gradient_checkpointing=gradient_checkpointing)
 
 elif config_network == "3dunet_residual":
 
     network = unet3d.ResidualUNet3D(in_channels=n_modalities, out_channels=n_classes, final_sigmoid=False,
                                     f_maps=model_config.getint("init_features_maps"), layer_order="crg",
-                                    num_levels=4, num_groups=4,conv_padding=1)
+                                    num_levels=4, num_groups=4,conv_padding=1,
+                                    gradient_checkpointing=gradient_checkpointing)
 
 elif config_network == "3dunet":
 
     network = unet3d.UNet3D(in_channels=n_modalities, out_channels=n_classes, final_sigmoid=False,
                                     f_maps=model_config.getint("init_features_maps"), layer_order="crg",
-                                    num_levels=4, num_groups=4,conv_padding=1)
+                                    num_levels=4, num_groups=4,conv_padding=1,
+                                    gradient_checkpointing=gradient_checkpointing)
 else:
     raise ValueError("Bad parameter for network {}".format(model_config.get("network")))
 
@@ -142,7 +246,11 @@ if basic_config.getboolean("resume"):
 else:
     start_epoch = 0
 
-writer = SummaryWriter(tensorboard_logdir)
+if world_size > 1:
+    # gradients are averaged between the ranks during the backward pass of every loss
+    network = DistributedDataParallel(network, device_ids=[local_rank] if torch.cuda.is_available() else None)
+
+writer = SummaryWriter(tensorboard_logdir) if distributed.is_main_process() else distributed.NullWriter()
 scheduler = lr_scheduler.ReduceLROnPlateau(optimizer, 'min', factor=model_config.getfloat("lr_decay"),
                                            patience=model_config.getint("patience"))
 
@@ -164,9 +272,16 @@ elif loss == "gdl":
 else:
     raise ValueError(f"Bad loss value {loss}. Expected ['dice', combined]")
 
-args = TrainerArgs(model_config.getint("n_epochs"), device, model_config.get("model_path"), loss)
-trainer = Trainer(args, network, optimizer, criterion, start_epoch, train_loader, val_loader, scheduler, writer)
+args = TrainerArgs(model_config.getint("n_epochs"), device, model_config.get("model_path"), loss,
+                   mixed_precision=model_config.getboolean("mixed_precision", fallback=False),
+                   image_log_steps=basic_config.getint("image_log_steps", fallback=100),
+                   metrics_flush_steps=basic_config.getint("metrics_flush_steps", fallback=50),
+                   step_timing=basic_config.getboolean("step_timing", fallback=False),
+                   step_timing_file=basic_config.get("step_timing_file", fallback=None))
+trainer = Trainer(args, network, optimizer, criterion, start_epoch, train_loader, val_loader, scheduler, writer,
+                  batch_transform=batch_transform)
 trainer.start(best_loss=best_loss)
+distributed.cleanup()
 
 
 print("Finished!")
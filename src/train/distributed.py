@@ -0,0 +1,56 @@
+import os
+from typing import List, Tuple
+
+import torch
+import torch.distributed as dist
+
+
+def init_distributed() -> Tuple[int, int, int]:
+    """
+    Join the process group described by the environment variables set by torchrun (RANK, WORLD_SIZE, LOCAL_RANK,
+    MASTER_ADDR, MASTER_PORT). NCCL is used when there are GPUs and gloo on CPU.
+    :return: rank, world size and local rank. (0, 1, 0) when the script was not launched with several processes
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size <= 1:
+        return 0, 1, 0
+
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    if torch.cuda.is_available():
+        torch.cuda.set_device(local_rank)
+    backend = "nccl" if torch.cuda.is_available() and dist.is_nccl_available() else "gloo"
+    dist.init_process_group(backend=backend, init_method="env://")
+    return dist.get_rank(), dist.get_world_size(), local_rank
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def is_main_process() -> bool:
+    """Rank 0 writes the checkpoints and the TensorBoard logs. True when training in a single process"""
+    return not is_distributed() or dist.get_rank() == 0
+
+
+def all_reduce_mean(values: List[float], device="cpu") -> List[float]:
+    """
+    Average some values (e.g. the epoch losses of each rank) over all ranks, so every rank takes the same decisions
+    (best checkpoint, learning rate). Returns them unchanged in a single process
+    """
+    if not is_distributed():
+        return list(values)
+    tensor = torch.tensor(values, dtype=torch.float64, device=device)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return (tensor / dist.get_world_size()).tolist()
+
+
+def cleanup():
+    if is_distributed():
+        dist.destroy_process_group()
+
+
+class NullWriter(object):
+    """SummaryWriter of the ranks other than 0: every call is ignored"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
@@ -0,0 +1,68 @@
+import queue
+import threading
+
+from PIL import Image
+from torchvision import transforms as T
+
+from src.dataset.utils.visualization import batch_slices, plot_slices
+from src.logging_conf import logger
+
+
+class AsyncImageLogger(object):
+
+    def __init__(self, writer, every_n_steps: int = 100, max_queue: int = 8):
+        """
+        Write images of the batches to TensorBoard from a background thread. The training thread only copies the
+        plotted slice of each batch, the figures are rendered and encoded by the thread.
+        :param every_n_steps: log the batches of one every n steps of each epoch. If 0, only the first step of the
+                              epoch is logged
+        :param max_queue: images waiting to be written. When the queue is full new images are dropped instead of
+                          blocking the training
+        """
+        self.writer = writer
+        self.every_n_steps = every_n_steps
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="image-logger", daemon=True)
+        self._thread.start()
+
+    def should_log(self, step: int) -> bool:
+        """
+        :param step: step inside the epoch
+        """
+        if self.every_n_steps <= 0:
+            return step == 0
+        return step % self.every_n_steps == 0
+
+    def log(self, batch, seg: bool, title: str, global_step: int = None):
+        """
+        :param batch: modalities [N, C, W, H, D] or segmentations [N, W, H, D], the middle slice of the H axis of each
+                      sample is plotted
+        """
+        slices = batch_slices(batch, seg=seg, slice=batch.shape[-2] // 2)
+        try:
+            self._queue.put_nowait((slices, seg, title, global_step))
+        except queue.Full:
+            logger.debug(f"Image logger queue full, {title} not logged")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            slices, seg, title, global_step = item
+            try:
+                image = T.ToTensor()(Image.open(plot_slices(slices, seg=seg, batch_size=len(slices))))
+                self.writer.add_image(title, image, global_step)
+            except Exception as e:
+                logger.warning(f"Could not log image {title}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until the queued images are written"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,107 @@
+import contextlib
+import json
+import time
+from collections import deque
+
+import numpy as np
+import torch
+
+PHASES = ("data", "to_device", "forward", "loss", "backward", "optimizer", "logging")
+
+
+class StepTimer(object):
+
+    def __init__(self, enabled: bool = False, device="cpu", writer=None, log_path: str = None, window: int = 100):
+        """
+        Time of each phase of the training steps, and samples/s and voxels/s of each step. Steps are written to
+        TensorBoard and to a JSON lines file, and summary() gives rolling percentiles of the last `window` steps.
+        When disabled every call returns immediately.
+        :param device: on CUDA the device is synchronized at the phase boundaries, so each phase measures its own
+                       kernels instead of the time to queue them
+        :param log_path: JSON lines file, one line per step
+        """
+        self.enabled = enabled
+        self.synchronize = enabled and torch.device(device).type == "cuda"
+        self.device = device
+        self.writer = writer
+        self._log_file = open(log_path, "a") if enabled and log_path else None
+        self._history = {name: deque(maxlen=window) for name in PHASES + ("step", "samples_per_sec",
+                                                                           "voxels_per_sec")}
+        self._step_phases = {}
+        self._step_start = None
+        self._last_end = None
+        self._disabled_phase = contextlib.nullcontext()
+
+    def _now(self) -> float:
+        if self.synchronize:
+            torch.cuda.synchronize(self.device)
+        return time.perf_counter()
+
+    def start_epoch(self):
+        """The first data wait of the epoch is measured from here"""
+        if self.enabled:
+            self._last_end = self._now()
+
+    def begin_step(self):
+        """Call as soon as the batch is received: the time since the previous step is the wait on the DataLoader"""
+        if not self.enabled:
+            return
+        self._step_start = self._now()
+        self._step_phases = {name: 0. for name in PHASES}
+        self._step_phases["data"] = self._step_start - (self._last_end or self._step_start)
+
+    def phase(self, name: str):
+        """Context manager adding the time of its block to the phase `name` of the current step"""
+        if not self.enabled:
+            return self._disabled_phase
+        return self._timed_phase(name)
+
+    @contextlib.contextmanager
+    def _timed_phase(self, name: str):
+        start = self._now()
+        yield
+        self._step_phases[name] += self._now() - start
+
+    def end_step(self, global_step: int, batch_shape: tuple):
+        """
+        :param batch_shape: shape of the inputs [N, C, W, H, D], to compute samples/s and voxels/s
+        """
+        if not self.enabled:
+            return
+        self._last_end = self._now()
+        step_time = self._last_end - self._step_start + self._step_phases["data"]
+        n_samples = batch_shape[0]
+        record = dict(self._step_phases, step=step_time, samples_per_sec=n_samples / step_time,
+                      voxels_per_sec=n_samples * int(np.prod(batch_shape[2:])) / step_time)
+
+        for name, value in record.items():
+            self._history[name].append(value)
+
+        if self.writer is not None:
+            for name in PHASES + ("step",):
+                self.writer.add_scalar(f"Timing/{name} (ms)", record[name] * 1000, global_step)
+            self.writer.add_scalar("Throughput/samples per sec", record["samples_per_sec"], global_step)
+            self.writer.add_scalar("Throughput/voxels per sec", record["voxels_per_sec"], global_step)
+
+        if self._log_file is not None:
+            self._log_file.write(json.dumps(dict(record, global_step=global_step)) + "\n")
+
+    def summary(self) -> str:
+        """Rolling percentiles (50, 90, 99) of the last steps"""
+        if not self.enabled or not self._history["step"]:
+            return ""
+        if self._log_file is not None:
+            self._log_file.flush()
+        lines = []
+        for name in PHASES + ("step",):
+            p50, p90, p99 = np.percentile(self._history[name], (50, 90, 99)) * 1000
+            lines.append(f"{name:>10} (ms): p50 {p50:8.1f} | p90 {p90:8.1f} | p99 {p99:8.1f}")
+        samples = np.percentile(self._history["samples_per_sec"], 50)
+        voxels = np.percentile(self._history["voxels_per_sec"], 50)
+        lines.append(f"throughput: {samples:.2f} samples/s | {voxels / 1e6:.2f} Mvoxels/s (median)")
+        return "\n".join(lines)
+
+    def close(self):
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
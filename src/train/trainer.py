@@ -1,25 +1,48 @@
+import contextlib
+
 import torch
-from PIL import Image
-from torchvision import transforms as T
 from tqdm import tqdm
 
-from src.dataset.utils.visualization import plot_batch
 from src.models.io_model import save_checkpoint, save_model
-from src.metrics.training_metrics import AverageMeter
+from src.train import distributed
+from src.train.image_logger import AsyncImageLogger
+from src.train.step_timer import StepTimer
+from src.metrics.training_metrics import MetricsAccumulator
 from src.logging_conf import logger
 
 
 class TrainerArgs:
-    def __init__(self, n_epochs=50, device="cpu", output_path="", loss="dice"):
+    def __init__(self, n_epochs=50, device="cpu", output_path="", loss="dice", mixed_precision=False,
+                 image_log_steps=100, metrics_flush_steps=50, step_timing=False, step_timing_file=None):
+        """
+        :param mixed_precision: run the forward passes with autocast, in bfloat16 on CPU and in float16 with a
+                                gradient scaler on CUDA. Losses are always computed in float32
+        :param image_log_steps: patches and predictions are written to TensorBoard every image_log_steps steps of
+                                each epoch (only on the first step if 0)
+        :param metrics_flush_steps: steps between copies of the accumulated metrics to the host (and TensorBoard)
+        :param step_timing: time the phases of each training step (see StepTimer). On CUDA it synchronizes the
+                            device, so it slows down the training a bit
+        :param step_timing_file: JSON lines file with the times of each step
+        """
         self.n_epochs = n_epochs
         self.device = device
         self.output_path = output_path
         self.loss = loss
+        self.mixed_precision = mixed_precision
+        self.image_log_steps = image_log_steps
+        self.metrics_flush_steps = metrics_flush_steps
+        self.step_timing = step_timing
+        self.step_timing_file = step_timing_file
 
 
 class Trainer:
 
-    def __init__(self, args, model, optimizer, criterion, start_epoch, train_loader, val_loader, lr_scheduler, writer):
+    def __init__(self, args, model, optimizer, criterion, start_epoch, train_loader, val_loader, lr_scheduler, writer,
+                 batch_transform=None):
+        """
+        :param batch_transform: augmentation of the (inputs, targets) training batches, applied on the device
+                                (see batch_augmentations)
+        """
         self.model = model
         self.optimizer = optimizer
         self.criterion = criterion
@@ -35,223 +58,265 @@ class Trainer:
 
         self.start_epoch = start_epoch
         self.args = args
+        self.batch_transform = batch_transform
+        # images are rendered in a background thread, only by rank 0
+        self.image_logger = AsyncImageLogger(writer, args.image_log_steps) if distributed.is_main_process() else None
+        self.timer = StepTimer(enabled=args.step_timing and distributed.is_main_process(), device=args.device,
+                               writer=writer, log_path=args.step_timing_file)
+
+        self.device_type = torch.device(args.device).type
+        self.mixed_precision = args.mixed_precision and hasattr(torch, "autocast")
+        if args.mixed_precision and not self.mixed_precision:
+            logger.warning("Mixed precision needs torch.autocast (torch >= 1.10), training in float32")
+        self.autocast_dtype = torch.float16 if self.device_type == "cuda" else torch.bfloat16
+        # float16 gradients underflow without loss scaling, bfloat16 has the float32 range
+        self.scaler = torch.cuda.amp.GradScaler() if self.mixed_precision and self.device_type == "cuda" else None
+
+    def _autocast(self):
+        if not self.mixed_precision:
+            return contextlib.nullcontext()
+        return torch.autocast(self.device_type, dtype=self.autocast_dtype)
+
+    def _forward(self, inputs, model=None):
+        """
+        Forward pass, in mixed precision if enabled. Predictions are returned in float32, so the losses and their
+        reductions are computed in float32 outside of autocast
+        :param model: model to run instead of self.model
+        """
+        with self._autocast():
+            predictions, _ = (model or self.model)(inputs)
+        return predictions.float()
+
+    def _criterion(self, predictions, targets):
+        with self.timer.phase("loss"):
+            return self.criterion(predictions, targets)
+
+    def _backward_step(self, loss):
+        with self.timer.phase("backward"):
+            if self.scaler is not None:
+                self.scaler.scale(loss).backward()
+            else:
+                loss.backward()
+
+        with self.timer.phase("optimizer"):
+            if self.scaler is not None:
+                self.scaler.step(self.optimizer)
+                self.scaler.update()
+            else:
+                self.optimizer.step()
+
+    def _unwrapped_model(self):
+        """The model without the DistributedDataParallel wrapper, so its checkpoints also load in a single process"""
+        return getattr(self.model, "module", self.model)
 
     def start(self, best_loss=1000):
         val_dice_score = 0
 
         for epoch in range(self.start_epoch, self.args.n_epochs):
+            for loader in (self.train_data_loader, self.valid_data_loader):
+                # distributed samplers draw a new split of the patients on each epoch
+                if hasattr(loader.sampler, "set_epoch"):
+                    loader.sampler.set_epoch(epoch)
 
             train_dice_loss, train_dice_score, train_combined_loss, train_ce_loss = self.train_epoch(epoch)
             val_dice_loss, val_dice_score, val_combined_loss, val_ce_loss = self.val_epoch(epoch)
 
+            # with several ranks all of them keep the averages, so they step the scheduler in the same way
+            train_dice_loss, train_dice_score, train_combined_loss, train_ce_loss, val_dice_loss, val_dice_score, \
+                val_combined_loss, val_ce_loss = distributed.all_reduce_mean(
+                    [train_dice_loss, train_dice_score, train_combined_loss, train_ce_loss, val_dice_loss,
+                     val_dice_score, val_combined_loss, val_ce_loss], self.args.device)
+
             val_loss = val_combined_loss if self.args.loss == "combined" else val_dice_loss
             if self.lr_scheduler:
                 self.lr_scheduler.step(val_loss)
 
-            self._epoch_summary(epoch, train_dice_loss, val_dice_loss, train_dice_score, val_dice_score,
-                                train_combined_loss, train_ce_loss, val_combined_loss, val_ce_loss)
-
             is_best = bool(val_loss < best_loss)
             best_loss = val_loss if is_best else best_loss
+
+            if not distributed.is_main_process():
+                continue
+
+            self._epoch_summary(epoch, train_dice_loss, val_dice_loss, train_dice_score, val_dice_score,
+                                train_combined_loss, train_ce_loss, val_combined_loss, val_ce_loss)
             save_checkpoint({
                 'epoch': epoch,
-                'model_state_dict': self.model.state_dict(),
+                'model_state_dict': self._unwrapped_model().state_dict(),
                 'optimizer_state_dict': self.optimizer.state_dict(),
                 'val_loss': best_loss,
                 'val_dice_score': val_dice_score
             }, is_best, self.args.output_path)
 
-        save_model({
-            'epoch': self.args.n_epochs + 1,
-            'model_state_dict': self.model.state_dict(),
-            'optimizer_state_dict': self.optimizer.state_dict(),
-            'val_loss': best_loss,
-            'val_dice_score': val_dice_score
-        }, self.args.output_path)
+        if self.image_logger:
+            self.image_logger.close()
+        self.timer.close()
+
+        if distributed.is_main_process():
+            save_model({
+                'epoch': self.args.n_epochs + 1,
+                'model_state_dict': self._unwrapped_model().state_dict(),
+                'optimizer_state_dict': self.optimizer.state_dict(),
+                'val_loss': best_loss,
+                'val_dice_score': val_dice_score
+            }, self.args.output_path)
 
     def train_epoch(self, epoch):
 
         self.model.train()
-        dice_loss_global, ce_loss_global, combined_loss_global = AverageMeter(), AverageMeter(), AverageMeter()
-        dice_score = AverageMeter()
+        metrics = MetricsAccumulator(self.writer, self.args.metrics_flush_steps)
+        self.timer.start_epoch()
 
         i = 0
         for data_batch, labels_batch in tqdm(self.train_data_loader, desc="Training epoch"):
             def step(trainer):
-                trainer.optimizer.zero_grad()
+                trainer.timer.begin_step()
+                with trainer.timer.phase("optimizer"):
+                    trainer.optimizer.zero_grad()
 
-                inputs = data_batch.float().to(trainer.args.device)
-                targets = labels_batch.float().to(trainer.args.device)
-                inputs.require_grad = True
+                with trainer.timer.phase("to_device"):
+                    # batches come as float16/float32 and uint8, converted once they are on the device
+                    inputs = data_batch.to(trainer.args.device, non_blocking=True).float()
+                    targets = labels_batch.to(trainer.args.device, non_blocking=True).float()
+                    if trainer.batch_transform:
+                        inputs, targets = trainer.batch_transform((inputs, targets))
+                    inputs.require_grad = True
 
-                if i == 0:
-                    self.writer.add_graph(trainer.model, inputs)
+                if i == 0 and distributed.is_main_process():
+                    with trainer.timer.phase("logging"):
+                        self.writer.add_graph(trainer._unwrapped_model(), inputs)
 
-                predictions, _ = trainer.model(inputs)
+                with trainer.timer.phase("forward"):
+                    predictions = trainer._forward(inputs)
 
                 if trainer.args.loss == "dice":
-                    dice_loss, mean_dice, per_channel_dice = trainer.criterion(predictions, targets)
+                    dice_loss, mean_dice, per_channel_dice = trainer._criterion(predictions, targets)
                     subregion_loss = []
-                    dice_loss.backward()
-                    trainer.optimizer.step()
+                    trainer._backward_step(dice_loss)
 
-                    trainer.writer.add_scalar('Training Dice Loss NCR', per_channel_dice[0].detach().item(),
-                                              epoch * trainer.number_train_data + i)
-                    trainer.writer.add_scalar('Training Dice Loss ED', per_channel_dice[1].detach().item(),
-                                              epoch * trainer.number_train_data + i)
-                    trainer.writer.add_scalar('Training Dice Loss ET', per_channel_dice[2].detach().item(),
-                                              epoch * trainer.number_train_data + i)
+                    step_metrics = {'Training Dice Loss NCR': per_channel_dice[0],
+                                    'Training Dice Loss ED': per_channel_dice[1],
+                                    'Training Dice Loss ET': per_channel_dice[2]}
 
                 elif trainer.args.loss == "both_dice":
-                    total_loss, dice_loss, mean_dice, dice_loss_reg, subregion_loss = trainer.criterion(predictions,
+                    total_loss, dice_loss, mean_dice, dice_loss_reg, subregion_loss = trainer._criterion(predictions,
                                                                                                         targets)
+                    trainer._backward_step(total_loss)
 
-                    total_loss.backward()
-                    trainer.optimizer.step()
-
-                    total_loss = total_loss.detach().item()
-                    dice_loss_reg = dice_loss_reg.detach().item()
-                    trainer.writer.add_scalar('Train combined Region-Dice Loss', total_loss,
-                                              epoch * trainer.number_train_data + i)
-                    trainer.writer.add_scalar('Train region dice loss', dice_loss_reg,
-                                              epoch * trainer.number_train_data + i)
+                    step_metrics = {'Train combined Region-Dice Loss': total_loss,
+                                    'Train region dice loss': dice_loss_reg}
 
                 elif trainer.args.loss == "gdl":
 
-                    dice_loss, mean_dice = trainer.criterion(predictions, targets)
+                    dice_loss, mean_dice = trainer._criterion(predictions, targets)
                     subregion_loss = []
-                    dice_loss.backward()
-                    trainer.optimizer.step()
+                    trainer._backward_step(dice_loss)
+
+                    step_metrics = {}
 
                 else:
-                    combined_loss, dice_loss, ce_loss, mean_dice, subregion_loss = trainer.criterion(predictions,
+                    combined_loss, dice_loss, ce_loss, mean_dice, subregion_loss = trainer._criterion(predictions,
                                                                                                      targets)
-                    combined_loss.backward()
-                    trainer.optimizer.step()
-
-                    combined_loss = combined_loss.detach().item()
-                    ce_loss = ce_loss.detach().item()
-
-                    combined_loss_global.update(combined_loss, data_batch.size(0))
-                    ce_loss_global.update(ce_loss, data_batch.size(0))
+                    trainer._backward_step(combined_loss)
 
-                    trainer.writer.add_scalar('Train combined CE-Dice Loss', combined_loss,
-                                              epoch * trainer.number_train_data + i)
-                    trainer.writer.add_scalar('Train Cross Entropy Loss', ce_loss,
-                                              epoch * trainer.number_train_data + i)
+                    step_metrics = {'Train combined CE-Dice Loss': combined_loss,
+                                    'Train Cross Entropy Loss': ce_loss}
 
-                dice_loss = dice_loss.detach().item()
-                mean_dice = mean_dice.detach().item()
-                dice_loss_global.update(dice_loss, data_batch.size(0))
-                dice_score.update(mean_dice, data_batch.size(0))
+                if len(subregion_loss) > 0:
+                    step_metrics.update({'Training Dice Loss WT': subregion_loss[0],
+                                         'Training Dice Loss TC': subregion_loss[1],
+                                         'Training Dice Loss ET': subregion_loss[2]})
 
-                if subregion_loss:
-                    trainer.writer.add_scalar('Training Dice Loss WT', subregion_loss[0].detach().item(),
-                                              epoch * trainer.number_train_data + i)
-                    trainer.writer.add_scalar('Training Dice Loss TC', subregion_loss[1].detach().item(),
-                                              epoch * trainer.number_train_data + i)
-                    trainer.writer.add_scalar('Training Dice Loss ET', subregion_loss[2].detach().item(),
-                                              epoch * trainer.number_train_data + i)
+                step_metrics.update({'Training Dice Loss': dice_loss, 'Training Dice Score': mean_dice})
+                global_step = epoch * trainer.number_train_data + i
+                with trainer.timer.phase("logging"):
+                    metrics.update(step_metrics, data_batch.size(0), global_step)
 
-                trainer.writer.add_scalar('Training Dice Loss', dice_loss, epoch * trainer.number_train_data + i)
-                trainer.writer.add_scalar('Training Dice Score', mean_dice, epoch * trainer.number_train_data + i)
+                    if trainer.image_logger and trainer.image_logger.should_log(i):
+                        # the batch the model saw: with batch augmentations it may be flipped
+                        trainer.image_logger.log(inputs, False, "Modality patch", global_step)
+                        trainer.image_logger.log(targets, True, "Segmentation ground truth patch", global_step)
+                        trainer.image_logger.log(predictions.max(1)[1], True, "Segmentation prediction patch",
+                                                 global_step)
 
-                trainer._add_image(data_batch, False, "Modality patch")
-                trainer._add_image(labels_batch, True, "Segmentation ground truth patch")
-                trainer._add_image(predictions.max(1)[1], True, "Segmentation prediction patch")
+                trainer.timer.end_step(global_step, inputs.shape)
 
             step(self)
 
             i += 1
 
+        averages = metrics.averages()
         if self.args.loss == "combined":
-            return dice_loss_global.avg(), dice_score.avg(), combined_loss_global.avg(), ce_loss_global.avg()
+            return averages['Training Dice Loss'], averages['Training Dice Score'], \
+                   averages['Train combined CE-Dice Loss'], averages['Train Cross Entropy Loss']
         else:
-            return dice_loss_global.avg(), dice_score.avg(), 0, 0
-
-    def _add_image(self, batch, seg=False, title=""):
-        plot_buf = plot_batch(batch, seg=seg, slice=16, batch_size=len(batch))
-        im = Image.open(plot_buf)
-        image = T.ToTensor()(im)
-        self.writer.add_image(title, image)
+            return averages['Training Dice Loss'], averages['Training Dice Score'], 0, 0
 
     def val_epoch(self, epoch):
         self.model.eval()
-        losses, ce_loss_global, combined_loss_global = AverageMeter(), AverageMeter(), AverageMeter()
-        dice_score = AverageMeter()
+        metrics = MetricsAccumulator(self.writer, self.args.metrics_flush_steps)
 
         i = 0
         for data_batch, labels_batch in tqdm(self.valid_data_loader, desc="Validation epoch"):
 
             def step(trainer):
 
-                inputs = data_batch.float().to(trainer.args.device)
-                targets = labels_batch.float().to(trainer.args.device)
+                # batches come as float16/float32 and uint8, converted once they are on the device
+                inputs = data_batch.to(trainer.args.device, non_blocking=True).float()
+                targets = labels_batch.to(trainer.args.device, non_blocking=True).float()
 
                 with torch.no_grad():
-                    outputs, _ = trainer.model(inputs)
+                    # no gradients to synchronize, each rank evaluates its own patients
+                    outputs = trainer._forward(inputs, trainer._unwrapped_model())
 
                     if trainer.args.loss == "dice":
-                        dice_loss, mean_dice, subregion_loss = trainer.criterion(outputs, targets)
+                        dice_loss, mean_dice, per_channel_dice = trainer.criterion(outputs, targets)
+                        subregion_loss = []
+                        step_metrics = {'Validation Dice Loss NCR': per_channel_dice[0],
+                                        'Validation Dice Loss ED': per_channel_dice[1],
+                                        'Validation Dice Loss ET': per_channel_dice[2]}
 
                     elif trainer.args.loss == "gdl":
                         dice_loss, mean_dice = trainer.criterion(outputs, targets)
                         subregion_loss = []
-
+                        step_metrics = {}
 
                     elif trainer.args.loss == "both_dice":
                         total_loss, dice_loss, mean_dice, dice_loss_reg, subregion_loss = trainer.criterion(outputs,
                                                                                                             targets)
-                        total_loss = total_loss.detach().item()
-                        dice_loss_reg = dice_loss_reg.detach().item()
-
-                        trainer.writer.add_scalar('Validation combined Region-Dice Loss', total_loss,
-                                                  epoch * trainer.number_val_data + i)
-                        trainer.writer.add_scalar('Validation region dice loss', dice_loss_reg,
-                                                  epoch * trainer.number_val_data + i)
-
+                        step_metrics = {'Validation combined Region-Dice Loss': total_loss,
+                                        'Validation region dice loss': dice_loss_reg}
 
                     else:
                         combined_loss, dice_loss, ce_loss, mean_dice, subregion_loss = trainer.criterion(outputs,
                                                                                                          targets)
-                        combined_loss = combined_loss.detach().item()
-                        ce_loss = ce_loss.detach().item()
-                        combined_loss_global.update(combined_loss, data_batch.size(0))
-                        ce_loss_global.update(ce_loss, data_batch.size(0))
-
-                        trainer.writer.add_scalar('Validation Combined CE-Dice Loss', combined_loss,
-                                                  epoch * trainer.number_val_data + i)
-                        trainer.writer.add_scalar('Validation Cross Entropy Loss', ce_loss,
-                                                  epoch * trainer.number_val_data + i)
-
-                    dice_loss = dice_loss.detach().item()
-                    mean_dice = mean_dice.detach().item()
-                    losses.update(dice_loss, data_batch.size(0))
-                    dice_score.update(mean_dice, data_batch.size(0))
-
-                if subregion_loss:
-                    trainer.writer.add_scalar('Validation Dice Loss WT', subregion_loss[0].detach().item(),
-                                              epoch * trainer.number_train_data + i)
-                    trainer.writer.add_scalar('Validation Dice Loss TC', subregion_loss[1].detach().item(),
-                                              epoch * trainer.number_train_data + i)
-                    trainer.writer.add_scalar('Validation Dice Loss ET', subregion_loss[2].detach().item(),
-                                              epoch * trainer.number_train_data + i)
-
-                trainer.writer.add_scalar('Validation Dice Loss', dice_loss, epoch * trainer.number_val_data + i)
-                trainer.writer.add_scalar('Validation Dice Score', mean_dice, epoch * trainer.number_val_data + i)
-
-                trainer._add_image(data_batch, False, "Val Modality patch")
-                trainer._add_image(labels_batch, True, "Val Segmentation ground truth patch")
-                trainer._add_image(outputs.max(1)[1], True, "Val Segmentation prediction patch")
+                        step_metrics = {'Validation Combined CE-Dice Loss': combined_loss,
+                                        'Validation Cross Entropy Loss': ce_loss}
+
+                if len(subregion_loss) > 0:
+                    step_metrics.update({'Validation Dice Loss WT': subregion_loss[0],
+                                         'Validation Dice Loss TC': subregion_loss[1],
+                                         'Validation Dice Loss ET': subregion_loss[2]})
+
+                step_metrics.update({'Validation Dice Loss': dice_loss, 'Validation Dice Score': mean_dice})
+                global_step = epoch * trainer.number_val_data + i
+                metrics.update(step_metrics, data_batch.size(0), global_step)
+
+                if trainer.image_logger and trainer.image_logger.should_log(i):
+                    trainer.image_logger.log(data_batch, False, "Val Modality patch", global_step)
+                    trainer.image_logger.log(labels_batch, True, "Val Segmentation ground truth patch", global_step)
+                    trainer.image_logger.log(outputs.max(1)[1], True, "Val Segmentation prediction patch",
+                                             global_step)
 
             step(self)
 
             i += 1
 
+        averages = metrics.averages()
         if self.args.loss == "combined":
-            return losses.avg(), dice_score.avg(), combined_loss_global.avg(), ce_loss_global.avg()
+            return averages['Validation Dice Loss'], averages['Validation Dice Score'], \
+                   averages['Validation Combined CE-Dice Loss'], averages['Validation Cross Entropy Loss']
         else:
-            return losses.avg(), dice_score.avg(), 0, 0
+            return averages['Validation Dice Loss'], averages['Validation Dice Score'], 0, 0
 
     def _epoch_summary(self, epoch, train_loss, val_loss, train_dice_score, val_dice_score, train_combined_loss,
                        train_ce_loss, val_combined_loss, val_ce_loss):
@@ -268,3 +333,6 @@ class Trainer:
                         f'** Dice Loss **      : train_loss: {train_loss:.2f} | val_loss {val_loss:.2f} \n'
                         f'** Dice Score **     : train_dice_score {train_dice_score:.2f} | val_dice_score {val_dice_score:.2f}\n'
                         )
+
+        if self.timer.enabled:
+            logger.info(f'** Training step times ** (last steps)\n{self.timer.summary()}')
@@ -39,8 +39,9 @@ def brats_normalize(uncertainty_map: np.ndarray, max_unc: int, min_unc: int) ->
     minimum = 0
     maximum = 100
     step = (maximum - minimum) / (max_unc - min_unc)
-    vfunc = np.vectorize(lambda x: (x - min_unc) * step if x != 0 else 0)
-    return vfunc(uncertainty_map).astype(np.uint8)
+    # uncertainty values are not labels, so the mapping is done arithmetically instead of with a lookup table
+    normalized = np.where(uncertainty_map != 0, (uncertainty_map.astype(np.float64) - min_unc) * step, 0)
+    return normalized.astype(np.uint8)
 
 
 def compute_normalization(input_dir, output_dir, ground_truth_path):
@@ -57,7 +58,7 @@ def compute_normalization(input_dir, output_dir, ground_truth_path):
         patient_name = uncertainty_map.split(".")[0].split("_unc")[0]
         path_gt = os.path.join(ground_truth_path, patient_name, f"{patient_name}_flair.nii.gz")
         flair = nifi_volume.load_nifi_volume(path_gt, normalize=False)
-        brain_mask = np.zeros(flair.shape, np.float)
+        brain_mask = np.zeros(flair.shape, np.uint8)
         brain_mask[flair > 0] = 1
 
         path = os.path.join(input_dir, uncertainty_map)
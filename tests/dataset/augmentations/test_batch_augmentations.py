@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import torch
+
+from src.dataset.augmentations import batch_augmentations
+
+
+@pytest.fixture(scope="function")
+def batch():
+    inputs = torch.zeros((3, 4, 16, 16, 12))
+    inputs[:, :, 2:-2, 2:-2, 2:-2] = torch.randn((3, 4, 12, 12, 8))
+    targets = torch.randint(0, 4, (3, 16, 16, 12)).float()
+    return inputs, targets
+
+
+def test_brain_std(batch):
+    inputs, _ = batch
+    std = batch_augmentations.brain_std(inputs)
+    assert std.shape == (3, 4, 1, 1, 1)
+    expected = np.std(inputs[1, 2][inputs[1, 2] != 0].numpy())
+    np.testing.assert_allclose(std[1, 2].item(), expected, rtol=1e-4)
+
+
+def test_intensity_transforms_keep_shape_and_targets(batch):
+    inputs, targets = batch
+    for transform in [batch_augmentations.BatchIntensityScale(), batch_augmentations.BatchIntensityShift(),
+                      batch_augmentations.BatchGaussianNoise(p=1), batch_augmentations.BatchGammaCorrection(p=1)]:
+        augmented_inputs, augmented_targets = transform((inputs, targets))
+        assert augmented_inputs.shape == inputs.shape
+        assert augmented_inputs.dtype == inputs.dtype
+        assert torch.equal(augmented_targets, targets)
+
+
+def test_noise_only_in_brain(batch):
+    inputs, targets = batch
+    noised, _ = batch_augmentations.BatchGaussianNoise(p=1, noise_variance=(0.5, 0.5))((inputs, targets))
+    assert torch.equal(noised[inputs == 0], inputs[inputs == 0])
+    assert not torch.equal(noised, inputs)
+
+
+def test_flip_moves_inputs_and_targets_together(batch):
+    inputs, targets = batch
+    flipped_inputs, flipped_targets = batch_augmentations.BatchMirrorFlip(p=1)((inputs, targets))
+    assert torch.equal(flipped_inputs, inputs.flip(dims=(2, 3, 4)))
+    assert torch.equal(flipped_targets, targets.flip(dims=(1, 2, 3)))
+
+    same_inputs, same_targets = batch_augmentations.BatchMirrorFlip(p=0)((inputs, targets))
+    assert torch.equal(same_inputs, inputs)
+    assert torch.equal(same_targets, targets)
+
+
+def test_shift_changes_the_background(batch):
+    # noise must run before the shift, afterwards the background is not zero anymore
+    inputs, targets = batch
+    shifted, _ = batch_augmentations.BatchIntensityShift(min=0.1, max=0.1)((inputs, targets))
+    assert (shifted[inputs == 0] != 0).all()
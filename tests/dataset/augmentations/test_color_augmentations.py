@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from src.dataset.augmentations.color_augmentations import RandomGaussianNoise
+
+
+@pytest.fixture(scope="function")
+def patient():
+    modalities = np.ones((4, 8, 8, 6), dtype=np.float32)
+    seg = np.zeros((8, 8, 6), dtype=np.uint8)
+    brain_mask = np.zeros((8, 8, 6), dtype=np.uint8)
+    brain_mask[2:6, 2:6, 1:5] = 1
+    return modalities, seg, brain_mask
+
+
+def test_gaussian_noise_only_in_brain(patient):
+    modalities, seg, brain_mask = patient
+    noised, noised_seg, noised_mask = RandomGaussianNoise(p=1, noise_variance=(0.5, 0.5), seed=0)(patient)
+
+    assert noised.dtype == np.float32
+    assert noised.shape == modalities.shape
+    assert noised_mask is brain_mask and noised_seg is seg
+    assert np.all(noised[:, brain_mask == 0] == 1)
+    assert np.all(noised[:, brain_mask == 1] != 1)
+
+
+def test_gaussian_noise_passes_statistics(patient):
+    stats = {"std": np.ones(4)}
+    result = RandomGaussianNoise(p=0, seed=0)(patient + (stats,))
+    assert result[0] is patient[0]
+    assert result[3] is stats
@@ -1,6 +1,10 @@
 import numpy as np
 import pytest
-from src.dataset.augmentations.data_normalization import zero_mean_unit_variance_normalization
+from torchvision import transforms
+
+from src.dataset.augmentations.color_augmentations import RandomIntensityScale
+from src.dataset.augmentations.data_normalization import zero_mean_unit_variance_normalization, brain_statistics, \
+    normalize_with_statistics, ChannelTranslation, GammaCorrection
 
 
 @pytest.fixture(scope="function")
@@ -19,4 +23,54 @@ def volume():
 def test_zero_mean_unit_variance_normalization(volume):
     normalized_volume = zero_mean_unit_variance_normalization(volume)
     assert round(normalized_volume[normalized_volume != 0].mean()) == 0.0
-    assert round(normalized_volume[normalized_volume != 0].std()) == 1.0
\ No newline at end of file
+    assert round(normalized_volume[normalized_volume != 0].std()) == 1.0
+
+
+def test_normalize_with_statistics(volume):
+    modalities = np.stack((volume, 2 * volume))
+    mean, std = brain_statistics(modalities)
+    normalized = normalize_with_statistics(modalities, mean, std)
+    assert normalized.dtype == np.float32
+    for channel in range(len(modalities)):
+        np.testing.assert_allclose(normalized[channel], zero_mean_unit_variance_normalization(modalities[channel]),
+                                   rtol=1e-5, atol=1e-5)
+
+
+def test_channel_translation_keeps_constant_channel():
+    np.random.seed(0)
+    modalities = np.random.rand(4, 10, 10, 10).astype(np.float32)
+    seg = np.zeros((10, 10, 10), dtype=np.uint8)
+    translated, _, _ = ChannelTranslation(const_channel=1, max_shifts={'z': 2, 'y': 2, 'x': 2})(
+        (modalities, seg, seg))
+
+    assert translated.shape == modalities.shape
+    assert translated.dtype == np.float32
+    np.testing.assert_array_equal(translated[1], modalities[1])
+
+
+def test_channel_translation_shift():
+    data = np.random.rand(1, 2, 6, 6).astype(np.float32)
+    translated = ChannelTranslation().augment_channel_translation(data, const_channel=0,
+                                                                  max_shifts={'y': 1, 'x': 1})
+    np.testing.assert_array_equal(translated[0, 0], data[0, 0])
+
+    # shifts are drawn from [-1, 0] in each axis, the uncovered border is zero
+    candidates = []
+    for shift_y in (-1, 0):
+        for shift_x in (-1, 0):
+            expected = np.zeros((6, 6), dtype=np.float32)
+            expected[:6 + shift_y, :6 + shift_x] = data[0, 1, -shift_y:, -shift_x:]
+            candidates.append(np.array_equal(translated[0, 1], expected))
+    assert any(candidates)
+
+
+@pytest.mark.parametrize("per_channel", [False, True])
+def test_gamma_correction_after_scale_with_statistics(per_channel):
+    modalities = np.random.randn(2, 8, 8, 8).astype(np.float32)
+    stats = {"min": modalities.reshape(2, -1).min(axis=1), "max": modalities.reshape(2, -1).max(axis=1)}
+    # the scaled sample goes past the min and max of the statistics
+    transform = transforms.Compose([RandomIntensityScale(min=1.5, max=1.5), GammaCorrection(per_channel=per_channel)])
+
+    for _ in range(20):
+        corrected = transform((modalities, None, None, stats))[0]
+        assert not np.isnan(corrected).any()
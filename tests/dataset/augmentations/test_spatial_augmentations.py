@@ -1,6 +1,6 @@
 import numpy as np
 import pytest
-from src.dataset.augmentations.spatial_augmentations import RandomRotation90
+from src.dataset.augmentations.spatial_augmentations import RandomRotation90, RandomAffine
 from src.dataset.utils.visualization import plot_3_view
 from tests.dataset.patching.common import load_patient, get_brain_mask
 
@@ -40,4 +40,33 @@ def test_random_rotation_90_real_patient(patient):
     plot_3_view("rotated_volume", rot_volume[0, :, :, :], 100, save=True)
     plot_3_view("rotated_seg", rot_seg[:, :, :], 100, save=True)
     plot_3_view("volume", volume[0, :, :, :], 100, save=True)
-    plot_3_view("seg", seg[:, :, :], 100, save=True)
\ No newline at end of file
+    plot_3_view("seg", seg[:, :, :], 100, save=True)
+
+
+def test_random_affine_identity_and_flips():
+    modalities = np.random.rand(2, 10, 12, 8).astype(np.float32)
+    seg = np.random.randint(0, 4, (10, 12, 8)).astype(np.uint8)
+
+    identity = RandomAffine(p=1, rotation_range=(0, 0), scale_range=(1, 1), flip_p=0)
+    new_modalities, new_seg, _ = identity((modalities, seg, None))
+    np.testing.assert_allclose(new_modalities, modalities, atol=1e-5)
+    np.testing.assert_array_equal(new_seg, seg)
+
+    flip = RandomAffine(p=1, rotation_range=(0, 0), scale_range=(1, 1), flip_p=1)
+    new_modalities, new_seg, _ = flip((modalities, seg, None))
+    np.testing.assert_allclose(new_modalities, np.flip(modalities, axis=[1, 2, 3]), atol=1e-5)
+    np.testing.assert_array_equal(new_seg, np.flip(seg, axis=[0, 1, 2]))
+
+
+def test_random_affine_keeps_labels():
+    modalities = np.random.rand(4, 16, 16, 16).astype(np.float32)
+    seg = np.random.choice([0, 1, 3], size=(16, 16, 16)).astype(np.uint8)
+    mask = np.ones((16, 16, 16), np.uint8)
+
+    affine = RandomAffine(p=1, rotation_range=(-30, 30), scale_range=(0.8, 1.2), elastic_alpha=2)
+    new_modalities, new_seg, new_mask, stats = affine((modalities, seg, mask, {"std": [1, 1, 1, 1]}))
+
+    assert new_modalities.shape == modalities.shape and new_modalities.dtype == np.float32
+    assert set(np.unique(new_seg)) <= {0, 1, 3}
+    assert set(np.unique(new_mask)) <= {0, 1}
+    assert stats == {"std": [1, 1, 1, 1]}
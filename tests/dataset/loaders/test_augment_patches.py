@@ -0,0 +1,82 @@
+import os
+import random
+
+import numpy as np
+import pytest
+from torchvision import transforms
+
+from src.dataset.augmentations import color_augmentations, spatial_augmentations
+from src.dataset.loaders.brats_dataset import BratsDataset
+from src.dataset.patching import random_tumor_distribution
+from src.dataset.utils import volume_cache
+from tests.dataset.utils.common import create_patient
+
+
+@pytest.fixture(scope="function")
+def patients(tmp_path):
+    return [create_patient(str(tmp_path), f"BraTS20_Training_00{i}") for i in range(1, 3)]
+
+
+@pytest.fixture(scope="function")
+def transform():
+    return transforms.Compose([color_augmentations.RandomIntensityShift(),
+                               color_augmentations.RandomIntensityScale(),
+                               spatial_augmentations.RandomMirrorFlip(p=0.5),
+                               spatial_augmentations.RandomRotation90(p=0.5)])
+
+
+def test_intensity_shift_with_whole_volume_stats(patients):
+    modalities, _, brain_mask = patients[0].load_all(normalize=True)
+    stats = {"std": np.array([np.std(modality[brain_mask == 1]) for modality in modalities])}
+
+    random.seed(0)
+    shifted_volume = color_augmentations.RandomIntensityShift()((modalities, None, brain_mask))[0]
+    random.seed(0)
+    shifted_patch = color_augmentations.RandomIntensityShift()((modalities[:, 4:12, 4:12, 2:10], None,
+                                                                brain_mask[4:12, 4:12, 2:10], stats))[0]
+
+    np.testing.assert_allclose(shifted_patch, shifted_volume[:, 4:12, 4:12, 2:10])
+
+
+def test_augmented_patches_have_patch_size(patients, transform):
+    brats_dataset = BratsDataset(patients, random_tumor_distribution, (8, 8, 6), compute_patch=True,
+                                 transform=transform, augment_patches=True, patch_margin=2, patches_per_volume=4)
+    assert brats_dataset.region_size == (12, 12, 12)
+
+    modalities, segmentation = brats_dataset[0]
+    assert modalities.shape == (4, 4, 8, 8, 6)
+    assert segmentation.shape == (4, 8, 8, 6)
+
+
+def test_region_reads_are_augmented(patients, transform, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    for patient in patients:
+        volume_cache.save_patient(patient, cache_dir, compact=True)
+
+    brats_dataset = BratsDataset(patients, random_tumor_distribution, (8, 8, 8), compute_patch=True,
+                                 transform=transform, cache_dir=cache_dir, region_reads=True)
+    modalities, segmentation = brats_dataset[1]
+    assert modalities.shape == (4, 8, 8, 8)
+    assert segmentation.shape == (8, 8, 8)
+
+
+def test_center_index_with_intensity_transform(patients, tmp_path):
+    index_dir = str(tmp_path / "indices")
+    intensity_transform = transforms.Compose([color_augmentations.RandomIntensityShift(),
+                                              color_augmentations.RandomIntensityScale()])
+    brats_dataset = BratsDataset(patients, random_tumor_distribution, (8, 8, 6), compute_patch=True,
+                                 transform=intensity_transform, use_center_index=True, center_index_dir=index_dir)
+
+    modalities, segmentation = brats_dataset[0]
+    assert modalities.shape == (4, 8, 8, 6)
+    assert patients[0].patch_name in brats_dataset._center_indices
+    assert os.listdir(os.path.join(index_dir, patients[0].patch_name))
+
+
+def test_center_index_with_spatial_transform_needs_augment_patches(patients, transform):
+    with pytest.raises(ValueError):
+        BratsDataset(patients, random_tumor_distribution, (8, 8, 6), compute_patch=True, transform=transform,
+                     use_center_index=True)
+
+    BratsDataset(patients, random_tumor_distribution, (8, 8, 6), compute_patch=True, transform=transform,
+                 use_center_index=True, augment_patches=True)
@@ -0,0 +1,77 @@
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+
+import pytest
+from torch.utils.data import DataLoader, Dataset, get_worker_info
+
+from src.dataset.loaders.batch_sampler import BratsPatchSampler, PatientDistributedSampler
+
+
+class PatchesDataset(Dataset):
+
+    def __init__(self, n_patients, n_patches):
+        self.data = [SimpleNamespace(patient=f"patient_{patient}") for patient in range(n_patients)
+                     for _ in range(n_patches)]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx):
+        worker_info = get_worker_info()
+        return idx, worker_info.id if worker_info else 0
+
+
+@pytest.fixture(scope="function")
+def patches_dataset():
+    return PatchesDataset(n_patients=7, n_patches=5)
+
+
+def test_every_patch_once_per_epoch(patches_dataset):
+    sampler = BratsPatchSampler(patches_dataset, n_patients=2, n_samples=3)
+
+    for _ in range(3):
+        batches = list(sampler)
+        assert sorted(index for batch in batches for index in batch) == list(range(len(patches_dataset)))
+
+        for batch in batches:
+            patches_per_patient = Counter(patches_dataset.data[index].patient for index in batch)
+            assert len(patches_per_patient) <= 2
+            assert max(patches_per_patient.values()) <= 3
+
+    assert len(sampler) == len(list(sampler))
+
+
+def test_patients_routed_to_one_worker():
+    # same number of patches per worker, so both batch streams have the same length
+    patches_dataset = PatchesDataset(n_patients=8, n_patches=5)
+    sampler = BratsPatchSampler(patches_dataset, n_patients=2, n_samples=2, num_workers=2)
+    loader = DataLoader(dataset=patches_dataset, batch_sampler=sampler, num_workers=2)
+
+    workers_by_patient = defaultdict(set)
+    for indices, workers in loader:
+        for index, worker in zip(indices.tolist(), workers.tolist()):
+            workers_by_patient[patches_dataset.data[index].patient].add(worker)
+
+    assert len(workers_by_patient) == 8
+    assert all(len(workers) == 1 for workers in workers_by_patient.values())
+
+
+def test_distributed_sampler_splits_patients(patches_dataset):
+    samplers = [PatientDistributedSampler(patches_dataset, num_replicas=3, rank=rank) for rank in range(3)]
+
+    for epoch in range(3):
+        for sampler in samplers:
+            sampler.set_epoch(epoch)
+        rank_indices = [list(sampler) for sampler in samplers]
+
+        # same length on every rank, all the entries used and no patient in two ranks
+        assert len({len(indices) for indices in rank_indices}) == 1
+        assert all(len(indices) == len(sampler) for indices, sampler in zip(rank_indices, samplers))
+        assert set(index for indices in rank_indices for index in indices) == set(range(len(patches_dataset)))
+        rank_patients = [{patches_dataset.data[index].patient for index in indices} for indices in rank_indices]
+        assert sum(len(patients) for patients in rank_patients) == 7
+
+
+def test_distributed_sampler_needs_a_patient_per_rank(patches_dataset):
+    with pytest.raises(ValueError):
+        PatientDistributedSampler(patches_dataset, num_replicas=8, rank=0)
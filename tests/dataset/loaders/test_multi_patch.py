@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from src.dataset.loaders.brats_dataset import BratsDataset, collate_patches
+from src.dataset.patching import random_tumor_distribution
+from src.dataset.patching.commons import crop_patch
+from src.dataset.utils import volume_cache
+from tests.dataset.utils.common import create_patient
+
+
+@pytest.fixture(scope="function")
+def patients(tmp_path):
+    return [create_patient(str(tmp_path), f"BraTS20_Training_00{i}") for i in range(1, 4)]
+
+
+def test_item_stacks_patches_of_one_volume(patients):
+    brats_dataset = BratsDataset(patients, random_tumor_distribution, (8, 8, 8), compute_patch=True,
+                                 patches_per_volume=5)
+    modalities, segmentation = brats_dataset[0]
+    assert modalities.shape == (5, 4, 8, 8, 8)
+    assert segmentation.shape == (5, 8, 8, 8)
+
+
+def test_collate_flattens_patches(patients):
+    brats_dataset = BratsDataset(patients, random_tumor_distribution, (8, 8, 8), compute_patch=True,
+                                 patches_per_volume=4)
+    loader = DataLoader(dataset=brats_dataset, batch_size=2, collate_fn=collate_patches)
+
+    modalities, segmentation = next(iter(loader))
+    assert modalities.shape == (8, 4, 8, 8, 8)
+    assert segmentation.shape == (8, 8, 8, 8)
+
+
+def test_region_reads_match_full_volume_patches(patients, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    for patient in patients:
+        volume_cache.save_patient(patient, cache_dir, compact=True)
+
+    brats_dataset = BratsDataset(patients, random_tumor_distribution, (8, 8, 8), compute_patch=True,
+                                 cache_dir=cache_dir, region_reads=True, patches_per_volume=3)
+    modalities, segmentation = brats_dataset[0]
+    assert modalities.shape == (3, 4, 8, 8, 8)
+    assert segmentation.shape == (3, 8, 8, 8)
+    assert (segmentation.flatten(1).max(dim=1).values > 0).all()
+
+    start = random_tumor_distribution.select_start(brats_dataset._get_center_index(patients[0]))
+    region_modalities, region_segmentation, _ = volume_cache.load_region(patients[0], cache_dir, start, (8, 8, 8))
+    full_modalities, full_segmentation, _ = volume_cache.load_patient(patients[0], cache_dir)
+    volume_patch, seg_patch = crop_patch(full_modalities, full_segmentation, (8, 8, 8), start)
+    np.testing.assert_allclose(region_modalities, volume_patch, rtol=1e-6)
+    np.testing.assert_array_equal(region_segmentation, seg_patch)
+
+
+def test_item_types(patients):
+    brats_dataset = BratsDataset(patients, random_tumor_distribution, (8, 8, 8), compute_patch=True)
+    modalities, segmentation = brats_dataset[0]
+    assert modalities.dtype == torch.float32
+    assert segmentation.dtype == torch.uint8
+
+    half_dataset = BratsDataset(patients, random_tumor_distribution, (8, 8, 8), compute_patch=True, dtype=np.float16)
+    modalities, _ = half_dataset[0]
+    assert modalities.dtype == torch.float16
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from src.dataset.loaders.brats_dataset import BratsDataset
+from src.dataset.loaders.patient_cache import PatientLRUCache
+from tests.dataset.utils.common import create_patient
+
+
+def _volumes(n_bytes):
+    return np.zeros(n_bytes, np.uint8), None, np.zeros(0, np.uint8)
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = PatientLRUCache(max_bytes=100)
+    assert cache.get("a") is None
+    cache.put("a", _volumes(10))
+    assert cache.get("a") is not None
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_rate() == 0.5
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = PatientLRUCache(max_bytes=100)
+    cache.put("a", _volumes(40))
+    cache.put("b", _volumes(40))
+    cache.get("a")
+    cache.put("c", _volumes(40))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.current_bytes == 80
+
+
+def test_lru_cache_skips_volumes_bigger_than_budget():
+    cache = PatientLRUCache(max_bytes=100)
+    cache.put("a", _volumes(200))
+    assert len(cache) == 0
+
+
+def test_lru_cache_volumes_are_read_only():
+    cache = PatientLRUCache(max_bytes=100)
+    cache.put("a", _volumes(10))
+    with pytest.raises(ValueError):
+        cache.get("a")[0][0] = 1
+
+
+def test_dataset_decodes_each_patient_once(tmp_path):
+    data = [create_patient(str(tmp_path))] * 3
+    brats_dataset = BratsDataset(data, None, (32, 32, 24), compute_patch=False, cache_max_bytes=1024 ** 3)
+
+    first_modalities, first_segmentation = brats_dataset[0]
+    for idx in range(1, len(data)):
+        modalities, segmentation = brats_dataset[idx]
+        assert modalities.equal(first_modalities)
+        assert segmentation.equal(first_segmentation)
+
+    assert brats_dataset.patient_cache.misses == 1
+    assert brats_dataset.patient_cache.hits == 2
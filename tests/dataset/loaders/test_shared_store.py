@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from torch.utils.data import DataLoader
+
+from src.dataset import brats_labels
+from src.dataset.loaders.brats_dataset import BratsDataset, patch_region_size
+from src.dataset.patching import random_tumor_distribution
+from src.dataset.loaders.shared_store import SharedVolumeStore
+from tests.dataset.utils.common import create_patient
+
+
+@pytest.fixture(scope="function")
+def patients(tmp_path):
+    return [create_patient(str(tmp_path), f"BraTS20_Training_00{i}") for i in range(1, 3)]
+
+
+def test_store_matches_decoded_volumes(patients):
+    store = SharedVolumeStore(patients * 2)
+    assert len(store) == 2
+    assert store.n_loaded() == 0
+
+    modalities, segmentation, brain_mask = store.load(patients[0])
+    expected_modalities, expected_segmentation, expected_brain_mask = patients[0].load_all(normalize=True)
+
+    np.testing.assert_allclose(modalities, expected_modalities, rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(segmentation, brats_labels.convert_from_brats_labels(expected_segmentation))
+    np.testing.assert_array_equal(brain_mask, expected_brain_mask)
+    assert store.n_loaded() == 1
+
+
+def test_store_is_filled_by_loader_workers(patients):
+    store = SharedVolumeStore(patients)
+    brats_dataset = BratsDataset(patients, None, (32, 32, 24), compute_patch=False, shared_store=store)
+    loader = DataLoader(dataset=brats_dataset, batch_size=1, num_workers=2)
+
+    for modalities, segmentation in loader:
+        assert modalities.shape == (1, 4, 32, 32, 24)
+
+    # volumes decoded in the workers are visible from the main process
+    assert store.n_loaded() == 2
+
+
+def test_store_over_budget_is_not_allocated(patients):
+    store = SharedVolumeStore(patients, max_bytes=32 * 32 * 24 * 18 * 2)
+    assert len(store) == 2
+
+    with pytest.raises(MemoryError):
+        SharedVolumeStore(patients, max_bytes=32 * 32 * 24 * 18 * 2 - 1)
+
+
+def test_cropped_store_keeps_the_patch_region(patients):
+    for patient in patients:
+        patient.bounding_box = (4, 28, 4, 28, 2, 22)
+    region_size = patch_region_size((16, 16, 16), augment_patches=True, patch_margin=4)
+    store = SharedVolumeStore(patients, crop_to_brain=True, min_size=region_size)
+
+    brats_dataset = BratsDataset(patients, random_tumor_distribution, (16, 16, 16), compute_patch=True,
+                                 shared_store=store, augment_patches=True, patch_margin=4)
+    assert store.load(patients[0])[0].shape == (4, 24, 24, 24)
+    modalities, segmentation = brats_dataset[0]
+    assert modalities.shape == (4, 16, 16, 16)
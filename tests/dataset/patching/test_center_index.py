@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from src.dataset.patching import binary_distribution, random_tumor_distribution
+from src.dataset.patching.center_index import CenterIndex, load_or_build, index_path
+from tests.dataset.utils.common import create_patient
+
+
+@pytest.fixture(scope="function")
+def volumes():
+    segmentation = np.zeros((32, 32, 24), np.uint8)
+    segmentation[2:6, 2:6, 1:4] = 1
+    segmentation[20:24, 20:24, 10:14] = 3
+    brain_mask = np.zeros((32, 32, 24), np.uint8)
+    brain_mask[1:-1, 1:-1, 1:-1] = 1
+    modalities = np.random.rand(4, 32, 32, 24).astype(np.float32)
+    return modalities, segmentation, brain_mask
+
+
+def test_starts_inside_margins(volumes):
+    _, segmentation, brain_mask = volumes
+    patch_size = (16, 16, 16)
+    index = CenterIndex.build(segmentation, brain_mask, patch_size)
+
+    assert index.labels() == [0, 1, 3]
+    assert index.counts[1] == 4 * 4 * 3
+    for starts in index.starts.values():
+        assert starts.dtype == np.int16
+        assert (starts >= 0).all()
+        assert (starts <= np.array(segmentation.shape) - np.array(patch_size)).all()
+
+
+def test_patches_contain_selected_label(volumes):
+    modalities, segmentation, brain_mask = volumes
+    patch_size = (8, 8, 8)
+    index = CenterIndex.build(segmentation, brain_mask, patch_size)
+
+    for _ in range(20):
+        volume_patch, seg_patch = random_tumor_distribution.patching(modalities, segmentation, patch_size,
+                                                                     brain_mask, center_index=index)
+        assert volume_patch.shape == (4, 8, 8, 8)
+        assert seg_patch.shape == patch_size
+        assert seg_patch.max() > 0
+
+        volume_patch, seg_patch = binary_distribution.patching(modalities, segmentation, patch_size, brain_mask,
+                                                               center_index=index)
+        assert seg_patch.shape == patch_size
+
+
+def test_index_is_saved_and_reloaded(volumes, tmp_path):
+    _, segmentation, brain_mask = volumes
+    patient = create_patient(str(tmp_path / "data"))
+    index_dir = str(tmp_path / "index")
+
+    index = load_or_build(patient, index_dir, segmentation, brain_mask, (16, 16, 16))
+    path = index_path(patient, index_dir, (16, 16, 16), segmentation.shape)
+    reloaded = CenterIndex.load(path)
+
+    assert reloaded.patch_size == (16, 16, 16)
+    assert reloaded.shape == segmentation.shape
+    assert reloaded.counts == index.counts
+    for label in index.labels():
+        np.testing.assert_array_equal(reloaded.starts[label], index.starts[label])
@@ -22,3 +22,14 @@ def test_get_ncr_net(volume):
     plot_3_view("whole", volume[:, :, :], 100, save=True)
 
     assert [0, 1] == list(np.unique(just_ncr_net))
+
+
+def test_map_labels_matches_vectorize():
+    segmentation = np.random.choice([0, 1, 2, 4], size=(20, 20, 10)).astype(np.float64)
+    binary_function = lambda label: 0 if label == 0 else 1
+
+    mapped = brats_labels.map_labels(segmentation, binary_function)
+    np.testing.assert_array_equal(mapped, np.vectorize(binary_function)(segmentation))
+
+    one_label = nifi_utils.get_one_label_volume(segmentation, 4)
+    np.testing.assert_array_equal(one_label, np.where(segmentation == 4, 4, 0))
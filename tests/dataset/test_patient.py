@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from tests.dataset.utils.common import create_patient
+
+
+@pytest.fixture(scope="function")
+def patient(tmp_path):
+    return create_patient(str(tmp_path))
+
+
+def test_load_all_matches_single_loaders(patient):
+    modalities, segmentation, brain_mask = patient.load_all(normalize=True)
+
+    np.testing.assert_array_equal(modalities, patient.load_mri_volumes(normalize=True))
+    np.testing.assert_array_equal(segmentation, patient.load_gt_mask())
+    np.testing.assert_array_equal(brain_mask, patient.get_brain_mask())
+
+
+def test_load_all_without_segmentation(patient):
+    modalities, segmentation, brain_mask = patient.load_all(normalize=False, with_segmentation=False)
+    assert segmentation is None
+    assert modalities.shape == (4, 32, 32, 24)
+    assert brain_mask.shape == (32, 32, 24)
+
+
+def test_threaded_decoding_matches_sequential(patient):
+    sequential = patient.load_all(normalize=True, num_threads=1)
+    threaded = patient.load_all(normalize=True, num_threads=4)
+
+    for expected, result in zip(sequential, threaded):
+        np.testing.assert_array_equal(expected, result)
+    np.testing.assert_array_equal(patient.load_mri_volumes(normalize=True, num_threads=4), sequential[0])
@@ -0,0 +1,16 @@
+from src.dataset.patient import Patient
+from src.dataset.train_val_split import train_val_split
+
+
+def test_seeded_split_is_the_same_in_every_process():
+    data = [Patient(idx=str(i), center="", grade="HGG" if i % 3 else "LGG", patient=f"BraTS20_Training_{i:03d}",
+                    patch_name=f"BraTS20_Training_{i:03d}", size=[240, 240, 155], data_path="", train=True)
+            for i in range(40)]
+
+    splits = [train_val_split(data, val_size=0.2, seed=3) for _ in range(3)]
+    names = [([p.patch_name for p in train], [p.patch_name for p in val]) for train, val in splits]
+    assert names[0] == names[1] == names[2]
+
+    train, val = names[0]
+    assert not set(train) & set(val)
+    assert len(train) + len(val) == len(data)
@@ -0,0 +1,26 @@
+import os
+import numpy as np
+
+from src.dataset.patient import Patient
+from src.dataset.utils.nifi_volume import save_nifi_volume
+
+
+def create_patient(data_path: str, patch_name: str = "BraTS20_Training_001", size: tuple = (32, 32, 24)) -> Patient:
+    """Write a small synthetic BraTS patient (four modalities and segmentation) as NIfTI files"""
+    patient_path = os.path.join(data_path, patch_name)
+    os.makedirs(patient_path, exist_ok=True)
+
+    brain = np.zeros(size, np.int16)
+    brain[4:-4, 4:-4, 2:-2] = 1
+    for i, modality in enumerate(["flair", "t1", "t2", "t1ce"]):
+        volume = brain * np.random.randint(1, 1000, size=size).astype(np.int16) * (i + 1)
+        save_nifi_volume(volume, os.path.join(patient_path, f"{patch_name}_{modality}.nii.gz"))
+
+    seg = np.zeros(size, np.uint8)
+    seg[10:14, 10:14, 8:12] = 2
+    seg[11:13, 11:13, 9:11] = 4
+    seg[14:16, 10:12, 8:10] = 1
+    save_nifi_volume(seg, os.path.join(patient_path, f"{patch_name}_seg.nii.gz"))
+
+    return Patient(idx="1", center="", grade="HGG", patient=patch_name, patch_name=patch_name, size=list(size),
+                   data_path=data_path, train=True)
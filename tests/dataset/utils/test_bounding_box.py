@@ -0,0 +1,72 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+from src.compute_brain_bounding_boxes import add_bounding_boxes
+from src.dataset.utils import bounding_box as bbox_utils
+from src.dataset.utils.dataset import read_brats
+from tests.dataset.utils.common import create_patient
+
+
+@pytest.fixture(scope="function")
+def brain_mask():
+    mask = np.zeros((20, 30, 10))
+    mask[5:10, 3:25, 2:9] = 1
+    return mask
+
+
+def test_compute_bounding_box(brain_mask):
+    assert bbox_utils.compute_bounding_box(brain_mask) == (5, 10, 3, 25, 2, 9)
+
+
+def test_bounding_box_str_round_trip():
+    bounding_box = (5, 10, 3, 25, 2, 9)
+    assert bbox_utils.bounding_box_to_str(bounding_box) == "5:10x3:25x2:9"
+    assert bbox_utils.bounding_box_from_str("5:10x3:25x2:9") == bounding_box
+
+
+def test_expand_bounding_box_stays_inside_volume():
+    expanded = bbox_utils.expand_bounding_box((5, 10, 3, 25, 2, 9), (20, 30, 10), min_size=(8, 8, 8), multiple=4)
+    assert expanded == (4, 12, 2, 26, 2, 10)
+
+
+def test_expand_bounding_box_pads_past_the_volume():
+    # the brain fills the 10 slices of z, a multiple of 4 needs 12: one slice of padding on each side
+    expanded = bbox_utils.expand_bounding_box((5, 10, 3, 25, 0, 10), (20, 30, 10), multiple=4)
+    assert expanded == (4, 12, 2, 26, -1, 11)
+
+
+def test_crop_and_paste_padded_box(brain_mask):
+    bounding_box = (4, 12, 2, 26, -1, 11)
+    cropped = bbox_utils.crop(brain_mask, bounding_box)
+    assert cropped.shape == (8, 24, 12)
+    assert cropped[..., 0].sum() == cropped[..., -1].sum() == 0
+    np.testing.assert_array_equal(bbox_utils.paste(cropped, bounding_box, brain_mask.shape), brain_mask)
+
+
+def test_crop_and_paste_round_trip(brain_mask):
+    bounding_box = bbox_utils.compute_bounding_box(brain_mask)
+    cropped = bbox_utils.crop(brain_mask, bounding_box)
+    assert cropped.shape == (5, 22, 7)
+    np.testing.assert_array_equal(bbox_utils.paste(cropped, bounding_box, brain_mask.shape), brain_mask)
+
+
+def test_bounding_boxes_are_read_from_csv(tmp_path):
+    patient = create_patient(str(tmp_path))
+    csv_path = os.path.join(str(tmp_path), "brats20_data.csv")
+    with open(csv_path, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["ID", "Grade", "subject_ID", "Center", "Patch", "Size", "Train"])
+        writer.writerow(["1", "HGG", patient.patient, "CBICA", patient.patch_name, "32x32x24", "train"])
+
+    add_bounding_boxes(csv_path)
+    data, _ = read_brats(csv_path)
+    assert data[0].bounding_box == (4, 28, 4, 28, 2, 22)
+
+    modalities, segmentation, brain_mask = data[0].load_all(bounding_box=data[0].get_bounding_box())
+    full_modalities, _, _ = data[0].load_all()
+    assert modalities.shape == (4, 24, 24, 20)
+    assert segmentation.shape == brain_mask.shape == (24, 24, 20)
+    np.testing.assert_allclose(bbox_utils.paste(modalities, data[0].bounding_box, data[0].size), full_modalities)
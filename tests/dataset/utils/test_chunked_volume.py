@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from src.dataset.utils.chunked_volume import ChunkedVolume, save_chunked
+
+
+@pytest.fixture(scope="function")
+def volume():
+    return np.random.randint(0, 1000, size=(4, 50, 40, 35)).astype(np.int16)
+
+
+def test_full_read(volume, tmp_path):
+    path = str(tmp_path / "volume.chunks")
+    save_chunked(path, volume, chunk_size=16)
+
+    chunked_volume = ChunkedVolume(path)
+    assert chunked_volume.shape == volume.shape
+    assert chunked_volume.dtype == np.int16
+    np.testing.assert_array_equal(chunked_volume.read(), volume)
+
+
+def test_region_read(volume, tmp_path):
+    path = str(tmp_path / "volume.chunks")
+    save_chunked(path, volume, chunk_size=16)
+    chunked_volume = ChunkedVolume(path)
+
+    for start, size in [((0, 0, 0), (8, 8, 8)), ((10, 13, 30), (20, 20, 5)), ((30, 20, 0), (20, 20, 35))]:
+        region = chunked_volume.read_region(start, size)
+        expected = volume[:, start[0]:start[0] + size[0], start[1]:start[1] + size[1], start[2]:start[2] + size[2]]
+        np.testing.assert_array_equal(region, expected)
+
+
+def test_three_dimensional_volume(tmp_path):
+    mask = (np.random.rand(40, 40, 20) > 0.5).astype(np.uint8)
+    path = str(tmp_path / "mask.chunks")
+    save_chunked(path, mask)
+    np.testing.assert_array_equal(ChunkedVolume(path).read_region((5, 5, 5), (30, 30, 10)), mask[5:35, 5:35, 5:15])
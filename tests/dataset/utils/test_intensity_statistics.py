@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from src.dataset.augmentations.data_normalization import zero_mean_unit_variance_normalization
+from src.dataset.utils import intensity_statistics
+from tests.dataset.utils.common import create_patient
+
+
+@pytest.fixture(scope="function")
+def patient(tmp_path):
+    return create_patient(str(tmp_path))
+
+
+def test_compute_statistics(patient):
+    modalities, _, _ = patient.load_all(normalize=False, with_segmentation=False)
+    stats = intensity_statistics.compute_statistics(modalities)
+
+    for channel, modality in enumerate(modalities):
+        brain = modality[modality > 0]
+        assert stats["mean"][channel] == pytest.approx(brain.mean())
+        assert stats["std"][channel] == pytest.approx(brain.std())
+        assert stats["min"][channel] == brain.min() and stats["max"][channel] == brain.max()
+        assert stats["p99"][channel] == pytest.approx(np.percentile(brain, 99))
+
+
+def test_normalized_statistics(patient):
+    modalities, _, _ = patient.load_all(normalize=False, with_segmentation=False)
+    stats = intensity_statistics.normalized_statistics(intensity_statistics.compute_statistics(modalities))
+
+    for channel, modality in enumerate(modalities):
+        normalized = zero_mean_unit_variance_normalization(modality)
+        brain = normalized[modality > 0]
+        assert stats["mean"][channel] == pytest.approx(0)
+        assert stats["std"][channel] == pytest.approx(brain.std())
+        assert stats["min"][channel] == pytest.approx(brain.min())
+        assert stats["max"][channel] == pytest.approx(brain.max())
+
+
+def test_load_all_with_statistics(patient, tmp_path):
+    expected, _, _ = patient.load_all(normalize=True)
+
+    raw, _, _ = patient.load_all(normalize=False, with_segmentation=False)
+    stats_path = str(tmp_path / "stats.json")
+    intensity_statistics.save_statistics(stats_path, {patient.patch_name: intensity_statistics.compute_statistics(raw)})
+    patient.intensity_stats = intensity_statistics.load_statistics(stats_path)[patient.patch_name]
+
+    modalities, _, _ = patient.load_all(normalize=True)
+    assert modalities.dtype == np.float32
+    np.testing.assert_allclose(modalities, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_load_missing_statistics(tmp_path):
+    assert intensity_statistics.load_statistics(str(tmp_path / "missing.json")) == {}
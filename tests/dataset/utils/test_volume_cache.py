@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from src.dataset import brats_labels
+from src.dataset.loaders.brats_dataset import BratsDataset
+from src.dataset.utils import volume_cache
+from tests.dataset.utils.common import create_patient
+
+
+@pytest.fixture(scope="function")
+def patient(tmp_path):
+    return create_patient(str(tmp_path / "data"))
+
+
+def test_cached_volumes_match_nifti(patient, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    assert not volume_cache.is_cached(patient, cache_dir)
+
+    volume_cache.save_patient(patient, cache_dir)
+    assert volume_cache.is_cached(patient, cache_dir)
+
+    modalities, seg, brain_mask = volume_cache.load_patient(patient, cache_dir)
+    assert isinstance(modalities, np.memmap)
+    assert modalities.shape == (4, 32, 32, 24)
+    assert modalities.dtype == np.float32
+    np.testing.assert_allclose(modalities, patient.load_mri_volumes(normalize=True), rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(brain_mask, patient.get_brain_mask())
+    np.testing.assert_array_equal(seg, brats_labels.convert_from_brats_labels(patient.load_gt_mask()))
+
+
+def test_compact_cache_matches_float_cache(patient, tmp_path):
+    float_dir, compact_dir = str(tmp_path / "float"), str(tmp_path / "compact")
+    volume_cache.save_patient(patient, float_dir)
+    volume_cache.save_patient(patient, compact_dir, compact=True)
+    assert volume_cache.is_cached(patient, compact_dir, compact=True)
+
+    float_modalities, float_seg, float_mask = volume_cache.load_patient(patient, float_dir)
+    modalities, seg, brain_mask = volume_cache.load_patient(patient, compact_dir)
+    assert modalities.dtype == np.float32
+    np.testing.assert_allclose(modalities, float_modalities, rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(seg, float_seg)
+    np.testing.assert_array_equal(brain_mask, float_mask)
+
+
+def test_cache_of_another_format_is_rebuilt(patient, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    volume_cache.save_patient(patient, cache_dir)
+    assert volume_cache.is_cached(patient, cache_dir)
+    assert not volume_cache.is_cached(patient, cache_dir, compact=True)
+    assert not volume_cache.is_cached(patient, cache_dir, compact=True, chunked=True)
+
+    volume_cache.save_patient(patient, cache_dir, compact=True)
+    assert volume_cache.is_cached(patient, cache_dir, compact=True)
+    assert not volume_cache.is_cached(patient, cache_dir)
+    modalities, _, _ = volume_cache.load_patient(patient, cache_dir)
+    assert isinstance(modalities, volume_cache.NormalizedVolume)
+
+
+def test_compact_cache_normalizes_read_regions(patient, tmp_path):
+    float_dir, compact_dir = str(tmp_path / "float"), str(tmp_path / "compact")
+    volume_cache.save_patient(patient, float_dir)
+    volume_cache.save_patient(patient, compact_dir, compact=True)
+
+    float_modalities, _, _ = volume_cache.load_patient(patient, float_dir)
+    modalities, _, _ = volume_cache.load_patient(patient, compact_dir)
+    assert isinstance(modalities, volume_cache.NormalizedVolume)
+    assert modalities.shape == (4, 32, 32, 24)
+
+    region = modalities[1:3, 4:20, 8:24, 2:18]
+    assert region.dtype == np.float32
+    np.testing.assert_allclose(region, float_modalities[1:3, 4:20, 8:24, 2:18], rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(modalities[2], float_modalities[2], rtol=1e-5, atol=1e-5)
+
+
+def test_chunked_cache_matches_float_cache(patient, tmp_path):
+    float_dir, chunked_dir = str(tmp_path / "float"), str(tmp_path / "chunked")
+    volume_cache.save_patient(patient, float_dir)
+    volume_cache.save_patient(patient, chunked_dir, compact=True, chunked=True)
+    assert volume_cache.is_cached(patient, chunked_dir, compact=True, chunked=True)
+
+    float_modalities, float_seg, float_mask = volume_cache.load_patient(patient, float_dir)
+    modalities, seg, brain_mask = volume_cache.load_patient(patient, chunked_dir)
+    np.testing.assert_allclose(modalities, float_modalities, rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(seg, float_seg)
+    np.testing.assert_array_equal(brain_mask, float_mask)
+
+    modalities, seg, brain_mask = volume_cache.load_region(patient, chunked_dir, (4, 8, 2), (16, 16, 16))
+    np.testing.assert_allclose(modalities, float_modalities[:, 4:20, 8:24, 2:18], rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(seg, float_seg[4:20, 8:24, 2:18])
+    np.testing.assert_array_equal(brain_mask, float_mask[4:20, 8:24, 2:18])
+
+
+def test_cached_volumes_are_cropped_to_brain(patient, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    volume_cache.save_patient(patient, cache_dir)
+    patient.bounding_box = (4, 28, 4, 28, 2, 22)
+
+    cached = BratsDataset([patient], None, None, cache_dir=cache_dir, crop_to_brain=True)[0]
+    decoded = BratsDataset([patient], None, None, crop_to_brain=True)[0]
+    assert cached[0].shape == (4, 24, 24, 20)
+    np.testing.assert_allclose(cached[0], decoded[0], rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(cached[1], decoded[1])
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_cache_stores_normalized_brain_std(patient, tmp_path, compact):
+    cache_dir = str(tmp_path / "cache")
+    volume_cache.save_patient(patient, cache_dir, compact=compact)
+
+    modalities, _, brain_mask = volume_cache.load_patient(patient, cache_dir)
+    expected = [np.std(modality[brain_mask == 1]) for modality in modalities]
+    np.testing.assert_allclose(volume_cache.load_brain_std(patient, cache_dir), expected, rtol=1e-5)
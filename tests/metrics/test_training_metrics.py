@@ -0,0 +1,35 @@
+import pytest
+import torch
+
+from src.metrics.training_metrics import MetricsAccumulator
+
+
+class RecordingWriter(object):
+
+    def __init__(self):
+        self.scalars = []
+
+    def add_scalar(self, tag, value, step):
+        self.scalars.append((tag, value, step))
+
+
+def test_weighted_averages():
+    metrics = MetricsAccumulator()
+    metrics.update({"loss": torch.tensor(1.), "score": torch.tensor(0.5)}, n=1)
+    metrics.update({"loss": torch.tensor(4.), "score": torch.tensor(0.)}, n=3)
+
+    averages = metrics.averages()
+    assert averages["loss"] == pytest.approx(13 / 4)
+    assert averages["score"] == pytest.approx(0.5 / 4)
+
+
+def test_scalars_written_every_flush_steps():
+    writer = RecordingWriter()
+    metrics = MetricsAccumulator(writer, flush_steps=3)
+
+    for step in range(4):
+        metrics.update({"loss": torch.tensor(float(step), requires_grad=True)}, n=2, step=step)
+        assert len(writer.scalars) == (3 if step >= 2 else 0)
+
+    metrics.averages()
+    assert writer.scalars == [("loss", float(step), step) for step in range(4)]
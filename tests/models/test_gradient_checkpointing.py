@@ -0,0 +1,53 @@
+import pytest
+import torch
+
+from src.models.unet3d import unet3d
+from src.models.vnet import asymm_vnet, vnet
+
+
+def unet(gradient_checkpointing):
+    return unet3d.UNet3D(in_channels=4, out_channels=4, final_sigmoid=False, f_maps=4, layer_order="crg",
+                         num_levels=3, num_groups=2, gradient_checkpointing=gradient_checkpointing)
+
+
+def residual_unet(gradient_checkpointing):
+    return unet3d.ResidualUNet3D(in_channels=4, out_channels=4, final_sigmoid=False, f_maps=4, layer_order="crg",
+                                 num_levels=3, num_groups=2, gradient_checkpointing=gradient_checkpointing)
+
+
+def vnet_model(gradient_checkpointing):
+    return vnet.VNet(elu="elu", in_channels=4, classes=4, init_features_maps=4,
+                     gradient_checkpointing=gradient_checkpointing)
+
+
+def asymm_vnet_model(gradient_checkpointing):
+    return asymm_vnet.VNet(non_linearity="relu", in_channels=4, classes=4, init_features_maps=4, kernel_size=3,
+                           padding=1, gradient_checkpointing=gradient_checkpointing)
+
+
+def output(model, inputs):
+    out = model(inputs)
+    return out[0] if isinstance(out, tuple) else out
+
+
+@pytest.mark.parametrize("create_model", [unet, residual_unet, vnet_model, asymm_vnet_model])
+def test_checkpointing_gives_same_gradients(create_model):
+    inputs = torch.rand(1, 4, 32, 32, 32)
+
+    torch.manual_seed(0)
+    model = create_model(gradient_checkpointing=False)
+    torch.manual_seed(0)
+    checkpointed_model = create_model(gradient_checkpointing=True)
+    checkpointed_model.load_state_dict(model.state_dict())
+
+    # same dropout masks in both models
+    torch.manual_seed(1)
+    expected = output(model, inputs)
+    expected.sum().backward()
+    torch.manual_seed(1)
+    result = output(checkpointed_model, inputs)
+    result.sum().backward()
+
+    torch.testing.assert_close(result, expected)
+    for parameter, checkpointed_parameter in zip(model.parameters(), checkpointed_model.parameters()):
+        torch.testing.assert_close(checkpointed_parameter.grad, parameter.grad, rtol=1e-4, atol=1e-5)
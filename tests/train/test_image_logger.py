@@ -0,0 +1,55 @@
+import threading
+
+import torch
+
+from src.train.image_logger import AsyncImageLogger
+
+
+class RecordingWriter(object):
+
+    def __init__(self, block=None):
+        self.images = []
+        self.block = block
+
+    def add_image(self, title, image, global_step=None):
+        if self.block:
+            self.block.wait()
+        self.images.append((title, image, global_step, threading.current_thread().name))
+
+
+def test_images_written_by_background_thread():
+    writer = RecordingWriter()
+    image_logger = AsyncImageLogger(writer, every_n_steps=10)
+
+    image_logger.log(torch.randn(2, 4, 16, 16, 16), False, "Modality patch", 3)
+    image_logger.log(torch.randint(0, 4, (2, 16, 16, 16)), True, "Segmentation patch", 3)
+    image_logger.flush()
+
+    assert [(title, step) for title, _, step, _ in writer.images] == [("Modality patch", 3), ("Segmentation patch", 3)]
+    assert all(image.dim() == 3 for _, image, _, _ in writer.images)
+    assert all(thread == "image-logger" for _, _, _, thread in writer.images)
+    image_logger.close()
+
+
+def test_should_log():
+    image_logger = AsyncImageLogger(RecordingWriter(), every_n_steps=10)
+    assert [step for step in range(25) if image_logger.should_log(step)] == [0, 10, 20]
+
+    image_logger.every_n_steps = 0
+    assert [step for step in range(25) if image_logger.should_log(step)] == [0]
+
+
+def test_full_queue_drops_images():
+    release = threading.Event()
+    writer = RecordingWriter(block=release)
+    image_logger = AsyncImageLogger(writer, max_queue=2)
+
+    batch = torch.randn(1, 4, 8, 8, 8)
+    for step in range(10):
+        image_logger.log(batch, False, "Modality patch", step)
+    release.set()
+    image_logger.flush()
+
+    # one image being written and two queued
+    assert len(writer.images) <= 3
+    image_logger.close()
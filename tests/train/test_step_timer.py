@@ -0,0 +1,52 @@
+import json
+import time
+
+import pytest
+
+from src.train.step_timer import PHASES, StepTimer
+
+
+def run_step(timer, global_step):
+    timer.begin_step()
+    with timer.phase("forward"):
+        time.sleep(0.01)
+    with timer.phase("backward"):
+        time.sleep(0.02)
+    timer.end_step(global_step, (2, 4, 8, 8, 8))
+
+
+def test_step_times(tmp_path):
+    log_path = str(tmp_path / "steps.jsonl")
+    timer = StepTimer(enabled=True, log_path=log_path)
+    timer.start_epoch()
+    for step in range(3):
+        time.sleep(0.005)
+        run_step(timer, step)
+    timer.close()
+
+    with open(log_path) as log_file:
+        records = [json.loads(line) for line in log_file]
+
+    assert [record["global_step"] for record in records] == [0, 1, 2]
+    for record in records:
+        assert set(PHASES) <= set(record)
+        assert record["forward"] >= 0.01 and record["backward"] >= 0.02 and record["data"] >= 0.005
+        assert record["step"] >= sum(record[phase] for phase in PHASES)
+        assert record["samples_per_sec"] == pytest.approx(2 / record["step"])
+        assert record["voxels_per_sec"] == pytest.approx(2 * 8 ** 3 / record["step"])
+
+
+def test_summary_percentiles():
+    timer = StepTimer(enabled=True)
+    timer.start_epoch()
+    run_step(timer, 0)
+    summary = timer.summary()
+    assert "forward" in summary and "p99" in summary and "samples/s" in summary
+
+
+def test_disabled_timer_records_nothing(tmp_path):
+    timer = StepTimer(enabled=False, log_path=str(tmp_path / "steps.jsonl"))
+    timer.start_epoch()
+    run_step(timer, 0)
+    assert timer.summary() == ""
+    assert not (tmp_path / "steps.jsonl").exists()
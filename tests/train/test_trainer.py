@@ -0,0 +1,93 @@
+import json
+
+import pytest
+import torch
+from torch.utils.tensorboard import SummaryWriter
+
+from src.dataset.augmentations import batch_augmentations
+from src.losses import dice_loss, new_losses
+from src.models.unet3d import unet3d
+from src.train.trainer import Trainer, TrainerArgs
+
+
+@pytest.fixture(scope="function")
+def batches():
+    torch.manual_seed(0)
+    inputs = torch.randn(2, 4, 24, 24, 24)
+    targets = torch.randint(0, 4, (2, 24, 24, 24), dtype=torch.uint8)
+    return [(inputs, targets)] * 2
+
+
+def create_trainer(tmp_path, batches, mixed_precision, **kwargs):
+    network = unet3d.UNet3D(in_channels=4, out_channels=4, final_sigmoid=False, f_maps=4, layer_order="crg",
+                            num_levels=2, num_groups=2, conv_padding=1)
+    optimizer = torch.optim.SGD(network.parameters(), lr=0.01)
+    args = TrainerArgs(n_epochs=1, device="cpu", output_path=str(tmp_path), loss="gdl",
+                       mixed_precision=mixed_precision, **kwargs)
+    return Trainer(args, network, optimizer, new_losses.GeneralizedDiceLoss(), 0, batches, batches, None,
+                   SummaryWriter(str(tmp_path)))
+
+
+@pytest.mark.parametrize("mixed_precision", [False, True])
+def test_train_epoch(tmp_path, batches, mixed_precision):
+    trainer = create_trainer(tmp_path, batches, mixed_precision)
+    weights = [parameter.detach().clone() for parameter in trainer.model.parameters()]
+
+    dice_loss, dice_score, _, _ = trainer.train_epoch(0)
+
+    assert 0 <= dice_loss <= 1 and 0 <= dice_score <= 1
+    assert any(not torch.equal(before, after) for before, after in zip(weights, trainer.model.parameters()))
+    assert all(parameter.dtype == torch.float32 for parameter in trainer.model.parameters())
+
+
+def test_mixed_precision_forward(tmp_path, batches):
+    trainer = create_trainer(tmp_path, batches, mixed_precision=True)
+    assert trainer.autocast_dtype == torch.bfloat16 and trainer.scaler is None
+
+    with trainer._autocast():
+        hidden = trainer.model.encoders[0](batches[0][0])
+    assert hidden.dtype == torch.bfloat16
+    # losses are computed from float32 predictions
+    assert trainer._forward(batches[0][0]).dtype == torch.float32
+
+
+def test_train_epoch_with_step_timing(tmp_path, batches):
+    trainer = create_trainer(tmp_path, batches, mixed_precision=False, step_timing=True,
+                             step_timing_file=str(tmp_path / "steps.jsonl"))
+
+    trainer.train_epoch(0)
+    trainer.timer.close()
+
+    with open(trainer.args.step_timing_file) as log_file:
+        records = [json.loads(line) for line in log_file]
+    assert len(records) == len(batches)
+    assert all(record["forward"] > 0 and record["backward"] > 0 and record["loss"] > 0 for record in records)
+
+
+def test_val_epoch_dice_loss_logs_label_losses(tmp_path, batches):
+    trainer = create_trainer(tmp_path, batches, False)
+    trainer.args.loss = "dice"
+    trainer.criterion = dice_loss.DiceLoss(classes=4, eval_regions=False)
+    tags = []
+    add_scalar = trainer.writer.add_scalar
+    trainer.writer.add_scalar = lambda tag, *args, **kwargs: tags.append(tag) or add_scalar(tag, *args, **kwargs)
+
+    trainer.val_epoch(0)
+    trainer.image_logger.close()
+
+    assert {'Validation Dice Loss NCR', 'Validation Dice Loss ED', 'Validation Dice Loss ET'} <= set(tags)
+    assert 'Validation Dice Loss WT' not in tags
+
+
+def test_train_epoch_logs_augmented_batches(tmp_path, batches):
+    trainer = create_trainer(tmp_path, batches, False)
+    trainer.batch_transform = batch_augmentations.BatchMirrorFlip(p=1)
+    trainer.image_logger.close()
+    logged = {}
+    trainer.image_logger.log = lambda batch, seg, title, global_step=None: logged.setdefault(title, batch)
+
+    trainer.train_epoch(0)
+
+    inputs, targets = batches[0]
+    torch.testing.assert_close(logged["Modality patch"], inputs.flip(dims=(2, 3, 4)))
+    torch.testing.assert_close(logged["Segmentation ground truth patch"], targets.float().flip(dims=(1, 2, 3)))